@@ -0,0 +1,209 @@
+# database/connection.py
+# SQLite接続管理（スレッド単位の永続接続）
+
+import sqlite3
+import os
+import threading
+import atexit
+from contextlib import contextmanager
+
+# プロジェクト直下の data/bone_density.db を既定のデータベースとする
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'bone_density.db')
+
+
+class ConnectionManager:
+    """スレッドごとに永続接続を保持する接続マネージャ
+
+    Streamlitのセッションスレッドごとに接続を1本ずつ割り当て、
+    スレッド終了後の接続は破棄せずに次のスレッドへ再利用する。
+    """
+
+    # 接続ごとに一度だけ適用するPRAGMA
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA busy_timeout = 5000",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA cache_size = -20000",
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    # 書き込みコミットがこの回数に達したらWALチェックポイントを実行
+    CHECKPOINT_INTERVAL = 200
+
+    # 再利用待ちとして保持する接続の上限
+    MAX_IDLE_CONNECTIONS = 4
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._owners = {}   # 接続 -> 所有スレッド
+        self._idle = []     # 所有スレッドが終了した接続
+        self._writes_since_checkpoint = 0
+
+        # データ世代番号（キャッシュの有効性判定に使用）
+        self._generation = 0
+        self._data_versions = {}  # 接続 -> 最後に確認した PRAGMA data_version
+
+        # close_all の回数（データベースファイルの作り直しをキャッシュが検出するため）
+        self.epoch = 0
+
+    def _open(self):
+        """新しい接続を作成してPRAGMAを適用"""
+        # 接続の回収・クローズは別スレッドから行うため check_same_thread を無効化
+        # （利用自体は常に所有スレッドのみ）
+        conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _reclaim_dead_threads(self):
+        """終了したスレッドの接続を再利用待ちに戻す（ロック取得済みで呼ぶこと）"""
+        for conn, thread in list(self._owners.items()):
+            if thread.is_alive():
+                continue
+            del self._owners[conn]
+            self._data_versions.pop(conn, None)
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                if len(self._idle) < self.MAX_IDLE_CONNECTIONS:
+                    self._idle.append(conn)
+                else:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(f"接続回収エラー: {e}")
+
+    def get_connection(self):
+        """現在のスレッド用の永続接続を取得"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+
+        with self._lock:
+            self._reclaim_dead_threads()
+            conn = self._idle.pop() if self._idle else self._open()
+            self._owners[conn] = threading.current_thread()
+
+        self._local.conn = conn
+        return conn
+
+    def generation(self):
+        """データ世代番号を取得
+
+        自プロセスの書き込みコミット（note_write）と、他の接続・他プロセスの
+        コミット（PRAGMA data_version の変化）のたびに増加する。
+        キャッシュは取得時の世代番号と比較して有効性を判定する。
+        """
+        conn = self.get_connection()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+
+        with self._lock:
+            # 初めて確認する接続は、以前の変更を見逃さないよう変化ありとみなす
+            if self._data_versions.get(conn) != version:
+                self._data_versions[conn] = version
+                self._generation += 1
+            return self._generation
+
+    def note_write(self):
+        """書き込みコミットを記録し、必要に応じてWALチェックポイントを実行"""
+        with self._lock:
+            self._generation += 1
+            self._writes_since_checkpoint += 1
+            if self._writes_since_checkpoint < self.CHECKPOINT_INTERVAL:
+                return
+            self._writes_since_checkpoint = 0
+
+        self.checkpoint()
+
+    def in_transaction(self):
+        """現在のスレッドが transaction() の内側にあるか"""
+        return getattr(self._local, 'tx_depth', 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        """複数の書き込みを1トランザクション（1回のコミット）にまとめる
+
+        ブロック内で例外が発生した場合はすべての書き込みを取り消す。
+        入れ子で呼ばれた場合は外側のトランザクションに合流する。
+        """
+        conn = self.get_connection()
+        depth = getattr(self._local, 'tx_depth', 0)
+        if depth:
+            self._local.tx_depth = depth + 1
+            try:
+                yield conn
+            finally:
+                self._local.tx_depth = depth
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.tx_depth = 1
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.tx_depth = 0
+
+        self.note_write()
+
+    def checkpoint(self, mode='PASSIVE'):
+        """WALチェックポイントを実行"""
+        try:
+            return self.get_connection().execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        except sqlite3.Error as e:
+            print(f"WALチェックポイントエラー: {e}")
+            return None
+
+    def close_all(self):
+        """全接続をクローズ（終了時・DBリセット時）"""
+        with self._lock:
+            connections = list(self._owners) + self._idle
+            self._owners = {}
+            self._idle = []
+            self._data_versions = {}
+            self._generation += 1
+            self.epoch += 1
+
+        for i, conn in enumerate(connections):
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                if i == 0:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"接続クローズエラー: {e}")
+
+        # 各スレッドの参照は次回 get_connection 時に張り直す
+        self._local = threading.local()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path=None):
+    """データベースファイルごとに共有される接続マネージャを取得"""
+    path = os.path.abspath(db_path or DEFAULT_DB_PATH)
+    with _managers_lock:
+        manager = _managers.get(path)
+        if manager is None:
+            manager = ConnectionManager(path)
+            _managers[path] = manager
+        return manager
+
+
+@atexit.register
+def _close_all_managers():
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        manager.close_all()
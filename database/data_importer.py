@@ -9,13 +9,20 @@ import pandas as pd
 import sqlite3
 import os
 from datetime import datetime
+import sys
 from typing import Dict, List, Optional
 
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+
 class DataImporter:
     """データインポート処理クラス"""
     
     def __init__(self):
-        self.db_path = os.path.join('data', 'bone_density.db')
+        self.manager = get_connection_manager()
+        self.db_path = self.manager.db_path
     
     def parse_csv(self, file_content, encoding='utf-8'):
         """CSVファイルの解析"""
@@ -41,7 +48,8 @@ class DataIntegrator:
     """データ統合処理クラス"""
     
     def __init__(self):
-        self.db_path = os.path.join('data', 'bone_density.db')
+        self.manager = get_connection_manager()
+        self.db_path = self.manager.db_path
     
     def match_existing_patients(self, import_data):
         """既存患者との照合"""
@@ -1,26 +1,57 @@
 # database/db_operations.py (transfer_from削除修正版)
 import sqlite3
+import json
 import pandas as pd
 from datetime import datetime, date, timedelta
+import calendar
 import os
+import sys
+import time
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+from database.migrations import (
+    run_migrations, rebuild_measurement_summary, roll_days_overdue, OVERDUE_ROLL_JOB,
+    sync_patient_search_index
+)
+from database.read_cache import get_read_cache
+from database.vertebral_operations import (
+    VERTEBRAL_IMPORT_COLUMNS, upsert_vertebral_rows, vertebral_rows_from_columns, write_vertebral_rows
+)
+from utils.calculations import BoneDensityCalculator
+from utils.reference_values import get_reference_registry
+from utils.search_keys import normalize_search_key
 
 class BoneDensityDB:
-    def __init__(self):
-        # データベースファイルのパスを設定
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(current_dir)
-        data_dir = os.path.join(project_root, 'data')
+    def __init__(self, db_path=None):
+        # 接続マネージャ（dataディレクトリの作成もここで行う）
+        self.manager = get_connection_manager(db_path)
+        self.db_path = self.manager.db_path
+        print(f"データベース接続成功: {self.db_path}")
         
-        # dataディレクトリが存在しない場合は作成
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
+        # スキーマを最新バージョンに更新
+        run_migrations(self.get_connection())
         
-        self.db_path = os.path.join(data_dir, 'bone_density.db')
-        print(f"データベース接続成功: {self.db_path}")
+        # システム設定キャッシュ: (世代番号, {setting_key: setting_value})
+        self._settings_cache = None
+        
+        # ダッシュボード統計キャッシュ: (世代番号, 集計日, 統計辞書)
+        self._dashboard_cache = None
+        
+        # サイドバー用未受診件数キャッシュ: (有効期限, 集計日, 件数辞書)
+        self._overdue_summary_cache = None
+        
+        # 経過日数・緊急度を今日時点に更新済みと確認した日
+        self._overdue_rolled_on = None
+        
+        # 患者単位の読み取りキャッシュ（再実行をまたいで共有・患者のデータ変更で無効化）
+        self.read_cache = get_read_cache(self.db_path)
 
     def get_connection(self):
-        """データベース接続を取得"""
-        return sqlite3.connect(self.db_path)
+        """現在のスレッドの永続接続を取得"""
+        return self.manager.get_connection()
     
     def execute_query(self, query, params=None):
         """SQLクエリを実行"""
@@ -32,37 +63,69 @@ class BoneDensityDB:
             else:
                 cursor.execute(query)
             
-            if query.strip().upper().startswith('SELECT'):
+            if query.strip().upper().startswith(('SELECT', 'WITH')):
                 return cursor.fetchall()
             else:
-                conn.commit()
+                # transaction() の内側ではコミットを外側に任せる
+                if not self.manager.in_transaction():
+                    conn.commit()
+                    self.manager.note_write()
                 return cursor.lastrowid
-        finally:
-            conn.close()
+        except Exception:
+            # 永続接続に未完了のトランザクションを残さない
+            if conn.in_transaction and not self.manager.in_transaction():
+                conn.rollback()
+            raise
 
-    def search_patients(self, search_term=""):
-        """患者を検索"""
+    def transaction(self):
+        """複数の書き込みを1トランザクションにまとめるコンテキストマネージャ"""
+        return self.manager.transaction()
+
+    def search_patients(self, search_term="", cursor=None, page_size=20):
+        """患者を検索（登録日時の新しい順・キーセットページング）
+
+        cursor: 前ページ最終行の (created_date, patient_id)。None なら先頭ページ。
+        page_size: 1ページの件数。None なら全件。
+        次ページのカーソルは結果の最終行の created_date, patient_id から作る。
+        """
         try:
-            if search_term:
-                query = '''
-                SELECT patient_id, name_kanji, name_kana, patient_code, birth_date, gender
-                FROM patients 
-                WHERE name_kanji LIKE ? OR name_kana LIKE ? OR patient_code LIKE ?
-                ORDER BY created_date DESC
-                '''
-                search_pattern = f"%{search_term}%"
-                results = self.execute_query(query, [search_pattern, search_pattern, search_pattern])
+            search_key = normalize_search_key(search_term)
+            conditions = []
+            params = []
+            
+            if search_key and len(search_key) >= 3:
+                # 3文字以上: trigramインデックスで候補を絞り込む
+                source = 'patients_fts f JOIN patients p ON p.patient_id = f.rowid'
+                conditions.append('patients_fts MATCH ?')
+                params.append('"' + search_key.replace('"', '""') + '"')
+            elif search_key:
+                # 1-2文字: trigramが使えないため正規化済みの検索表を部分一致で走査
+                source = 'patients_fts f JOIN patients p ON p.patient_id = f.rowid'
+                conditions.append("(f.name_kanji LIKE ? ESCAPE '\\' OR f.name_kana LIKE ? ESCAPE '\\' OR f.patient_code LIKE ? ESCAPE '\\')")
+                escaped = search_key.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                params.extend([f"%{escaped}%"] * 3)
             else:
-                query = '''
-                SELECT patient_id, name_kanji, name_kana, patient_code, birth_date, gender
-                FROM patients 
-                ORDER BY created_date DESC
-                LIMIT 20
-                '''
-                results = self.execute_query(query)
+                source = 'patients p'
+            
+            if cursor is not None:
+                # (created_date, patient_id) の降順で、前ページ最終行より後ろ
+                conditions.append('(p.created_date, p.patient_id) < (?, ?)')
+                params.extend([cursor[0], int(cursor[1])])
+            
+            query = f'''
+            SELECT p.patient_id, p.name_kanji, p.name_kana, p.patient_code, p.birth_date, p.gender, p.created_date
+            FROM {source}
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY p.created_date DESC, p.patient_id DESC
+            '''
+            if page_size is not None:
+                query += ' LIMIT ?'
+                params.append(int(page_size))
+            
+            results = self.execute_query(query, params)
             
             if results:
-                df = pd.DataFrame(results, columns=['patient_id', 'name_kanji', 'name_kana', 'patient_code', 'birth_date', 'gender'])
+                df = pd.DataFrame(results, columns=['patient_id', 'name_kanji', 'name_kana', 'patient_code', 'birth_date', 'gender', 'created_date'])
                 return df
             else:
                 return pd.DataFrame()
@@ -72,7 +135,7 @@ class BoneDensityDB:
             return pd.DataFrame()
 
     def add_patient(self, patient_data):
-        """新規患者を登録"""
+        """新規患者を登録（検索キーも同じトランザクションで登録）"""
         try:
             query = '''
             INSERT INTO patients (name_kanji, name_kana, patient_code, birth_date, gender, phone, address, email, notes, created_date)
@@ -90,134 +153,367 @@ class BoneDensityDB:
                 patient_data.get('notes', ''),
                 datetime.now()
             ]
-            return self.execute_query(query, params)
+            with self.transaction() as conn:
+                patient_id = conn.execute(query, params).lastrowid
+                sync_patient_search_index(conn, [patient_id])
+            return patient_id
         except Exception as e:
             print(f"患者登録エラー: {e}")
             return None
 
     def add_measurement(self, measurement_data):
         """測定データを追加（継続受診管理付き）"""
+        return self.save_measurement(measurement_data)
+
+    def save_measurement(self, measurement_data, vertebral_data=None):
+        """測定データと付随する更新を1トランザクションで保存
+
+        測定データ・椎体別データ・次回予定の作成・既存予定の完了をまとめて
+        コミットし、途中で失敗した場合はすべて取り消す。
+
+        Returns:
+            measurement_id（失敗時は None）
+        """
         try:
-            # 測定データを保存
-            query = '''
-            INSERT INTO measurements (patient_id, measurement_date, femur_bmd, lumbar_bmd, 
-                                    femur_yam, lumbar_yam, femur_tscore, lumbar_tscore,
-                                    femur_diagnosis, lumbar_diagnosis, overall_diagnosis, notes, created_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            '''
-            params = [
-                measurement_data['patient_id'],
-                measurement_data['measurement_date'],
-                measurement_data['femur_bmd'],
-                measurement_data['lumbar_bmd'],
-                measurement_data['femur_yam'],
-                measurement_data['lumbar_yam'],
-                measurement_data['femur_tscore'],
-                measurement_data['lumbar_tscore'],
-                measurement_data['femur_diagnosis'],
-                measurement_data['lumbar_diagnosis'],
-                measurement_data['overall_diagnosis'],
-                measurement_data.get('notes', ''),
-                datetime.now()
-            ]
-            
-            measurement_id = self.execute_query(query, params)
-            
-            if measurement_id:
+            with self.transaction() as conn:
+                # 測定データを保存
+                query = '''
+                INSERT INTO measurements (patient_id, measurement_date, femur_bmd, lumbar_bmd, 
+                                        femur_yam, lumbar_yam, femur_tscore, lumbar_tscore,
+                                        femur_diagnosis, lumbar_diagnosis, overall_diagnosis, notes, created_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                '''
+                params = [
+                    measurement_data['patient_id'],
+                    measurement_data['measurement_date'],
+                    measurement_data['femur_bmd'],
+                    measurement_data['lumbar_bmd'],
+                    measurement_data['femur_yam'],
+                    measurement_data['lumbar_yam'],
+                    measurement_data['femur_tscore'],
+                    measurement_data['lumbar_tscore'],
+                    measurement_data['femur_diagnosis'],
+                    measurement_data['lumbar_diagnosis'],
+                    measurement_data['overall_diagnosis'],
+                    measurement_data.get('notes', ''),
+                    datetime.now()
+                ]
+                measurement_id = conn.execute(query, params).lastrowid
+                
+                # 椎体別データを保存
+                if vertebral_data:
+                    write_vertebral_rows(conn, measurement_id, vertebral_data)
+                
                 # 自動で次回予定を作成
-                self.create_next_follow_up(measurement_data['patient_id'], measurement_data['measurement_date'])
+                self._create_next_follow_up(measurement_data['patient_id'], measurement_data['measurement_date'])
                 
                 # 既存の予定を完了に更新
-                self.update_completed_schedules(measurement_data['patient_id'], measurement_data['measurement_date'])
+                self._update_completed_schedules(measurement_data['patient_id'], measurement_data['measurement_date'])
             
+            self.invalidate_overdue_summary()
             return measurement_id
             
         except Exception as e:
             print(f"測定データ追加エラー: {e}")
             return None
 
-    def get_patient_measurements(self, patient_id):
-        """患者の測定履歴を取得"""
+    # 一括登録で1トランザクションにまとめる測定件数
+    BULK_CHUNK_SIZE = 1000
+
+    def add_measurements_bulk(self, measurements_df, chunk_size=None, calculator=None):
+        """測定データを一括登録（他院データ移行など）
+
+        測定データは chunk_size 件ごとのトランザクションで executemany により挿入し、
+        継続受診予定はバッチ全体に対して集合演算で更新する。
+        - 各測定日の前後3日以内の予定を完了に更新
+        - 患者ごとにバッチ内の最新測定から次回予定を1件作成
+          （既存の測定の方が新しい患者には作成しない）
+
+        l1_bmd〜l4_bmd 列があれば、椎体別データも同じトランザクションで
+        YAM・T-score・診断を一括計算して保存する（calculator 省略時は共有の基準値）。
+
+        Returns:
+            {'inserted': 登録件数, 'vertebral_inserted': 椎体別データ件数,
+             'completed_schedules': 完了更新件数, 'created_follow_ups': 次回予定作成件数}
+            （失敗時は None）
+        """
+        columns = ['patient_id', 'measurement_date', 'femur_bmd', 'lumbar_bmd',
+                   'femur_yam', 'lumbar_yam', 'femur_tscore', 'lumbar_tscore',
+                   'femur_diagnosis', 'lumbar_diagnosis', 'overall_diagnosis', 'notes']
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        summary = {'inserted': 0, 'vertebral_inserted': 0, 'completed_schedules': 0, 'created_follow_ups': 0}
+        
         try:
+            if measurements_df is None or measurements_df.empty:
+                return summary
+            
+            df = measurements_df.reindex(columns=columns)
+            df['patient_id'] = df['patient_id'].astype(int)
+            vertebral_columns = measurements_df.reindex(columns=list(VERTEBRAL_IMPORT_COLUMNS))
+            has_vertebral = vertebral_columns.notna().to_numpy().any()
+            if has_vertebral:
+                calculator = calculator or BoneDensityCalculator(get_reference_registry(self.db_path))
+                genders = self._patient_genders(df['patient_id'])
+            df['measurement_date'] = pd.to_datetime(df['measurement_date']).dt.strftime('%Y-%m-%d')
+            df['notes'] = df['notes'].fillna('')
+            # NaN は NULL として保存する
+            df = df.astype(object).where(df.notna(), None)
+            created_date = datetime.now()
+            rows = [row + (created_date,) for row in df.itertuples(index=False, name=None)]
+            
             query = '''
-            SELECT measurement_id, measurement_date, femur_bmd, lumbar_bmd,
-                   femur_yam, lumbar_yam, femur_tscore, lumbar_tscore,
-                   femur_diagnosis, lumbar_diagnosis, overall_diagnosis, notes
-            FROM measurements 
-            WHERE patient_id = ?
-            ORDER BY measurement_date DESC
+            INSERT INTO measurements (measurement_id, patient_id, measurement_date, femur_bmd, lumbar_bmd, 
+                                    femur_yam, lumbar_yam, femur_tscore, lumbar_tscore,
+                                    femur_diagnosis, lumbar_diagnosis, overall_diagnosis, notes, created_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             '''
-            results = self.execute_query(query, [patient_id])
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                with self.transaction() as conn:
+                    # 書き込みロック中に測定IDを採番し、椎体別データと対応付ける
+                    # （AUTOINCREMENT と同じく削除済みのIDは再利用しない）
+                    first_id = conn.execute('''
+                        SELECT MAX(COALESCE(MAX(measurement_id), 0),
+                                   COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'measurements'), 0)) + 1
+                        FROM measurements
+                    ''').fetchone()[0]
+                    measurement_ids = range(first_id, first_id + len(chunk))
+                    conn.executemany(query, [(measurement_id,) + row for measurement_id, row in zip(measurement_ids, chunk)])
+                    
+                    if has_vertebral:
+                        vertebral_rows = vertebral_rows_from_columns(
+                            measurement_ids, vertebral_columns.iloc[start:start + chunk_size],
+                            genders[start:start + chunk_size], calculator
+                        )
+                        upsert_vertebral_rows(conn, vertebral_rows)
+                        summary['vertebral_inserted'] += len(vertebral_rows)
+                summary['inserted'] += len(chunk)
+            
+            # バッチ全体の (患者ID, 測定日) をJSON配列で渡して継続受診予定を更新
+            batch = json.dumps(df[['patient_id', 'measurement_date']].drop_duplicates().values.tolist())
+            months = self.get_setting_int('default_follow_up_months', 6)
+            
+            with self.transaction() as conn:
+                conn.execute('''
+                    WITH batch AS (
+                        SELECT json_extract(value, '$[0]') AS patient_id,
+                               json_extract(value, '$[1]') AS measurement_date
+                        FROM json_each(?)
+                    )
+                    UPDATE follow_up_schedule
+                    SET status = '済',
+                        completed_date = (
+                            SELECT MIN(b.measurement_date) FROM batch b
+                            WHERE b.patient_id = follow_up_schedule.patient_id
+                              AND b.measurement_date BETWEEN date(follow_up_schedule.scheduled_date, '-3 days')
+                                                         AND date(follow_up_schedule.scheduled_date, '+3 days')
+                        ),
+                        days_overdue = 0
+                    WHERE status = '予定'
+                      AND patient_id IN (SELECT patient_id FROM batch)
+                      AND EXISTS (
+                          SELECT 1 FROM batch b
+                          WHERE b.patient_id = follow_up_schedule.patient_id
+                            AND b.measurement_date BETWEEN date(follow_up_schedule.scheduled_date, '-3 days')
+                                                       AND date(follow_up_schedule.scheduled_date, '+3 days')
+                      )
+                ''', [batch])
+                # WITH 句付きの文は cursor.rowcount が -1 になるため changes() で件数を取得
+                completed = conn.execute("SELECT changes()").fetchone()[0]
+                
+                # 次回予定（6ヶ月後を months * 30 日で近似。create_next_follow_up と同じ計算）
+                conn.execute('''
+                    WITH batch AS (
+                        SELECT json_extract(value, '$[0]') AS patient_id,
+                               json_extract(value, '$[1]') AS measurement_date
+                        FROM json_each(?)
+                    ),
+                    latest AS (
+                        SELECT patient_id, MAX(measurement_date) AS measurement_date
+                        FROM batch
+                        GROUP BY patient_id
+                    )
+                    INSERT INTO follow_up_schedule (patient_id, scheduled_date, status, created_date)
+                    SELECT l.patient_id, date(l.measurement_date, '+' || ? || ' days'), '予定', ?
+                    FROM latest l
+                    JOIN patient_measurement_summary s ON s.patient_id = l.patient_id
+                    WHERE l.measurement_date >= s.last_measurement_date
+                ''', [batch, months * 30, datetime.now()])
+                created = conn.execute("SELECT changes()").fetchone()[0]
+            
+            summary['completed_schedules'] = completed
+            summary['created_follow_ups'] = created
+            self.invalidate_overdue_summary()
+            return summary
             
-            if results:
-                df = pd.DataFrame(results, columns=[
-                    'measurement_id', 'measurement_date', 'femur_bmd', 'lumbar_bmd',
-                    'femur_yam', 'lumbar_yam', 'femur_tscore', 'lumbar_tscore',
-                    'femur_diagnosis', 'lumbar_diagnosis', 'overall_diagnosis', 'notes'
-                ])
-                return df
-            else:
-                return pd.DataFrame()
+        except Exception as e:
+            print(f"測定データ一括登録エラー: {e}（登録済み: {summary['inserted']}件）")
+            return None
+
+    def _patient_genders(self, patient_ids):
+        """患者IDの並びに対応する性別のリスト（未登録の患者は None）"""
+        rows = self.get_connection().execute('''
+            SELECT patient_id, gender FROM patients
+            WHERE patient_id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(sorted(set(int(pid) for pid in patient_ids))),)).fetchall()
+        genders = dict(rows)
+        return [genders.get(int(pid)) for pid in patient_ids]
+
+    def get_patient_measurements(self, patient_id):
+        """患者の測定履歴を取得（患者のデータが変わるまで読み取りキャッシュから返す）"""
+        try:
+            return self.read_cache.get_or_load(
+                'patient_measurements', (patient_id,),
+                lambda: self._load_patient_measurements(patient_id), patient_id=patient_id
+            )
         except Exception as e:
             print(f"測定履歴取得エラー: {e}")
             return pd.DataFrame()
 
+    def _load_patient_measurements(self, patient_id):
+        """患者の測定履歴を読み込み"""
+        query = '''
+        SELECT measurement_id, measurement_date, femur_bmd, lumbar_bmd,
+               femur_yam, lumbar_yam, femur_tscore, lumbar_tscore,
+               femur_diagnosis, lumbar_diagnosis, overall_diagnosis, notes
+        FROM measurements 
+        WHERE patient_id = ?
+        ORDER BY measurement_date DESC
+        '''
+        results = self.execute_query(query, [patient_id])
+        
+        if results:
+            df = pd.DataFrame(results, columns=[
+                'measurement_id', 'measurement_date', 'femur_bmd', 'lumbar_bmd',
+                'femur_yam', 'lumbar_yam', 'femur_tscore', 'lumbar_tscore',
+                'femur_diagnosis', 'lumbar_diagnosis', 'overall_diagnosis', 'notes'
+            ])
+            return df
+        else:
+            return pd.DataFrame()
+
+    def get_patient_summary(self, patient_id):
+        """患者別測定サマリー（最新測定・次回保険適用日・測定回数）を取得
+
+        測定がない患者は None を返す。保険適用チェック・前回測定の表示で
+        同じ患者について何度も呼ばれるため、読み取りキャッシュから返す。
+        """
+        return self.read_cache.get_or_load(
+            'patient_summary', (patient_id,),
+            lambda: self._load_patient_summary(patient_id), patient_id=patient_id
+        )
+
+    def _load_patient_summary(self, patient_id):
+        """患者別測定サマリーを読み込み"""
+        query = '''
+        SELECT patient_id, measurement_count, last_measurement_id, last_measurement_date,
+               next_insurance_date, last_femur_bmd, last_lumbar_bmd,
+               last_femur_yam, last_lumbar_yam, last_femur_tscore, last_lumbar_tscore,
+               last_overall_diagnosis
+        FROM patient_measurement_summary
+        WHERE patient_id = ?
+        '''
+        results = self.execute_query(query, [patient_id])
+        
+        if not results:
+            return None
+        
+        columns = ['patient_id', 'measurement_count', 'last_measurement_id', 'last_measurement_date',
+                   'next_insurance_date', 'last_femur_bmd', 'last_lumbar_bmd',
+                   'last_femur_yam', 'last_lumbar_yam', 'last_femur_tscore', 'last_lumbar_tscore',
+                   'last_overall_diagnosis']
+        return dict(zip(columns, results[0]))
+
+    def rebuild_measurement_summary(self):
+        """患者別測定サマリーを測定データから再構築（通常はトリガーで自動更新）"""
+        conn = self.get_connection()
+        try:
+            with conn:
+                count = rebuild_measurement_summary(conn)
+            self.manager.note_write()
+            # トリガーを経由しない再構築のため、読み取りキャッシュも作り直す
+            self.read_cache.clear()
+            return count
+        except Exception as e:
+            print(f"測定サマリー再構築エラー: {e}")
+            return None
+
+    def sync_patient_search_index(self):
+        """全患者の検索キーを照合し、アプリ外で登録・変更された患者の分を書き直す"""
+        try:
+            with self.transaction() as conn:
+                return sync_patient_search_index(conn)
+        except Exception as e:
+            print(f"患者検索インデックス更新エラー: {e}")
+            return None
+
     # ===== 継続受診管理機能 =====
     
     def create_next_follow_up(self, patient_id, measurement_date):
         """次回フォローアップ予定を自動作成"""
         try:
-            # 標準フォローアップ間隔を取得（デフォルト6ヶ月）
-            months = self.get_system_setting('default_follow_up_months', 6)
-            
-            # 次回予定日を計算（6ヶ月後）
-            if isinstance(measurement_date, str):
-                measurement_date = datetime.strptime(measurement_date, '%Y-%m-%d').date()
-            elif isinstance(measurement_date, datetime):
-                measurement_date = measurement_date.date()
-            
-            # 6ヶ月後の計算（182日後で近似）
-            next_date = measurement_date + timedelta(days=int(months) * 30)
-            
-            query = '''
-            INSERT INTO follow_up_schedule (patient_id, scheduled_date, status, created_date)
-            VALUES (?, ?, ?, ?)
-            '''
-            params = [patient_id, next_date, '予定', datetime.now()]
-            
-            return self.execute_query(query, params)
+            result = self._create_next_follow_up(patient_id, measurement_date)
+            self.invalidate_overdue_summary()
+            return result
             
         except Exception as e:
             print(f"次回予定作成エラー: {e}")
             return None
 
+    def _create_next_follow_up(self, patient_id, measurement_date):
+        """次回フォローアップ予定を作成（エラーは呼び出し元へ送出）"""
+        # 標準フォローアップ間隔を取得（デフォルト6ヶ月）
+        months = self.get_setting_int('default_follow_up_months', 6)
+        
+        # 次回予定日を計算（6ヶ月後）
+        if isinstance(measurement_date, str):
+            measurement_date = datetime.strptime(measurement_date, '%Y-%m-%d').date()
+        elif isinstance(measurement_date, datetime):
+            measurement_date = measurement_date.date()
+        
+        # 6ヶ月後の計算（182日後で近似）
+        next_date = measurement_date + timedelta(days=months * 30)
+        
+        query = '''
+        INSERT INTO follow_up_schedule (patient_id, scheduled_date, status, created_date)
+        VALUES (?, ?, ?, ?)
+        '''
+        params = [patient_id, next_date, '予定', datetime.now()]
+        
+        return self.execute_query(query, params)
+
     def update_completed_schedules(self, patient_id, measurement_date):
         """測定実施時に該当する予定を完了に更新"""
         try:
-            # 測定日前後3日以内の予定を完了に更新
-            if isinstance(measurement_date, str):
-                measurement_date = datetime.strptime(measurement_date, '%Y-%m-%d').date()
-            elif isinstance(measurement_date, datetime):
-                measurement_date = measurement_date.date()
-            
-            start_date = measurement_date - timedelta(days=3)
-            end_date = measurement_date + timedelta(days=3)
-            
-            query = '''
-            UPDATE follow_up_schedule 
-            SET status = '済', completed_date = ?, days_overdue = 0
-            WHERE patient_id = ? 
-            AND scheduled_date BETWEEN ? AND ?
-            AND status = '予定'
-            '''
-            params = [measurement_date, patient_id, start_date, end_date]
-            
-            return self.execute_query(query, params)
+            result = self._update_completed_schedules(patient_id, measurement_date)
+            self.invalidate_overdue_summary()
+            return result
             
         except Exception as e:
             print(f"予定完了更新エラー: {e}")
             return None
 
+    def _update_completed_schedules(self, patient_id, measurement_date):
+        """測定日前後3日以内の予定を完了に更新（エラーは呼び出し元へ送出）"""
+        if isinstance(measurement_date, str):
+            measurement_date = datetime.strptime(measurement_date, '%Y-%m-%d').date()
+        elif isinstance(measurement_date, datetime):
+            measurement_date = measurement_date.date()
+        
+        start_date = measurement_date - timedelta(days=3)
+        end_date = measurement_date + timedelta(days=3)
+        
+        query = '''
+        UPDATE follow_up_schedule 
+        SET status = '済', completed_date = ?, days_overdue = 0
+        WHERE patient_id = ? 
+        AND scheduled_date BETWEEN ? AND ?
+        AND status = '予定'
+        '''
+        params = [measurement_date, patient_id, start_date, end_date]
+        
+        return self.execute_query(query, params)
+
     def get_monthly_schedule(self, year, month):
         """月別の継続受診予定を取得"""
         try:
@@ -252,37 +548,82 @@ class BoneDensityDB:
             print(f"月別予定取得エラー: {e}")
             return pd.DataFrame()
 
+    def get_calendar_month_summary(self, year, month, max_names=2):
+        """カレンダー表示用に月内の日別件数と患者名（先頭 max_names 名）を1クエリで集計
+
+        Returns:
+            日付順のDataFrame（day, scheduled_date, total, completed, pending, overdue,
+            pending_names, completed_names）。氏名列は患者名のリスト。
+        """
+        columns = ['day', 'scheduled_date', 'total', 'completed', 'pending', 'overdue',
+                   'pending_names', 'completed_names']
+        try:
+            start_date = date(year, month, 1)
+            end_date = date(year, month, calendar.monthrange(year, month)[1])
+            
+            query = '''
+            WITH day_rows AS (
+                SELECT f.scheduled_date, f.status, p.name_kanji,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY f.scheduled_date, f.status
+                           ORDER BY f.schedule_id
+                       ) AS rn
+                FROM follow_up_schedule f
+                JOIN patients p ON f.patient_id = p.patient_id
+                WHERE f.scheduled_date BETWEEN ? AND ?
+            )
+            SELECT CAST(strftime('%d', scheduled_date) AS INTEGER) AS day,
+                   scheduled_date,
+                   COUNT(*) AS total,
+                   SUM(status = '済') AS completed,
+                   SUM(status = '予定') AS pending,
+                   CASE WHEN scheduled_date < ? THEN SUM(status = '予定') ELSE 0 END AS overdue,
+                   group_concat(CASE WHEN status = '予定' AND rn <= ? THEN name_kanji END, char(31)),
+                   group_concat(CASE WHEN status = '済' AND rn <= ? THEN name_kanji END, char(31))
+            FROM day_rows
+            GROUP BY scheduled_date
+            ORDER BY scheduled_date
+            '''
+            results = self.execute_query(query, [start_date, end_date, date.today(), max_names, max_names])
+            
+            df = pd.DataFrame(results, columns=columns)
+            for col in ['pending_names', 'completed_names']:
+                df[col] = [names.split('\x1f') if isinstance(names, str) else [] for names in df[col]]
+            return df
+                
+        except Exception as e:
+            print(f"カレンダー集計取得エラー: {e}")
+            return pd.DataFrame(columns=columns)
+
     def get_overdue_patients(self):
         """未受診患者を優先度別に取得"""
         try:
-            today = date.today()
+            self._ensure_days_overdue_current()
             
             # 設定値を取得
-            urgent_days = int(self.get_system_setting('urgent_overdue_days', 14))
-            warning_days = int(self.get_system_setting('warning_overdue_days', 7))
-            attention_days = int(self.get_system_setting('attention_overdue_days', 3))
+            attention_days = self.get_setting_int('attention_overdue_days', 3)
             
             query = '''
             SELECT f.schedule_id, f.patient_id, f.scheduled_date, f.status,
-                   (julianday(?) - julianday(f.scheduled_date)) as days_overdue,
+                   f.days_overdue, f.urgency_tier,
                    p.name_kanji, p.name_kana, p.birth_date, p.gender
             FROM follow_up_schedule f
             JOIN patients p ON f.patient_id = p.patient_id
-            WHERE f.status = '予定' AND f.scheduled_date < ?
-            ORDER BY days_overdue DESC
+            WHERE f.status = '予定' AND f.urgency_tier IS NOT NULL
+            ORDER BY f.scheduled_date ASC
             '''
-            results = self.execute_query(query, [today, today])
+            results = self.execute_query(query)
             
             if results:
                 df = pd.DataFrame(results, columns=[
                     'schedule_id', 'patient_id', 'scheduled_date', 'status', 'days_overdue',
-                    'name_kanji', 'name_kana', 'birth_date', 'gender'
+                    'urgency_tier', 'name_kanji', 'name_kana', 'birth_date', 'gender'
                 ])
                 
-                # 優先度別に分類
-                urgent = df[df['days_overdue'] >= urgent_days]
-                warning = df[(df['days_overdue'] >= warning_days) & (df['days_overdue'] < urgent_days)]
-                attention = df[(df['days_overdue'] >= attention_days) & (df['days_overdue'] < warning_days)]
+                # 優先度別に分類（保存済みの緊急度を使用）
+                urgent = df[df['urgency_tier'] == 'urgent']
+                warning = df[df['urgency_tier'] == 'warning']
+                attention = df[(df['urgency_tier'] == 'attention') & (df['days_overdue'] >= attention_days)]
                 
                 return {
                     'urgent': urgent,
@@ -307,42 +648,263 @@ class BoneDensityDB:
                 'all': pd.DataFrame()
             }
 
-    def check_insurance_eligibility(self, patient_id, planned_date):
-        """保険適用の可否をチェック"""
+    def _ensure_days_overdue_current(self):
+        """経過日数・緊急度が今日時点に更新済みか確認し、未更新なら更新する
+
+        確認はこのインスタンスで1日1回のみ行い、更新済みかどうかは
+        job_watermarks の基準日（ウォーターマーク）で判定する。
+        """
+        today = date.today()
+        if self._overdue_rolled_on == today:
+            return
+        
+        results = self.execute_query(
+            "SELECT watermark FROM job_watermarks WHERE job_name = ?", [OVERDUE_ROLL_JOB]
+        )
+        if not results or results[0][0] != today.isoformat():
+            if self.roll_days_overdue(today) is None:
+                return
+        self._overdue_rolled_on = today
+
+    def get_overdue_worklist(self, limit=None, offset=0):
+        """未受診者ワークリストを1クエリで取得（予定日の古い順）
+
+        予定のみの部分インデックスを予定日順に走査し、保存済みの経過日数・緊急度
+        （urgent / warning / attention）に連絡済みフラグ・連絡日・年齢を付与する。
+        注意のしきい値未満の経過日数も attention として扱う（画面表示と同じ）。
+        緊急度が未設定の予定は get_overdue_worklist_counts と同じく含めない。
+
+        Args:
+            limit: 取得件数（None なら全件）
+            offset: 読み飛ばす件数
+        """
+        columns = ['schedule_id', 'patient_id', 'scheduled_date', 'days_overdue', 'urgency_tier',
+                   'contacted', 'contact_date', 'name_kanji', 'name_kana', 'birth_date', 'gender', 'age']
+        try:
+            today = date.today()
+            self._ensure_days_overdue_current()
+            
+            query = '''
+            SELECT f.schedule_id, f.patient_id, f.scheduled_date,
+                   f.days_overdue, f.urgency_tier,
+                   COALESCE(f.contact_needed, 0) = 1 AS contacted,
+                   f.contact_date,
+                   p.name_kanji, p.name_kana, p.birth_date, p.gender,
+                   CASE WHEN date(p.birth_date) IS NOT NULL THEN
+                       CAST(strftime('%Y', :today) AS INTEGER) - CAST(strftime('%Y', p.birth_date) AS INTEGER)
+                       - (strftime('%m-%d', :today) < strftime('%m-%d', p.birth_date))
+                   END AS age
+            FROM follow_up_schedule f
+            JOIN patients p ON f.patient_id = p.patient_id
+            WHERE f.status = '予定' AND f.scheduled_date < :today
+              AND f.urgency_tier IS NOT NULL
+            ORDER BY f.scheduled_date ASC, f.schedule_id ASC
+            LIMIT :limit OFFSET :offset
+            '''
+            params = {
+                'today': today,
+                'limit': -1 if limit is None else int(limit),
+                'offset': int(offset)
+            }
+            results = self.execute_query(query, params)
+            
+            df = pd.DataFrame(results, columns=columns)
+            df['contacted'] = df['contacted'].astype(bool)
+            return df
+                
+        except Exception as e:
+            print(f"未受診ワークリスト取得エラー: {e}")
+            return pd.DataFrame(columns=columns)
+
+    def get_overdue_worklist_counts(self):
+        """未受診者ワークリストの件数（合計・連絡済み・緊急度別）を1クエリで集計"""
+        counts = {'total': 0, 'contacted': 0, 'uncontacted': 0,
+                  'urgent': 0, 'warning': 0, 'attention': 0}
         try:
-            # 最新の測定データを取得
+            self._ensure_days_overdue_current()
+            
+            # 緊急度の部分インデックスだけで集計
             query = '''
-            SELECT measurement_date
-            FROM measurements
-            WHERE patient_id = ?
-            ORDER BY measurement_date DESC
-            LIMIT 1
+            SELECT urgency_tier, COUNT(*), SUM(COALESCE(contact_needed, 0) = 1)
+            FROM follow_up_schedule
+            WHERE status = '予定' AND urgency_tier IS NOT NULL
+            GROUP BY urgency_tier
             '''
-            results = self.execute_query(query, [patient_id])
+            for tier, count, contacted in self.execute_query(query):
+                counts[tier] = count
+                counts['total'] += count
+                counts['contacted'] += contacted or 0
+            counts['uncontacted'] = counts['total'] - counts['contacted']
+            return counts
+                
+        except Exception as e:
+            print(f"未受診件数集計エラー: {e}")
+            return counts
+
+    def check_insurance_eligibility(self, patient_id, planned_date):
+        """保険適用の可否をチェック"""
+        try:
+            # 患者別測定サマリーから最新測定日・次回保険適用日を取得
+            summary = self.get_patient_summary(patient_id)
             
-            if not results:
+            if summary is None:
                 return True, "初回測定のため保険適用"
             
-            last_measurement_date = datetime.strptime(results[0][0], '%Y-%m-%d').date()
+            next_insurance_date = datetime.strptime(summary['next_insurance_date'], '%Y-%m-%d').date()
             
             if isinstance(planned_date, str):
                 planned_date = datetime.strptime(planned_date, '%Y-%m-%d').date()
             elif isinstance(planned_date, datetime):
                 planned_date = planned_date.date()
             
-            days_since_last = (planned_date - last_measurement_date).days
-            min_interval = int(self.get_system_setting('insurance_interval_days', 120))
-            
-            if days_since_last >= min_interval:
+            if planned_date >= next_insurance_date:
                 return True, "保険適用OK"
             else:
-                shortage = min_interval - days_since_last
+                shortage = (next_insurance_date - planned_date).days
                 return False, f"あと{shortage}日で保険適用"
                 
         except Exception as e:
             print(f"保険適用チェックエラー: {e}")
             return False, "チェックエラー"
 
+    def check_insurance_eligibility_bulk(self, patient_ids, planned_dates):
+        """複数の患者・予定日の保険適用可否を1クエリで一括チェック
+
+        Returns:
+            入力順のDataFrame（patient_id, planned_date, last_measurement_date,
+            days_since_last, eligible, shortage_days, message）
+        """
+        columns = ['patient_id', 'planned_date', 'last_measurement_date',
+                   'days_since_last', 'eligible', 'shortage_days', 'message']
+        try:
+            patient_ids = [int(pid) for pid in patient_ids]
+            planned_dates = pd.to_datetime(pd.Series(list(planned_dates))).dt.strftime('%Y-%m-%d').tolist()
+
+            if not patient_ids:
+                return pd.DataFrame(columns=columns)
+
+            min_interval = self.get_setting_int('insurance_interval_days', 120)
+
+            # 予定一覧をJSON配列で渡し、患者別測定サマリーの最新測定日と突き合わせる
+            query = '''
+            WITH req AS (
+                SELECT CAST(key AS INTEGER) AS row_no,
+                       json_extract(value, '$[0]') AS patient_id,
+                       json_extract(value, '$[1]') AS planned_date
+                FROM json_each(?)
+            ),
+            elapsed AS (
+                SELECT r.row_no, r.patient_id, r.planned_date, s.last_measurement_date,
+                       CAST(julianday(r.planned_date) - julianday(s.last_measurement_date) AS INTEGER) AS days_since_last
+                FROM req r
+                LEFT JOIN patient_measurement_summary s ON s.patient_id = r.patient_id
+            )
+            SELECT patient_id, planned_date, last_measurement_date, days_since_last,
+                   CASE WHEN last_measurement_date IS NULL OR days_since_last >= ? THEN 1 ELSE 0 END AS eligible,
+                   CASE WHEN last_measurement_date IS NULL OR days_since_last >= ? THEN 0
+                        ELSE ? - days_since_last END AS shortage_days
+            FROM elapsed
+            ORDER BY row_no
+            '''
+            requests = json.dumps([[pid, planned] for pid, planned in zip(patient_ids, planned_dates)])
+            results = self.execute_query(query, [requests, min_interval, min_interval, min_interval])
+
+            df = pd.DataFrame(results, columns=columns[:-1])
+            df['eligible'] = df['eligible'].astype(bool)
+
+            # メッセージは単体チェック（check_insurance_eligibility）と同じ文言
+            df['message'] = '保険適用OK'
+            df.loc[df['last_measurement_date'].isna(), 'message'] = '初回測定のため保険適用'
+            not_eligible = ~df['eligible']
+            df.loc[not_eligible, 'message'] = 'あと' + df.loc[not_eligible, 'shortage_days'].astype(str) + '日で保険適用'
+            return df
+
+        except Exception as e:
+            print(f"保険適用一括チェックエラー: {e}")
+            return pd.DataFrame(columns=columns)
+
+    # サイドバー用未受診件数キャッシュの有効期間（秒）
+    OVERDUE_SUMMARY_TTL = 60
+
+    def get_overdue_summary(self):
+        """サイドバー表示用の未受診件数（合計・緊急・警告・注意）を取得
+
+        結果は全セッション共通で OVERDUE_SUMMARY_TTL 秒キャッシュし、予定を
+        更新する操作（予定の完了・連絡済み・測定登録）で明示的に破棄する。
+        他プロセスからの更新は有効期限切れで反映される。
+        """
+        today = date.today()
+        cached = self._overdue_summary_cache
+        if cached is not None and cached[0] > time.monotonic() and cached[1] == today:
+            return cached[2]
+        
+        summary = {'total': 0, 'urgent': 0, 'warning': 0, 'attention': 0}
+        try:
+            self._ensure_days_overdue_current()
+            attention_days = self.get_setting_int('attention_overdue_days', 3)
+            
+            # 緊急度・経過日数の部分インデックスの範囲検索で集計
+            query = '''
+            SELECT COUNT(*),
+                   (SELECT COUNT(*) FROM follow_up_schedule
+                    WHERE status = '予定' AND urgency_tier = 'urgent'),
+                   (SELECT COUNT(*) FROM follow_up_schedule
+                    WHERE status = '予定' AND urgency_tier = 'warning'),
+                   (SELECT COUNT(*) FROM follow_up_schedule
+                    WHERE status = '予定' AND urgency_tier = 'attention' AND days_overdue >= :attention)
+            FROM follow_up_schedule
+            WHERE status = '予定' AND urgency_tier IS NOT NULL
+            '''
+            results = self.execute_query(query, {'attention': attention_days})
+            
+            total, urgent, warning, attention = [value or 0 for value in results[0]]
+            summary.update({'total': total, 'urgent': urgent, 'warning': warning, 'attention': attention})
+            self._overdue_summary_cache = (time.monotonic() + self.OVERDUE_SUMMARY_TTL, today, summary)
+            
+        except Exception as e:
+            print(f"未受診件数取得エラー: {e}")
+        
+        return summary
+
+    def invalidate_overdue_summary(self):
+        """未受診件数キャッシュを破棄（継続受診予定の更新後に呼ぶ）"""
+        self._overdue_summary_cache = None
+
+    def mark_schedule_completed(self, schedule_id, completed_date=None):
+        """予定を完了に更新"""
+        try:
+            self.execute_query(
+                "UPDATE follow_up_schedule SET status = '済', completed_date = ? WHERE schedule_id = ?",
+                [completed_date or date.today(), schedule_id]
+            )
+            self.invalidate_overdue_summary()
+            return True
+            
+        except Exception as e:
+            print(f"予定完了更新エラー: {e}")
+            return False
+
+    def mark_schedule_contacted(self, schedule_id, contact_date=None):
+        """予定を連絡済みに更新（連絡日を記録し、備考に連絡済みの記録を追記）"""
+        try:
+            note = f"連絡済み - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            self.execute_query('''
+                UPDATE follow_up_schedule 
+                SET contact_needed = 1, 
+                    contact_date = ?, 
+                    notes = COALESCE(notes, '') || CASE 
+                        WHEN notes IS NULL OR notes = '' THEN ?
+                        ELSE char(10) || ?
+                    END
+                WHERE schedule_id = ?
+            ''', [contact_date or date.today(), note, note, schedule_id])
+            self.invalidate_overdue_summary()
+            return True
+            
+        except Exception as e:
+            print(f"連絡済み更新エラー: {e}")
+            return False
+
     def record_contact(self, schedule_id, contact_date, method, result, notes=""):
         """患者への連絡を記録"""
         try:
@@ -360,21 +922,56 @@ class BoneDensityDB:
             print(f"連絡記録エラー: {e}")
             return None
 
+    def roll_days_overdue(self, as_of=None):
+        """予定の経過日数（days_overdue）と緊急度（urgency_tier）を基準日時点の値に更新
+
+        夜間ジョブ、または当日最初の未受診一覧の取得時に実行する。
+        予定日を過ぎた予定は経過日数、それ以外の予定は0にする。
+        値が変わる行だけを更新し、更新件数を返す（失敗時は None）。
+        """
+        try:
+            as_of = as_of or date.today()
+            with self.transaction() as conn:
+                updated = roll_days_overdue(conn, as_of)
+            
+            self._overdue_rolled_on = as_of if as_of == date.today() else None
+            self.invalidate_overdue_summary()
+            return updated
+            
+        except Exception as e:
+            print(f"経過日数更新エラー: {e}")
+            return None
+
+    def get_system_settings(self):
+        """システム設定を辞書で取得（世代番号が変わるまでキャッシュ）"""
+        generation = self.manager.generation()
+        cached = self._settings_cache
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        
+        results = self.execute_query('SELECT setting_key, setting_value FROM system_settings')
+        settings = {key: value for key, value in results}
+        self._settings_cache = (generation, settings)
+        return settings
+
     def get_system_setting(self, key, default=None):
         """システム設定値を取得"""
         try:
-            query = 'SELECT setting_value FROM system_settings WHERE setting_key = ?'
-            results = self.execute_query(query, [key])
-            
-            if results:
-                return results[0][0]
-            else:
-                return default
+            return self.get_system_settings().get(key, default)
                 
         except Exception as e:
             print(f"システム設定取得エラー: {e}")
             return default
 
+    def get_setting_int(self, key, default):
+        """整数のシステム設定値を取得（変換できない場合はデフォルト値）"""
+        value = self.get_system_setting(key, default)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            print(f"システム設定値が不正です: {key}={value!r}")
+            return int(default)
+
     def update_system_setting(self, key, value, description=""):
         """システム設定を更新"""
         try:
@@ -384,12 +981,79 @@ class BoneDensityDB:
             '''
             params = [key, value, description]
             
-            return self.execute_query(query, params)
+            result = self.execute_query(query, params)
+            
+            # 設定キャッシュを破棄（次回読み込み時に再取得）
+            self._settings_cache = None
+            return result
             
         except Exception as e:
             print(f"システム設定更新エラー: {e}")
             return None
 
+    def get_dashboard_stats(self, recent_days=30):
+        """経過確認ダッシュボード用の統計を1クエリで取得（次の書き込みまでキャッシュ）
+
+        診断別内訳は各患者の最新測定の総合診断で集計する。
+        """
+        generation = self.manager.generation()
+        today = date.today()
+        cached = self._dashboard_cache
+        if cached is not None and cached[0] == generation and cached[1] == today:
+            return cached[2]
+        
+        try:
+            since = today - timedelta(days=recent_days)
+            query = '''
+            WITH latest AS (
+                SELECT overall_diagnosis,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY patient_id
+                           ORDER BY measurement_date DESC, measurement_id DESC
+                       ) AS rn
+                FROM measurements
+            )
+            SELECT 'total', NULL,
+                   (SELECT COUNT(*) FROM patients),
+                   (SELECT COUNT(*) FROM measurements),
+                   (SELECT COUNT(DISTINCT patient_id) FROM measurements),
+                   (SELECT COUNT(*) FROM measurements WHERE measurement_date >= ?),
+                   (SELECT COUNT(DISTINCT patient_id) FROM measurements WHERE measurement_date >= ?),
+                   (SELECT COUNT(*) FROM patients WHERE created_date >= ?)
+            UNION ALL
+            SELECT 'diagnosis', COALESCE(overall_diagnosis, '未判定'), COUNT(*),
+                   NULL, NULL, NULL, NULL, NULL
+            FROM latest
+            WHERE rn = 1
+            GROUP BY COALESCE(overall_diagnosis, '未判定')
+            '''
+            results = self.execute_query(query, [since, since, since])
+            
+            stats = {
+                'total_patients': 0,
+                'total_measurements': 0,
+                'measured_patients': 0,
+                'recent_days': recent_days,
+                'recent_measurements': 0,
+                'recent_measured_patients': 0,
+                'recent_new_patients': 0,
+                'diagnosis_counts': {}
+            }
+            for kind, diagnosis, *values in results:
+                if kind == 'total':
+                    (stats['total_patients'], stats['total_measurements'], stats['measured_patients'],
+                     stats['recent_measurements'], stats['recent_measured_patients'],
+                     stats['recent_new_patients']) = values
+                else:
+                    stats['diagnosis_counts'][diagnosis] = values[0]
+            
+            self._dashboard_cache = (generation, today, stats)
+            return stats
+            
+        except Exception as e:
+            print(f"ダッシュボード統計取得エラー: {e}")
+            return None
+
     def get_continuation_rate_stats(self, year):
         """年間継続受診率統計を取得"""
         try:
@@ -431,6 +1095,74 @@ class BoneDensityDB:
             print(f"継続率統計取得エラー: {e}")
             return None
 
+    # 継続率推移の集計単位 -> (期間キーのSQL式, pandas の期間頻度)
+    CONTINUATION_GRANULARITIES = {
+        'year': ("strftime('%Y-01-01', scheduled_date)", 'YS'),
+        'month': ("strftime('%Y-%m-01', scheduled_date)", 'MS'),
+        # 月曜始まりの週（次の日曜日から6日戻す）
+        'week': ("date(scheduled_date, 'weekday 0', '-6 days')", 'W-MON'),
+    }
+
+    def get_continuation_series(self, start_date, end_date, granularity='year', rolling_window=None):
+        """期間内の継続受診率を年・月・週単位で1クエリ集計
+
+        Args:
+            start_date, end_date: 集計期間（予定日、両端を含む）
+            granularity: 'year' / 'month' / 'week'
+            rolling_window: 指定すると直近N期間の移動継続率（rolling_rate）を追加
+
+        Returns:
+            期間順のDataFrame（period_start, total_scheduled, completed, overdue,
+            continuation_rate[, rolling_rate]）。予定のない期間は0件として含む。
+        """
+        columns = ['period_start', 'total_scheduled', 'completed', 'overdue', 'continuation_rate']
+        try:
+            if granularity not in self.CONTINUATION_GRANULARITIES:
+                raise ValueError(f"未対応の集計単位です: {granularity}")
+            period_expr, freq = self.CONTINUATION_GRANULARITIES[granularity]
+            
+            query = f'''
+            SELECT {period_expr} AS period_start,
+                   COUNT(*) AS total_scheduled,
+                   SUM(CASE WHEN status = '済' THEN 1 ELSE 0 END) AS completed,
+                   SUM(CASE WHEN status = '予定' AND scheduled_date < ? THEN 1 ELSE 0 END) AS overdue
+            FROM follow_up_schedule
+            WHERE scheduled_date BETWEEN ? AND ?
+            GROUP BY period_start
+            ORDER BY period_start
+            '''
+            results = self.execute_query(query, [date.today(), start_date, end_date])
+            
+            counts = pd.DataFrame(results, columns=columns[:-1])
+            counts['period_start'] = pd.to_datetime(counts['period_start'])
+            
+            # 予定のない期間も0件として埋める（先頭はSQLの期間キーと同じ規則で求める）
+            first_day = pd.Timestamp(start_date).date()
+            if granularity == 'year':
+                first_period = date(first_day.year, 1, 1)
+            elif granularity == 'month':
+                first_period = date(first_day.year, first_day.month, 1)
+            else:
+                first_period = first_day - timedelta(days=first_day.weekday())
+            periods = pd.date_range(first_period, pd.Timestamp(end_date), freq=freq)
+            df = (counts.set_index('period_start')
+                  .reindex(periods, fill_value=0)
+                  .rename_axis('period_start')
+                  .reset_index())
+            
+            df['continuation_rate'] = (df['completed'] / df['total_scheduled'].where(df['total_scheduled'] > 0) * 100).round(1).fillna(0.0)
+            
+            if rolling_window:
+                window_completed = df['completed'].rolling(rolling_window, min_periods=1).sum()
+                window_total = df['total_scheduled'].rolling(rolling_window, min_periods=1).sum()
+                df['rolling_rate'] = (window_completed / window_total.where(window_total > 0) * 100).round(1).fillna(0.0)
+            
+            return df
+            
+        except Exception as e:
+            print(f"継続率推移取得エラー: {e}")
+            return pd.DataFrame(columns=columns)
+
 # テスト実行
 if __name__ == "__main__":
     db = BoneDensityDB()
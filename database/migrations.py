@@ -0,0 +1,1189 @@
+# database/migrations.py
+# スキーマのバージョン管理とマイグレーション
+
+import json
+import sqlite3
+import os
+import sys
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.search_keys import normalize_search_key
+
+
+def _table_exists(conn, table):
+    """テーブルの存在確認"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def _column_names(conn, table):
+    """テーブルの列名一覧"""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def _ensure_columns(conn, table, columns):
+    """不足している列を追加（旧スキーマのデータベース向け）"""
+    existing = _column_names(conn, table)
+    for name, definition in columns:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN {name} {definition}')
+
+
+def _has_unique_index_on(conn, table, column):
+    """指定列のみを対象とするUNIQUEインデックスの有無"""
+    for _, index_name, is_unique, *_ in conn.execute(f'PRAGMA index_list("{table}")'):
+        if not is_unique:
+            continue
+        columns = [row[2] for row in conn.execute(f'PRAGMA index_info("{index_name}")')]
+        if columns == [column]:
+            return True
+    return False
+
+
+# ===== マイグレーション定義 =====
+
+BASELINE_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS patients (
+        patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name_kanji TEXT NOT NULL,
+        name_kana TEXT,
+        patient_code TEXT UNIQUE,
+        birth_date DATE,
+        gender TEXT,
+        phone TEXT,
+        address TEXT,
+        email TEXT,
+        notes TEXT,
+        created_date DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS measurements (
+        measurement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        measurement_date DATE NOT NULL,
+        femur_bmd REAL,
+        lumbar_bmd REAL,
+        femur_yam REAL,
+        lumbar_yam REAL,
+        femur_tscore REAL,
+        lumbar_tscore REAL,
+        femur_diagnosis TEXT,
+        lumbar_diagnosis TEXT,
+        overall_diagnosis TEXT,
+        notes TEXT,
+        created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients (patient_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS follow_up_schedule (
+        schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        scheduled_date DATE NOT NULL,
+        status TEXT DEFAULT '予定',
+        completed_date DATE,
+        measurement_id INTEGER,
+        days_overdue INTEGER DEFAULT 0,
+        contact_needed BOOLEAN DEFAULT FALSE,
+        contact_date DATE,
+        contact_method TEXT,
+        contact_result TEXT,
+        notes TEXT,
+        created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
+        FOREIGN KEY (measurement_id) REFERENCES measurements(measurement_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS measurement_intervals (
+        interval_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        last_measurement_date DATE,
+        next_recommended_date DATE,
+        insurance_ready BOOLEAN DEFAULT FALSE,
+        interval_days INTEGER,
+        created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS system_settings (
+        setting_key TEXT PRIMARY KEY,
+        setting_value TEXT,
+        description TEXT,
+        updated_date DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS reference_values (
+        site TEXT PRIMARY KEY,
+        female_mean_young REAL,      -- 女性 20-29歳基準
+        female_sd_young REAL,
+        female_mean_adult REAL,      -- 女性 20-44歳基準
+        female_sd_adult REAL,
+        male_mean_young REAL,        -- 男性 20-29歳基準
+        male_sd_young REAL,
+        male_mean_adult REAL,        -- 男性 20-44歳基準
+        male_sd_adult REAL,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS vertebral_measurements (
+        vertebral_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        measurement_id INTEGER NOT NULL,
+        vertebra_level TEXT NOT NULL CHECK (vertebra_level IN ('L1', 'L2', 'L3', 'L4')),
+        bmd_value REAL NOT NULL CHECK (bmd_value > 0),
+        tscore REAL,
+        yam_percentage REAL,
+        diagnosis TEXT,
+        notes TEXT,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (measurement_id) REFERENCES measurements(measurement_id) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS import_history (
+        import_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL,
+        original_filename TEXT,
+        file_size INTEGER,
+        import_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        total_records INTEGER DEFAULT 0,
+        success_records INTEGER DEFAULT 0,
+        failed_records INTEGER DEFAULT 0,
+        warning_records INTEGER DEFAULT 0,
+        error_log TEXT,
+        import_type TEXT CHECK(import_type IN ('csv', 'excel', 'tsv', 'manual')),
+        column_mapping TEXT,
+        data_source TEXT,
+        import_status TEXT DEFAULT 'processing' CHECK(import_status IN ('processing', 'completed', 'failed', 'cancelled')),
+        notes TEXT,
+        created_by TEXT DEFAULT 'system'
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS external_data_sources (
+        source_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_name TEXT NOT NULL,
+        measurement_id INTEGER,
+        original_patient_id TEXT,
+        original_patient_code TEXT,
+        import_id INTEGER,
+        data_quality_score REAL DEFAULT 1.0,
+        verification_status TEXT DEFAULT 'unverified' CHECK(verification_status IN ('verified', 'unverified', 'flagged')),
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        notes TEXT,
+        FOREIGN KEY (measurement_id) REFERENCES measurements(measurement_id),
+        FOREIGN KEY (import_id) REFERENCES import_history(import_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS data_mapping_templates (
+        template_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        template_name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        source_type TEXT,
+        column_mappings TEXT NOT NULL,
+        date_format TEXT DEFAULT '%Y-%m-%d',
+        unit_conversions TEXT,
+        validation_rules TEXT,
+        is_default BOOLEAN DEFAULT 0,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used_date TIMESTAMP,
+        usage_count INTEGER DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS import_error_log (
+        error_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        import_id INTEGER,
+        row_number INTEGER,
+        column_name TEXT,
+        original_value TEXT,
+        error_type TEXT,
+        error_message TEXT,
+        suggested_fix TEXT,
+        error_severity TEXT DEFAULT 'warning' CHECK(error_severity IN ('info', 'warning', 'error', 'critical')),
+        is_resolved BOOLEAN DEFAULT 0,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (import_id) REFERENCES import_history(import_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS report_history (
+        report_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        report_type TEXT NOT NULL,
+        report_title TEXT,
+        generated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        generated_by TEXT,
+        parameters TEXT,
+        file_path TEXT,
+        file_format TEXT,
+        file_size INTEGER,
+        is_printed BOOLEAN DEFAULT FALSE,
+        print_count INTEGER DEFAULT 0,
+        last_accessed TIMESTAMP,
+        notes TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS followup_status (
+        status_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        scheduled_date DATE NOT NULL,
+        actual_date DATE,
+        status TEXT NOT NULL DEFAULT 'scheduled',
+        reminder_sent BOOLEAN DEFAULT FALSE,
+        reminder_date DATE,
+        rescheduled_from DATE,
+        reason TEXT,
+        contact_attempts INTEGER DEFAULT 0,
+        last_contact_date DATE,
+        notes TEXT,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS report_templates (
+        template_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        template_name TEXT NOT NULL,
+        template_type TEXT NOT NULL,
+        template_content TEXT,
+        template_parameters TEXT,
+        is_default BOOLEAN DEFAULT FALSE,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        created_by TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS patient_observations (
+        observation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        measurement_id INTEGER,
+        observation_date DATE NOT NULL,
+        observation_type TEXT,
+        title TEXT,
+        content TEXT NOT NULL,
+        severity TEXT,
+        is_confidential BOOLEAN DEFAULT FALSE,
+        created_by TEXT,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
+        FOREIGN KEY (measurement_id) REFERENCES measurements(measurement_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS statistics_summary (
+        summary_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        summary_date DATE NOT NULL,
+        summary_type TEXT NOT NULL,
+        total_patients INTEGER,
+        new_patients INTEGER,
+        active_patients INTEGER,
+        missed_appointments INTEGER,
+        completion_rate REAL,
+        average_bmd_lumbar REAL,
+        average_bmd_femur REAL,
+        improvement_cases INTEGER,
+        deterioration_cases INTEGER,
+        statistics_data TEXT,
+        created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+BASELINE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_vertebral_measurement_id ON vertebral_measurements(measurement_id)",
+    "CREATE INDEX IF NOT EXISTS idx_vertebral_level ON vertebral_measurements(vertebra_level)",
+    "CREATE INDEX IF NOT EXISTS idx_measurement_vertebra ON vertebral_measurements(measurement_id, vertebra_level)",
+    "CREATE INDEX IF NOT EXISTS idx_import_history_date ON import_history(import_date)",
+    "CREATE INDEX IF NOT EXISTS idx_import_history_status ON import_history(import_status)",
+    "CREATE INDEX IF NOT EXISTS idx_external_sources_measurement ON external_data_sources(measurement_id)",
+    "CREATE INDEX IF NOT EXISTS idx_external_sources_import ON external_data_sources(import_id)",
+    "CREATE INDEX IF NOT EXISTS idx_error_log_import ON import_error_log(import_id)",
+    "CREATE INDEX IF NOT EXISTS idx_error_log_severity ON import_error_log(error_severity)",
+    "CREATE INDEX IF NOT EXISTS idx_report_history_patient ON report_history(patient_id)",
+    "CREATE INDEX IF NOT EXISTS idx_report_history_type ON report_history(report_type)",
+    "CREATE INDEX IF NOT EXISTS idx_followup_status_patient ON followup_status(patient_id)",
+    "CREATE INDEX IF NOT EXISTS idx_followup_status_date ON followup_status(scheduled_date)",
+    "CREATE INDEX IF NOT EXISTS idx_patient_observations_patient ON patient_observations(patient_id)",
+]
+
+DEFAULT_SYSTEM_SETTINGS = [
+    ('default_follow_up_months', '6', '標準フォローアップ間隔（月）'),
+    ('insurance_interval_days', '120', '保険適用最小間隔（日）'),
+    ('urgent_overdue_days', '14', '緊急アラート経過日数'),
+    ('warning_overdue_days', '7', '警告アラート経過日数'),
+    ('attention_overdue_days', '3', '注意アラート経過日数'),
+]
+
+DEFAULT_REFERENCE_VALUES = [
+    ('femur_neck', 0.864, 0.12, 0.864, 0.12, 1.028, 0.146, 1.028, 0.146),
+    ('lumbar', 1.120, 0.134, 1.056, 0.134, 1.200, 0.155, 1.140, 0.155),
+]
+
+
+def _migrate_baseline(conn):
+    """v1: 現行スキーマ（初期データベース作成時のdb_setupとの差分を含む）"""
+    # 旧db_setupの横持ち形式（l1_bmd〜l4_tscore）の椎体別テーブルは退避する
+    if _table_exists(conn, 'vertebral_measurements') and \
+            'vertebra_level' not in _column_names(conn, 'vertebral_measurements'):
+        conn.execute("ALTER TABLE vertebral_measurements RENAME TO vertebral_measurements_legacy")
+
+    for ddl in BASELINE_TABLES:
+        conn.execute(ddl)
+
+    # 旧スキーマで作成されたテーブルの不足列を補う
+    _ensure_columns(conn, 'patients', [
+        ('patient_code', 'TEXT'),
+        ('phone', 'TEXT'),
+        ('address', 'TEXT'),
+        ('email', 'TEXT'),
+        ('notes', 'TEXT'),
+    ])
+    _ensure_columns(conn, 'measurements', [
+        ('femur_diagnosis', 'TEXT'),
+        ('lumbar_diagnosis', 'TEXT'),
+        ('overall_diagnosis', 'TEXT'),
+        ('notes', 'TEXT'),
+        ('created_date', 'DATETIME'),
+    ])
+
+    # ALTER TABLEで追加した patient_code にはUNIQUE制約が付かないため索引で補う
+    if not _has_unique_index_on(conn, 'patients', 'patient_code'):
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_patients_patient_code ON patients(patient_code)")
+
+    for ddl in BASELINE_INDEXES:
+        conn.execute(ddl)
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description) VALUES (?, ?, ?)",
+        DEFAULT_SYSTEM_SETTINGS
+    )
+    conn.executemany(
+        '''
+        INSERT OR IGNORE INTO reference_values
+            (site, female_mean_young, female_sd_young, female_mean_adult, female_sd_adult,
+             male_mean_young, male_sd_young, male_mean_adult, male_sd_adult)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        DEFAULT_REFERENCE_VALUES
+    )
+
+
+def _migrate_hot_path_indexes(conn):
+    """v2: 測定履歴・継続受診予定の検索用インデックス"""
+    # 患者別測定履歴・最新測定日（get_patient_measurements, check_insurance_eligibility）
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_measurements_patient_date
+        ON measurements(patient_id, measurement_date)
+    ''')
+    # 月別予定（get_monthly_schedule）
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_follow_up_date_status
+        ON follow_up_schedule(scheduled_date, status)
+    ''')
+    # 測定時の予定完了更新（update_completed_schedules）
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_follow_up_patient_date
+        ON follow_up_schedule(patient_id, scheduled_date)
+    ''')
+    # 未受診者抽出（get_overdue_patients）: 予定のみの部分インデックス
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_follow_up_pending_date
+        ON follow_up_schedule(scheduled_date)
+        WHERE status = '予定'
+    ''')
+
+
+def sync_patient_search_index(conn, patient_ids=None):
+    """患者検索表 patients_fts の正規化キーを patients に合わせて書き直す
+
+    正規化（normalize_search_key）は Python 側で行うため、スキーマのトリガーは
+    接続ごとの関数に依存しない。患者の登録時は対象の patient_ids だけを、
+    日次メンテナンスでは全患者を照合し、アプリ外（sqlite3 CLI・取り込み
+    スクリプトなど）で登録・変更された患者のキーも反映する。
+    削除された患者の行はトリガー（trg_patients_fts_delete）で削除する。
+
+    Returns:
+        書き直した患者数
+    """
+    if patient_ids is None:
+        patients = conn.execute(
+            "SELECT patient_id, name_kanji, name_kana, patient_code FROM patients"
+        ).fetchall()
+        indexed = {row[0]: tuple(row[1:]) for row in conn.execute(
+            "SELECT rowid, name_kanji, name_kana, patient_code FROM patients_fts"
+        )}
+        conn.execute("DELETE FROM patients_fts WHERE rowid NOT IN (SELECT patient_id FROM patients)")
+    else:
+        patients = conn.execute(
+            "SELECT patient_id, name_kanji, name_kana, patient_code FROM patients "
+            "WHERE patient_id IN (SELECT value FROM json_each(?))",
+            (json.dumps([int(pid) for pid in patient_ids]),)
+        ).fetchall()
+        indexed = {}
+
+    rows = []
+    for patient_id, *columns in patients:
+        keys = tuple(normalize_search_key(value) for value in columns)
+        if indexed.get(patient_id) != keys:
+            rows.append((patient_id,) + keys)
+
+    conn.executemany("DELETE FROM patients_fts WHERE rowid = ?", [(row[0],) for row in rows])
+    conn.executemany(
+        "INSERT INTO patients_fts (rowid, name_kanji, name_kana, patient_code) VALUES (?, ?, ?, ?)",
+        rows
+    )
+    return len(rows)
+
+
+def _migrate_patient_search_index(conn):
+    """v3: 患者検索用FTS5（trigram）インデックス
+
+    検索キーの登録は sync_patient_search_index（Python 側で正規化）で行う。
+    """
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+            name_kanji, name_kana, patient_code,
+            tokenize = 'trigram'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_patients_fts_delete
+        AFTER DELETE ON patients
+        BEGIN
+            DELETE FROM patients_fts WHERE rowid = OLD.patient_id;
+        END
+    ''')
+
+    # 既存患者の検索キーを投入
+    conn.execute("DELETE FROM patients_fts")
+    sync_patient_search_index(conn)
+
+
+def _migrate_patient_page_index(conn):
+    """v4: 患者一覧のキーセットページング用インデックス（登録日時, 患者ID）"""
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_patients_created
+        ON patients(created_date, patient_id)
+    ''')
+
+
+# 患者別測定サマリーを再計算するSQL（{patient} に対象患者IDの式を埋め込む）
+_SUMMARY_REFRESH_SQL = '''
+    INSERT OR REPLACE INTO patient_measurement_summary (
+        patient_id, measurement_count, last_measurement_id, last_measurement_date,
+        next_insurance_date, last_femur_bmd, last_lumbar_bmd,
+        last_femur_yam, last_lumbar_yam, last_femur_tscore, last_lumbar_tscore,
+        last_overall_diagnosis, updated_date
+    )
+    SELECT m.patient_id,
+           (SELECT COUNT(*) FROM measurements WHERE patient_id = m.patient_id),
+           m.measurement_id, m.measurement_date,
+           date(m.measurement_date, '+' || COALESCE(
+               (SELECT CAST(setting_value AS INTEGER) FROM system_settings
+                WHERE setting_key = 'insurance_interval_days'), 120) || ' days'),
+           m.femur_bmd, m.lumbar_bmd, m.femur_yam, m.lumbar_yam,
+           m.femur_tscore, m.lumbar_tscore, m.overall_diagnosis, CURRENT_TIMESTAMP
+    FROM measurements m
+    WHERE m.patient_id = {patient}
+    ORDER BY m.measurement_date DESC, m.measurement_id DESC
+    LIMIT 1;
+    DELETE FROM patient_measurement_summary
+    WHERE patient_id = {patient}
+      AND NOT EXISTS (SELECT 1 FROM measurements WHERE patient_id = {patient});
+'''
+
+# 保険適用間隔の変更時に次回保険適用日を一括更新するSQL
+_SUMMARY_INTERVAL_SQL = '''
+    UPDATE patient_measurement_summary
+    SET next_insurance_date = date(last_measurement_date,
+                                   '+' || CAST(NEW.setting_value AS INTEGER) || ' days');
+'''
+
+
+def rebuild_measurement_summary(conn):
+    """患者別測定サマリーを測定データから再構築（バックフィル）"""
+    conn.execute("DELETE FROM patient_measurement_summary")
+    conn.execute('''
+        INSERT INTO patient_measurement_summary (
+            patient_id, measurement_count, last_measurement_id, last_measurement_date,
+            next_insurance_date, last_femur_bmd, last_lumbar_bmd,
+            last_femur_yam, last_lumbar_yam, last_femur_tscore, last_lumbar_tscore,
+            last_overall_diagnosis, updated_date
+        )
+        SELECT patient_id, measurement_count, measurement_id, measurement_date,
+               date(measurement_date, '+' || COALESCE(
+                   (SELECT CAST(setting_value AS INTEGER) FROM system_settings
+                    WHERE setting_key = 'insurance_interval_days'), 120) || ' days'),
+               femur_bmd, lumbar_bmd, femur_yam, lumbar_yam,
+               femur_tscore, lumbar_tscore, overall_diagnosis, CURRENT_TIMESTAMP
+        FROM (
+            SELECT m.*,
+                   COUNT(*) OVER (PARTITION BY patient_id) AS measurement_count,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY patient_id
+                       ORDER BY measurement_date DESC, measurement_id DESC
+                   ) AS rn
+            FROM measurements m
+        )
+        WHERE rn = 1
+    ''')
+    return conn.execute("SELECT COUNT(*) FROM patient_measurement_summary").fetchone()[0]
+
+
+def _migrate_measurement_summary(conn):
+    """v5: 患者別測定サマリー（最新測定・次回保険適用日・測定回数）
+
+    measurements へのトリガーで常に最新状態に保ち、保険適用チェックや
+    前回測定の表示を主キー1行の読み込みで済ませる。
+    既存の measurement_intervals は未使用のまま残す。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_measurement_summary (
+            patient_id INTEGER PRIMARY KEY,
+            measurement_count INTEGER NOT NULL DEFAULT 0,
+            last_measurement_id INTEGER,
+            last_measurement_date DATE,
+            next_insurance_date DATE,
+            last_femur_bmd REAL,
+            last_lumbar_bmd REAL,
+            last_femur_yam REAL,
+            last_lumbar_yam REAL,
+            last_femur_tscore REAL,
+            last_lumbar_tscore REAL,
+            last_overall_diagnosis TEXT,
+            updated_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        )
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_measurements_summary_insert
+        AFTER INSERT ON measurements
+        BEGIN
+            {_SUMMARY_REFRESH_SQL.format(patient='NEW.patient_id')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_measurements_summary_update
+        AFTER UPDATE ON measurements
+        BEGIN
+            {_SUMMARY_REFRESH_SQL.format(patient='OLD.patient_id')}
+            {_SUMMARY_REFRESH_SQL.format(patient='NEW.patient_id')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_measurements_summary_delete
+        AFTER DELETE ON measurements
+        BEGIN
+            {_SUMMARY_REFRESH_SQL.format(patient='OLD.patient_id')}
+        END
+    ''')
+
+    # 設定は INSERT OR REPLACE で更新されるため INSERT / UPDATE の両方で追従
+    for event in ('INSERT', 'UPDATE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_settings_insurance_interval_{event.lower()}
+            AFTER {event} ON system_settings
+            WHEN NEW.setting_key = 'insurance_interval_days'
+                 AND CAST(NEW.setting_value AS INTEGER) > 0
+            BEGIN
+                {_SUMMARY_INTERVAL_SQL}
+            END
+        ''')
+
+    rebuild_measurement_summary(conn)
+
+
+
+def _migrate_overdue_worklist_index(conn):
+    """v6: 未受診者ワークリスト用の部分インデックス
+
+    予定のみの (予定日, 連絡済みフラグ, 患者ID) で件数集計をインデックスだけで行う。
+    v2 の idx_follow_up_pending_date はこのインデックスの先頭列と重複するため削除する。
+    """
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_follow_up_pending_worklist
+        ON follow_up_schedule(scheduled_date, contact_needed, patient_id)
+        WHERE status = '予定'
+    ''')
+    conn.execute("DROP INDEX IF EXISTS idx_follow_up_pending_date")
+
+
+
+def _migrate_statistics_rollup(conn):
+    """v7: 統計サマリーの増分集計用テーブル・インデックス・トリガー"""
+    # 定期ジョブの処理済み位置（ウォーターマーク）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_watermarks (
+            job_name TEXT PRIMARY KEY,
+            watermark TEXT,
+            last_run_date DATETIME,
+            last_run_seconds REAL,
+            notes TEXT
+        )
+    ''')
+
+    # 同じ日付・種別のサマリーは1行にまとめてから一意制約を付ける
+    conn.execute('''
+        DELETE FROM statistics_summary
+        WHERE summary_id NOT IN (
+            SELECT MAX(summary_id) FROM statistics_summary
+            GROUP BY summary_date, summary_type
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_statistics_summary_date_type
+        ON statistics_summary(summary_date, summary_type)
+    ''')
+
+    # 期間別の測定集計（測定日の範囲検索）
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_measurements_date
+        ON measurements(measurement_date)
+    ''')
+
+    # 予定の状態・日付が変わったら updated_date を更新（増分集計の検出に使用）
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_follow_up_touch_updated
+        AFTER UPDATE OF status, scheduled_date, completed_date ON follow_up_schedule
+        BEGIN
+            UPDATE follow_up_schedule SET updated_date = CURRENT_TIMESTAMP
+            WHERE schedule_id = NEW.schedule_id;
+        END
+    ''')
+
+
+
+# 未受診の経過日数を日次で更新するジョブ名（ウォーターマークは更新済みの基準日）
+OVERDUE_ROLL_JOB = 'days_overdue'
+
+# 経過日数・緊急度の基準日（未更新のデータベースでは今日）
+_OVERDUE_AS_OF_SQL = f'''COALESCE(
+    (SELECT watermark FROM job_watermarks WHERE job_name = '{OVERDUE_ROLL_JOB}'),
+    date('now', 'localtime'))'''
+
+# 予定日から基準日までの経過日数（{as_of} に基準日の式を埋め込む）
+_OVERDUE_DAYS_SQL = "MAX(CAST(julianday({as_of}) - julianday(scheduled_date) AS INTEGER), 0)"
+
+# 経過日数からの緊急度（しきい値はシステム設定、既定値は画面側と同じ）
+_OVERDUE_TIER_SQL = '''CASE
+        WHEN {days} >= COALESCE((SELECT CAST(setting_value AS INTEGER) FROM system_settings
+                                 WHERE setting_key = 'urgent_overdue_days'), 14) THEN 'urgent'
+        WHEN {days} >= COALESCE((SELECT CAST(setting_value AS INTEGER) FROM system_settings
+                                 WHERE setting_key = 'warning_overdue_days'), 7) THEN 'warning'
+        WHEN {days} > 0 THEN 'attention'
+    END'''
+
+
+def _overdue_refresh_sql(as_of, where):
+    """経過日数・緊急度を再計算するUPDATE文（予定以外は 0 / NULL）"""
+    days = _OVERDUE_DAYS_SQL.format(as_of=as_of)
+    tier = _OVERDUE_TIER_SQL.format(days=days)
+    return f'''
+        UPDATE follow_up_schedule
+        SET days_overdue = CASE WHEN status = '予定' THEN {days} ELSE 0 END,
+            urgency_tier = CASE WHEN status = '予定' THEN {tier} END
+        WHERE {where};
+    '''
+
+
+def roll_days_overdue(conn, as_of):
+    """予定の経過日数・緊急度を基準日時点に更新し、ウォーターマークを進める
+
+    値が変わる行だけを更新し、更新件数を返す。
+    """
+    days = _OVERDUE_DAYS_SQL.format(as_of=':as_of')
+    tier = _OVERDUE_TIER_SQL.format(days=days)
+    conn.execute(_overdue_refresh_sql(':as_of', f'''status = '予定'
+          AND (days_overdue IS NOT {days} OR urgency_tier IS NOT {tier})'''), {'as_of': as_of})
+    updated = conn.execute("SELECT changes()").fetchone()[0]
+
+    conn.execute('''
+        INSERT INTO job_watermarks (job_name, watermark, last_run_date)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(job_name) DO UPDATE SET
+            watermark = excluded.watermark,
+            last_run_date = excluded.last_run_date
+    ''', (OVERDUE_ROLL_JOB, as_of))
+    return updated
+
+
+def _today(conn):
+    """SQLite から見た今日の日付（ローカル時刻）"""
+    return conn.execute("SELECT date('now', 'localtime')").fetchone()[0]
+
+
+def _migrate_overdue_tiers(conn):
+    """v8: 未受診の経過日数・緊急度を保存列として維持
+
+    経過日数（days_overdue）と緊急度（urgency_tier）は日次のロール
+    （roll_days_overdue、ウォーターマークで1日1回）と、予定の追加・状態変更・
+    しきい値変更時のトリガーで更新する。緊急度別の件数はインデックスの
+    範囲検索で集計する。予定日を過ぎていない予定の緊急度は NULL。
+    """
+    _ensure_columns(conn, 'follow_up_schedule', [('urgency_tier', 'TEXT')])
+
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_follow_up_overdue_tier
+        ON follow_up_schedule(urgency_tier, days_overdue, contact_needed)
+        WHERE status = '予定'
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_follow_up_overdue_insert
+        AFTER INSERT ON follow_up_schedule
+        BEGIN
+            {_overdue_refresh_sql(_OVERDUE_AS_OF_SQL, 'schedule_id = NEW.schedule_id')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_follow_up_overdue_update
+        AFTER UPDATE OF status, scheduled_date ON follow_up_schedule
+        BEGIN
+            {_overdue_refresh_sql(_OVERDUE_AS_OF_SQL, 'schedule_id = NEW.schedule_id')}
+        END
+    ''')
+
+    # しきい値の変更時は予定中の全行の緊急度を付け直す
+    for event in ('INSERT', 'UPDATE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_settings_overdue_tier_{event.lower()}
+            AFTER {event} ON system_settings
+            WHEN NEW.setting_key IN ('urgent_overdue_days', 'warning_overdue_days')
+            BEGIN
+                {_overdue_refresh_sql(_OVERDUE_AS_OF_SQL, "status = '予定'")}
+            END
+        ''')
+
+    # 完了済みの行も含めて今日時点で埋める
+    today = _today(conn)
+    conn.execute(_overdue_refresh_sql(':as_of', '1'), {'as_of': today})
+    roll_days_overdue(conn, today)
+
+
+
+def _migrate_reference_values_version(conn):
+    """v9: 基準値のバージョン番号
+
+    reference_values が変更されるたびにトリガーでバージョンを進め、
+    プロセス内の基準値レジストリはバージョンが変わったときだけ読み直す。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reference_values_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO reference_values_version (id, version) VALUES (1, 1)")
+
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_reference_values_version_{event.lower()}
+            AFTER {event} ON reference_values
+            BEGIN
+                UPDATE reference_values_version
+                SET version = version + 1, updated_date = CURRENT_TIMESTAMP
+                WHERE id = 1;
+            END
+        ''')
+
+
+
+def _create_vertebral_progression_triggers(conn):
+    """椎体別データの変更で患者を「経過の要再計算」に記録するトリガー
+
+    椎体別データは UPSERT（ON CONFLICT DO UPDATE）で書き込むため、外側の文の
+    競合処理に上書きされる INSERT OR IGNORE ではなく NOT EXISTS で重複を避ける。
+    """
+    mark_vertebral = '''
+        INSERT INTO progression_dirty_patients (patient_id)
+        SELECT m.patient_id FROM measurements m
+        WHERE m.measurement_id = {row}.measurement_id
+          AND NOT EXISTS (SELECT 1 FROM progression_dirty_patients d WHERE d.patient_id = m.patient_id);
+    '''
+    for event, rows in (('INSERT', ('NEW',)), ('UPDATE', ('OLD', 'NEW')), ('DELETE', ('OLD',))):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_vertebral_progression_{event.lower()}
+            AFTER {event} ON vertebral_measurements
+            BEGIN
+                {''.join(mark_vertebral.format(row=row) for row in rows)}
+            END
+        ''')
+
+
+def _migrate_measurement_progression(conn):
+    """v10: 連続する測定間の変化（経過）の実体化テーブル
+
+    測定・椎体別データの変更はトリガーで患者単位に「要再計算」として記録し、
+    MeasurementProgression.refresh がその患者の経過だけを LAG() で作り直す。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS measurement_progression (
+            measurement_id INTEGER PRIMARY KEY,
+            patient_id INTEGER NOT NULL,
+            measurement_date DATE,
+            previous_measurement_id INTEGER,
+            previous_measurement_date DATE,
+            days_between INTEGER,
+            femur_bmd_change REAL,
+            femur_yam_change REAL,
+            femur_tscore_change REAL,
+            femur_trend TEXT,
+            lumbar_bmd_change REAL,
+            lumbar_yam_change REAL,
+            lumbar_tscore_change REAL,
+            lumbar_trend TEXT,
+            worsened_vertebrae TEXT,
+            worsened INTEGER NOT NULL DEFAULT 0,
+            updated_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_measurement_progression_patient
+        ON measurement_progression(patient_id, measurement_date)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_measurement_progression_worsened
+        ON measurement_progression(measurement_date)
+        WHERE worsened = 1
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vertebral_progression (
+            measurement_id INTEGER NOT NULL,
+            vertebra_level TEXT NOT NULL,
+            patient_id INTEGER NOT NULL,
+            previous_measurement_id INTEGER,
+            bmd_change REAL,
+            yam_change REAL,
+            tscore_change REAL,
+            trend TEXT,
+            PRIMARY KEY (measurement_id, vertebra_level)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_vertebral_progression_patient
+        ON vertebral_progression(patient_id)
+    ''')
+
+    # 経過の再計算が必要な患者
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS progression_dirty_patients (
+            patient_id INTEGER PRIMARY KEY
+        )
+    ''')
+
+    mark = "INSERT OR IGNORE INTO progression_dirty_patients (patient_id) VALUES ({patient});"
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_measurements_progression_insert
+        AFTER INSERT ON measurements
+        BEGIN
+            {mark.format(patient='NEW.patient_id')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_measurements_progression_update
+        AFTER UPDATE OF patient_id, measurement_date, femur_bmd, lumbar_bmd,
+                        femur_yam, lumbar_yam, femur_tscore, lumbar_tscore ON measurements
+        BEGIN
+            {mark.format(patient='OLD.patient_id')}
+            {mark.format(patient='NEW.patient_id')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_measurements_progression_delete
+        AFTER DELETE ON measurements
+        BEGIN
+            {mark.format(patient='OLD.patient_id')}
+        END
+    ''')
+
+    _create_vertebral_progression_triggers(conn)
+
+    # 既存データは次回の refresh で全患者分を計算する
+    conn.execute('''
+        INSERT OR IGNORE INTO progression_dirty_patients (patient_id)
+        SELECT DISTINCT patient_id FROM measurements
+    ''')
+
+
+def _migrate_bmd_trends(conn):
+    """v11: 患者・部位別の骨密度推移（回帰直線）のキャッシュ
+
+    BmdTrends.refresh が、最新測定IDと測定回数が前回計算時から変わった
+    患者だけを再計算する（計算時の値は bmd_trend_patients に保存）。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bmd_trends (
+            patient_id INTEGER NOT NULL,
+            site TEXT NOT NULL,
+            measurement_count INTEGER NOT NULL,
+            first_date DATE,
+            last_date DATE,
+            span_years REAL,
+            slope_per_year REAL,
+            percent_per_year REAL,
+            total_change_percent REAL,
+            residual_sd REAL,
+            lsc_percent REAL,
+            trend TEXT,
+            PRIMARY KEY (patient_id, site)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bmd_trends_site_trend
+        ON bmd_trends(site, trend, percent_per_year)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bmd_trend_patients (
+            patient_id INTEGER PRIMARY KEY,
+            last_measurement_id INTEGER,
+            measurement_count INTEGER NOT NULL,
+            updated_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _migrate_vertebral_unique_level(conn):
+    """v12: 椎体別データを (測定ID, 椎体) で一意にする
+
+    重複行は最後に登録した行（vertebral_id 最大）を残して削除し、
+    非一意の idx_measurement_vertebra を一意インデックスに置き換える。
+    書き込みは削除→挿入ではなくこのインデックスへの UPSERT で行う。
+    """
+    conn.execute('''
+        DELETE FROM vertebral_measurements
+        WHERE vertebral_id NOT IN (
+            SELECT MAX(vertebral_id) FROM vertebral_measurements
+            GROUP BY measurement_id, vertebra_level
+        )
+    ''')
+    conn.execute("DROP INDEX IF EXISTS idx_measurement_vertebra")
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_vertebral_measurement_level
+        ON vertebral_measurements(measurement_id, vertebra_level)
+    ''')
+
+    # v10 の INSERT OR IGNORE 版トリガーは UPSERT 内で重複エラーになるため作り直す
+    for event in ('insert', 'update', 'delete'):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_vertebral_progression_{event}")
+    _create_vertebral_progression_triggers(conn)
+
+
+# 患者のデータバージョンを加算するSQL（{patient} に患者IDの式を埋め込む。
+# UPSERT 内で発火しても競合しないよう INSERT OR IGNORE は使わない）
+_PATIENT_VERSION_BUMP_SQL = '''
+    UPDATE patient_data_versions SET version = version + 1 WHERE patient_id = {patient};
+    INSERT INTO patient_data_versions (patient_id, version)
+    SELECT {patient}, 1
+    WHERE {patient} IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM patient_data_versions WHERE patient_id = {patient});
+'''
+
+
+def _migrate_patient_data_versions(conn):
+    """v13: 患者ごとのデータバージョン（読み取りキャッシュの無効化用）
+
+    測定・椎体別データ・患者情報の変更で患者の行を、システム設定の変更で
+    全患者共通の行（patient_id = 0）をトリガーで加算する。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_data_versions (
+            patient_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    bump = _PATIENT_VERSION_BUMP_SQL.format
+    measurement_patient = "(SELECT patient_id FROM measurements WHERE measurement_id = {row}.measurement_id)"
+    triggers = [
+        ('measurements_insert', 'AFTER INSERT ON measurements', [bump(patient='NEW.patient_id')]),
+        ('measurements_update', 'AFTER UPDATE ON measurements',
+         [bump(patient='OLD.patient_id'), bump(patient='NEW.patient_id')]),
+        ('measurements_delete', 'AFTER DELETE ON measurements', [bump(patient='OLD.patient_id')]),
+        ('vertebral_insert', 'AFTER INSERT ON vertebral_measurements',
+         [bump(patient=measurement_patient.format(row='NEW'))]),
+        ('vertebral_update', 'AFTER UPDATE ON vertebral_measurements',
+         [bump(patient=measurement_patient.format(row='OLD')), bump(patient=measurement_patient.format(row='NEW'))]),
+        ('vertebral_delete', 'AFTER DELETE ON vertebral_measurements',
+         [bump(patient=measurement_patient.format(row='OLD'))]),
+        ('patients_update', 'AFTER UPDATE ON patients',
+         [bump(patient='OLD.patient_id'), bump(patient='NEW.patient_id')]),
+        ('patients_delete', 'AFTER DELETE ON patients', [bump(patient='OLD.patient_id')]),
+        ('settings_insert', 'AFTER INSERT ON system_settings', [bump(patient='0')]),
+        ('settings_update', 'AFTER UPDATE ON system_settings', [bump(patient='0')]),
+    ]
+    for name, event, statements in triggers:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_patient_version_{name}
+            {event}
+            BEGIN
+                {''.join(statements)}
+            END
+        ''')
+
+
+def _migrate_patient_search_keys(conn):
+    """v14: 患者検索キーをトリガーではなく Python 側で登録する
+
+    旧 v3 の登録・更新トリガーは接続マネージャが登録する normalize_search_key を
+    呼ぶため、それ以外の接続（sqlite3 CLI・バックアップから復元したファイルなど）
+    では patients への書き込みが失敗していた。トリガーを削除し、キーを照合し直す。
+    """
+    conn.execute("DROP TRIGGER IF EXISTS trg_patients_fts_insert")
+    conn.execute("DROP TRIGGER IF EXISTS trg_patients_fts_update")
+    sync_patient_search_index(conn)
+
+
+def _migrate_statistics_dirty_days(conn):
+    """v15: 測定の登録・修正・削除で統計サマリーの要再集計日を記録するトリガー
+
+    measurements には更新日時が無いため、登録日時だけでは修正・削除を検出
+    できない。変更された測定の測定日と、前回値との比較（改善・悪化）が変わる
+    同じ患者の次の測定日を statistics_dirty_days に記録し、
+    StatisticsRollup.refresh が読み取って消す。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS statistics_dirty_days (
+            day TEXT PRIMARY KEY
+        )
+    ''')
+
+    # 測定は UPSERT で書き込まれることがあるため、INSERT OR IGNORE ではなく NOT EXISTS で重複を避ける
+    mark = '''
+        INSERT INTO statistics_dirty_days (day)
+        SELECT c.day FROM (
+            SELECT date({row}.measurement_date) AS day
+            UNION
+            SELECT MIN(date(m.measurement_date)) FROM measurements m
+            WHERE m.patient_id = {row}.patient_id AND m.measurement_date > {row}.measurement_date
+        ) c
+        WHERE c.day IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM statistics_dirty_days d WHERE d.day = c.day);
+    '''
+    events = (
+        ('insert', 'INSERT', ('NEW',)),
+        ('update', 'UPDATE OF patient_id, measurement_date, femur_bmd, lumbar_bmd, overall_diagnosis', ('OLD', 'NEW')),
+        ('delete', 'DELETE', ('OLD',)),
+    )
+    for name, event, rows in events:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_measurements_statistics_{name}
+            AFTER {event} ON measurements
+            BEGIN
+                {''.join(mark.format(row=row) for row in rows)}
+            END
+        ''')
+
+    # 前回の集計以降に登録された測定（これまでは登録日時で検出していた分）
+    conn.execute('''
+        INSERT OR IGNORE INTO statistics_dirty_days (day)
+        SELECT date(m.measurement_date) FROM measurements m, job_watermarks w
+        WHERE w.job_name = 'statistics_summary'
+          AND m.created_date > datetime(w.watermark, '-1 day')
+          AND m.measurement_date IS NOT NULL
+    ''')
+
+
+# (バージョン, 説明, 適用関数) の順に追加していく
+MIGRATIONS = [
+    (1, '現行スキーマ', _migrate_baseline),
+    (2, '検索用インデックス追加', _migrate_hot_path_indexes),
+    (3, '患者検索インデックス（FTS5 trigram）', _migrate_patient_search_index),
+    (4, '患者一覧ページング用インデックス', _migrate_patient_page_index),
+    (5, '患者別測定サマリー', _migrate_measurement_summary),
+    (6, '未受診者ワークリスト用インデックス', _migrate_overdue_worklist_index),
+    (7, '統計サマリー増分集計', _migrate_statistics_rollup),
+    (8, '未受診の経過日数・緊急度', _migrate_overdue_tiers),
+    (9, '基準値バージョン', _migrate_reference_values_version),
+    (10, '測定間の経過', _migrate_measurement_progression),
+    (11, '骨密度推移（回帰）', _migrate_bmd_trends),
+    (12, '椎体別データの一意インデックス', _migrate_vertebral_unique_level),
+    (13, '患者データバージョン（読み取りキャッシュ）', _migrate_patient_data_versions),
+    (14, '患者検索キーの Python 側での登録', _migrate_patient_search_keys),
+    (15, '統計サマリーの要再集計日（測定の修正・削除）', _migrate_statistics_dirty_days),
+]
+
+
+def get_schema_version(conn):
+    """適用済みのスキーマバージョンを取得"""
+    if not _table_exists(conn, 'schema_version'):
+        return 0
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn):
+    """未適用のマイグレーションを順に適用
+
+    各マイグレーションは BEGIN IMMEDIATE のトランザクション内で適用し、
+    複数プロセスが同時に起動しても二重に適用されないようにする。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    if conn.in_transaction:
+        conn.commit()
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # ロック取得までの間に他プロセスが適用済みの場合はスキップ
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+
+            migrate(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+            applied.append(version)
+            print(f"✅ マイグレーション適用: v{version} {description}")
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ マイグレーションエラー (v{version}): {e}")
+            raise
+
+    return applied
+
+
+if __name__ == "__main__":
+    from database.connection import get_connection_manager
+
+    connection = get_connection_manager().get_connection()
+    run_migrations(connection)
+    print(f"スキーマバージョン: {get_schema_version(connection)}")
+
+    # python database/migrations.py --rebuild-summary で患者別測定サマリーを再構築
+    if '--rebuild-summary' in sys.argv[1:]:
+        with connection:
+            count = rebuild_measurement_summary(connection)
+        print(f"✅ 患者別測定サマリー再構築: {count}名")
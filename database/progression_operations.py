@@ -0,0 +1,290 @@
+# database/progression_operations.py
+# 連続する測定間の変化（経過）の集計と悪化患者の抽出
+
+import os
+import sys
+import time
+import pandas as pd
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+
+
+# 変化率（%）がこの値を超えれば改善、下回れば悪化（VertebralCalculator._determine_trend と同じ）
+TREND_THRESHOLD_PERCENT = 2
+
+# 前回値・今回値からの傾向判定SQL（前回値が0以下・欠損なら判定しない）
+_TREND_SQL = f'''CASE
+        WHEN {{current}} IS NULL OR {{previous}} IS NULL OR {{previous}} <= 0 THEN NULL
+        WHEN ({{current}} - {{previous}}) * 100.0 / {{previous}} > {TREND_THRESHOLD_PERCENT} THEN '改善'
+        WHEN ({{current}} - {{previous}}) * 100.0 / {{previous}} < -{TREND_THRESHOLD_PERCENT} THEN '悪化'
+        ELSE '安定'
+    END'''
+
+
+def _trend_sql(current, previous):
+    return _TREND_SQL.format(current=current, previous=previous)
+
+
+class MeasurementProgression:
+    """患者ごとの連続する測定の組（前回→今回）の変化を実体化テーブルで管理する
+
+    measurement_progression（大腿骨・腰椎）と vertebral_progression（L1〜L4）に、
+    LAG() で求めた前回測定との差・傾向（改善 / 安定 / 悪化）を保存する。
+    測定・椎体別データが変わった患者はトリガーで progression_dirty_patients に
+    記録され、refresh はその患者の分だけを作り直す。
+    """
+
+    def __init__(self, db_path=None):
+        self.manager = get_connection_manager(db_path)
+        self.db_path = self.manager.db_path
+
+    def refresh(self, full=False):
+        """経過テーブルを更新
+
+        Args:
+            full: True なら全患者の経過を作り直す
+
+        Returns:
+            {'patients': 再計算した患者数, 'measurements': 作成した行数, 'seconds': 所要時間}
+            （失敗時は None）
+        """
+        started = time.perf_counter()
+        try:
+            with self.manager.transaction() as conn:
+                if full:
+                    conn.execute("DELETE FROM progression_dirty_patients")
+                    conn.execute('''
+                        INSERT INTO progression_dirty_patients (patient_id)
+                        SELECT DISTINCT patient_id FROM measurements
+                    ''')
+                patients = conn.execute("SELECT COUNT(*) FROM progression_dirty_patients").fetchone()[0]
+                if full:
+                    conn.execute("DELETE FROM measurement_progression")
+                    conn.execute("DELETE FROM vertebral_progression")
+                elif patients:
+                    conn.execute('''
+                        DELETE FROM measurement_progression
+                        WHERE patient_id IN (SELECT patient_id FROM progression_dirty_patients)
+                    ''')
+                    conn.execute('''
+                        DELETE FROM vertebral_progression
+                        WHERE patient_id IN (SELECT patient_id FROM progression_dirty_patients)
+                    ''')
+
+                measurements = 0
+                if patients:
+                    self._insert_vertebral_progression(conn)
+                    measurements = self._insert_measurement_progression(conn)
+                    conn.execute("DELETE FROM progression_dirty_patients")
+
+            return {'patients': patients, 'measurements': measurements,
+                    'seconds': round(time.perf_counter() - started, 3)}
+
+        except Exception as e:
+            print(f"経過更新エラー: {e}")
+            return None
+
+    def refresh_if_dirty(self):
+        """再計算が必要な患者がいれば経過を更新"""
+        try:
+            row = self.manager.get_connection().execute(
+                "SELECT EXISTS (SELECT 1 FROM progression_dirty_patients)"
+            ).fetchone()
+            if row and row[0]:
+                return self.refresh()
+            return None
+
+        except Exception as e:
+            print(f"経過更新確認エラー: {e}")
+            return None
+
+    def _insert_vertebral_progression(self, conn):
+        """要再計算患者の椎体別の経過を作成（同じ椎体の前回測定と比較）"""
+        conn.execute(f'''
+            INSERT INTO vertebral_progression (
+                measurement_id, vertebra_level, patient_id, previous_measurement_id,
+                bmd_change, yam_change, tscore_change, trend
+            )
+            SELECT measurement_id, vertebra_level, patient_id, previous_measurement_id,
+                   ROUND(bmd_value - previous_bmd, 3),
+                   ROUND(yam_percentage - previous_yam, 1),
+                   ROUND(tscore - previous_tscore, 1),
+                   {_trend_sql('bmd_value', 'previous_bmd')}
+            FROM (
+                SELECT vm.measurement_id, vm.vertebra_level, m.patient_id,
+                       vm.bmd_value, vm.yam_percentage, vm.tscore,
+                       LAG(vm.measurement_id) OVER w AS previous_measurement_id,
+                       LAG(vm.bmd_value) OVER w AS previous_bmd,
+                       LAG(vm.yam_percentage) OVER w AS previous_yam,
+                       LAG(vm.tscore) OVER w AS previous_tscore
+                FROM vertebral_measurements vm
+                JOIN measurements m ON m.measurement_id = vm.measurement_id
+                WHERE m.patient_id IN (SELECT patient_id FROM progression_dirty_patients)
+                WINDOW w AS (
+                    PARTITION BY m.patient_id, vm.vertebra_level
+                    ORDER BY m.measurement_date, m.measurement_id
+                )
+            )
+        ''')
+
+    def _insert_measurement_progression(self, conn):
+        """要再計算患者の測定ごとの経過を作成（初回測定は前回なし）"""
+        # BMD が0以下の部位は未測定として扱う
+        conn.execute(f'''
+            INSERT INTO measurement_progression (
+                measurement_id, patient_id, measurement_date,
+                previous_measurement_id, previous_measurement_date, days_between,
+                femur_bmd_change, femur_yam_change, femur_tscore_change, femur_trend,
+                lumbar_bmd_change, lumbar_yam_change, lumbar_tscore_change, lumbar_trend,
+                worsened_vertebrae, worsened, updated_date
+            )
+            SELECT measurement_id, patient_id, measurement_date,
+                   previous_measurement_id, previous_measurement_date,
+                   CAST(julianday(measurement_date) - julianday(previous_measurement_date) AS INTEGER),
+                   ROUND(femur_bmd - previous_femur_bmd, 3),
+                   ROUND(femur_yam - previous_femur_yam, 1),
+                   ROUND(femur_tscore - previous_femur_tscore, 1),
+                   femur_trend,
+                   ROUND(lumbar_bmd - previous_lumbar_bmd, 3),
+                   ROUND(lumbar_yam - previous_lumbar_yam, 1),
+                   ROUND(lumbar_tscore - previous_lumbar_tscore, 1),
+                   lumbar_trend,
+                   worsened_vertebrae,
+                   COALESCE(femur_trend = '悪化', 0) OR COALESCE(lumbar_trend = '悪化', 0)
+                       OR worsened_vertebrae IS NOT NULL,
+                   CURRENT_TIMESTAMP
+            FROM (
+                SELECT *,
+                       {_trend_sql('femur_bmd', 'previous_femur_bmd')} AS femur_trend,
+                       {_trend_sql('lumbar_bmd', 'previous_lumbar_bmd')} AS lumbar_trend,
+                       (SELECT group_concat(vertebra_level, ',') FROM (
+                            SELECT vertebra_level FROM vertebral_progression vp
+                            WHERE vp.measurement_id = pairs.measurement_id AND vp.trend = '悪化'
+                            ORDER BY vertebra_level
+                        )) AS worsened_vertebrae
+                FROM (
+                    SELECT measurement_id, patient_id, measurement_date,
+                           femur_bmd, femur_yam, femur_tscore, lumbar_bmd, lumbar_yam, lumbar_tscore,
+                           LAG(measurement_id) OVER w AS previous_measurement_id,
+                           LAG(measurement_date) OVER w AS previous_measurement_date,
+                           LAG(femur_bmd) OVER w AS previous_femur_bmd,
+                           LAG(femur_yam) OVER w AS previous_femur_yam,
+                           LAG(femur_tscore) OVER w AS previous_femur_tscore,
+                           LAG(lumbar_bmd) OVER w AS previous_lumbar_bmd,
+                           LAG(lumbar_yam) OVER w AS previous_lumbar_yam,
+                           LAG(lumbar_tscore) OVER w AS previous_lumbar_tscore
+                    FROM (
+                        SELECT measurement_id, patient_id, measurement_date,
+                               CASE WHEN femur_bmd > 0 THEN femur_bmd END AS femur_bmd,
+                               CASE WHEN femur_bmd > 0 THEN femur_yam END AS femur_yam,
+                               CASE WHEN femur_bmd > 0 THEN femur_tscore END AS femur_tscore,
+                               CASE WHEN lumbar_bmd > 0 THEN lumbar_bmd END AS lumbar_bmd,
+                               CASE WHEN lumbar_bmd > 0 THEN lumbar_yam END AS lumbar_yam,
+                               CASE WHEN lumbar_bmd > 0 THEN lumbar_tscore END AS lumbar_tscore
+                        FROM measurements
+                        WHERE patient_id IN (SELECT patient_id FROM progression_dirty_patients)
+                    )
+                    WINDOW w AS (PARTITION BY patient_id ORDER BY measurement_date, measurement_id)
+                ) pairs
+            )
+        ''')
+        return conn.execute("SELECT changes()").fetchone()[0]
+
+    def get_deterioration_list(self, latest_only=True, start_date=None, end_date=None, limit=None):
+        """前回測定から悪化した患者の一覧（測定日の新しい順）
+
+        Args:
+            latest_only: True なら各患者の最新測定が悪化している患者のみ
+                         （False なら期間内の悪化したすべての測定）
+            start_date / end_date: 今回測定日の範囲（省略時は全期間）
+            limit: 取得件数（None なら全件）
+
+        Returns:
+            悪化した測定のDataFrame（患者情報・前回測定日・部位別の変化量と傾向・
+            悪化した椎体）
+        """
+        columns = ['patient_id', 'name_kanji', 'name_kana', 'gender', 'measurement_id',
+                   'measurement_date', 'previous_measurement_date', 'days_between',
+                   'femur_bmd_change', 'femur_yam_change', 'femur_tscore_change', 'femur_trend',
+                   'lumbar_bmd_change', 'lumbar_yam_change', 'lumbar_tscore_change', 'lumbar_trend',
+                   'worsened_vertebrae']
+        try:
+            self.refresh_if_dirty()
+
+            # 悪化した測定のみの部分インデックスを測定日順に走査
+            query = f'''
+            SELECT p.patient_id, pt.name_kanji, pt.name_kana, pt.gender, p.measurement_id,
+                   p.measurement_date, p.previous_measurement_date, p.days_between,
+                   p.femur_bmd_change, p.femur_yam_change, p.femur_tscore_change, p.femur_trend,
+                   p.lumbar_bmd_change, p.lumbar_yam_change, p.lumbar_tscore_change, p.lumbar_trend,
+                   p.worsened_vertebrae
+            FROM measurement_progression p
+            JOIN patients pt ON pt.patient_id = p.patient_id
+            {'JOIN patient_measurement_summary s ON s.last_measurement_id = p.measurement_id' if latest_only else ''}
+            WHERE p.worsened = 1
+              AND p.measurement_date >= COALESCE(:start_date, '0000-00-00')
+              AND p.measurement_date <= COALESCE(:end_date, '9999-12-31')
+            ORDER BY p.measurement_date DESC, p.measurement_id DESC
+            LIMIT :limit
+            '''
+            rows = self.manager.get_connection().execute(query, {
+                'start_date': start_date,
+                'end_date': end_date,
+                'limit': -1 if limit is None else int(limit)
+            }).fetchall()
+            return pd.DataFrame(rows, columns=columns)
+
+        except Exception as e:
+            print(f"悪化患者一覧取得エラー: {e}")
+            return pd.DataFrame(columns=columns)
+
+    def get_patient_progression(self, patient_id):
+        """患者の全測定の経過（前回との差・傾向）を測定日順に取得
+
+        Returns:
+            (測定単位のDataFrame, 椎体別のDataFrame)
+        """
+        columns = ['measurement_id', 'measurement_date', 'previous_measurement_date', 'days_between',
+                   'femur_bmd_change', 'femur_yam_change', 'femur_tscore_change', 'femur_trend',
+                   'lumbar_bmd_change', 'lumbar_yam_change', 'lumbar_tscore_change', 'lumbar_trend',
+                   'worsened_vertebrae', 'worsened']
+        vertebral_columns = ['measurement_id', 'vertebra_level', 'previous_measurement_id',
+                             'bmd_change', 'yam_change', 'tscore_change', 'trend']
+        try:
+            self.refresh_if_dirty()
+            conn = self.manager.get_connection()
+
+            rows = conn.execute(f'''
+                SELECT {', '.join(columns)}
+                FROM measurement_progression
+                WHERE patient_id = ?
+                ORDER BY measurement_date, measurement_id
+            ''', (patient_id,)).fetchall()
+            vertebral_rows = conn.execute(f'''
+                SELECT {', '.join('vp.' + column for column in vertebral_columns)}
+                FROM vertebral_progression vp
+                JOIN measurement_progression p ON p.measurement_id = vp.measurement_id
+                WHERE vp.patient_id = ?
+                ORDER BY p.measurement_date, p.measurement_id, vp.vertebra_level
+            ''', (patient_id,)).fetchall()
+
+            df = pd.DataFrame(rows, columns=columns)
+            df['worsened'] = df['worsened'].astype(bool)
+            return df, pd.DataFrame(vertebral_rows, columns=vertebral_columns)
+
+        except Exception as e:
+            print(f"患者経過取得エラー: {e}")
+            return pd.DataFrame(columns=columns), pd.DataFrame(columns=vertebral_columns)
+
+
+# テスト実行
+if __name__ == "__main__":
+    from database.db_operations import BoneDensityDB
+
+    BoneDensityDB()  # マイグレーション適用
+    progression = MeasurementProgression()
+    print(f"経過更新: {progression.refresh(full='--full' in sys.argv[1:])}")
+    print(progression.get_deterioration_list().head(20).to_string())
@@ -0,0 +1,148 @@
+# database/read_cache.py
+# 患者単位のデータバージョンで無効化する読み取りキャッシュ
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+
+# patient_data_versions で全患者に影響する変更（システム設定など）を記録する行
+ALL_PATIENTS = 0
+
+
+def _detach(value):
+    """キャッシュした値を呼び出し元が書き換えても影響しないようにコピー"""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, dict):
+        return {key: _detach(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_detach(item) for item in value]
+    return value
+
+
+class PatientReadCache:
+    """患者ごとの読み取り結果を保持するプロセス共通の LRU キャッシュ
+
+    エントリには取得時の患者データバージョン（patient_data_versions。測定・
+    椎体別データ・患者情報の変更でトリガーが加算）とデータ世代番号を記録する。
+    世代番号が変わっていなければそのまま返し、変わっていれば患者のバージョンを
+    主キーで確認して、その患者に変更がなければ再利用する。
+    """
+
+    MAX_ENTRIES = 512
+
+    def __init__(self, db_path=None, max_entries=None):
+        self.manager = get_connection_manager(db_path)
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # キー -> [患者ID, バージョン, 世代番号, 値]
+        self._epoch = self.manager.epoch
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, name, args, loader, patient_id=None):
+        """キャッシュから取得し、無い・古い場合は loader() で読み込んで保存
+
+        Args:
+            name: クエリ名
+            args: クエリの引数（タプル）
+            loader: 読み込み関数。例外はそのまま呼び出し元に伝わり、キャッシュしない
+            patient_id: 結果が依存する患者ID。None の場合 loader は (値, 患者ID) を返す
+                        （患者IDが None の結果はキャッシュしない）
+        """
+        # トランザクション内では未コミットの変更を含めて読む
+        if self.manager.in_transaction():
+            return loader() if patient_id is not None else loader()[0]
+
+        key = (name,) + tuple(args)
+        generation = self.manager.generation()
+        with self._lock:
+            if self._epoch != self.manager.epoch:
+                # データベースファイルが作り直された
+                self._entries.clear()
+                self._epoch = self.manager.epoch
+            entry = self._entries.get(key)
+
+        if entry is not None:
+            entry_patient, version, checked, value = entry
+            if checked == generation or self._version(entry_patient) == version:
+                with self._lock:
+                    entry[2] = generation
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                return _detach(value)
+
+        if patient_id is not None:
+            value = loader()
+        else:
+            value, patient_id = loader()
+
+        # 読み込み中に他の接続からコミットがあれば、バージョンと値が
+        # 対応しない可能性があるため保存しない
+        if patient_id is not None:
+            version = self._version(patient_id)
+            if self.manager.generation() == generation:
+                with self._lock:
+                    self._entries[key] = [patient_id, version, generation, value]
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        with self._lock:
+            self.misses += 1
+        return _detach(value)
+
+    def _version(self, patient_id):
+        """患者と全患者共通のバージョンの合計（どちらかが変われば値が変わる）"""
+        row = self.manager.get_connection().execute(
+            "SELECT COALESCE(SUM(version), 0) FROM patient_data_versions WHERE patient_id IN (?, ?)",
+            (ALL_PATIENTS, patient_id)
+        ).fetchone()
+        return row[0]
+
+    def clear(self):
+        """全エントリを削除"""
+        with self._lock:
+            self._entries.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_read_cache(db_path=None):
+    """データベースファイルごとに共有される読み取りキャッシュを取得"""
+    manager = get_connection_manager(db_path)
+    with _caches_lock:
+        cache = _caches.get(manager.db_path)
+        if cache is None:
+            cache = PatientReadCache(manager.db_path)
+            _caches[manager.db_path] = cache
+        return cache
+
+
+# テスト実行
+if __name__ == "__main__":
+    import time
+    from database.db_operations import BoneDensityDB
+
+    db = BoneDensityDB()  # マイグレーション適用
+    patient_ids = [row[0] for row in db.execute_query(
+        "SELECT patient_id FROM patient_measurement_summary LIMIT 20"
+    )]
+
+    for label in ("初回", "2回目"):
+        started = time.perf_counter()
+        for patient_id in patient_ids:
+            db.get_patient_summary(patient_id)
+            db.check_insurance_eligibility(patient_id, time.strftime('%Y-%m-%d'))
+            db.get_patient_measurements(patient_id)
+        print(f"{label}: {time.perf_counter() - started:.4f}秒 "
+              f"(ヒット {db.read_cache.hits} / ミス {db.read_cache.misses})")
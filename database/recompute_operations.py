@@ -0,0 +1,214 @@
+# database/recompute_operations.py
+# 基準値変更時の測定指標（YAM・T-score・診断）の一括再計算
+
+import json
+import os
+import sys
+import time
+import pandas as pd
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+from utils.calculations import BoneDensityCalculator
+from utils.reference_values import get_reference_registry
+
+
+class MetricsRecompute:
+    """measurements と vertebral_measurements の指標を主キー順のチャンクで再計算する
+
+    チャンクごとに一括計算（NumPy）で指標を求め、値が変わる行だけを
+    executemany で書き戻す。書き戻しと進捗（テーブル・処理済みの主キー・
+    基準値のバージョン）は同じトランザクションで job_watermarks に保存するため、
+    中断しても次回は続きから再開できる。
+    """
+
+    JOB_NAME = 'recompute_metrics'
+
+    # 1トランザクションで処理する行数
+    CHUNK_SIZE = 5000
+
+    # 処理順のテーブル
+    TABLES = ('measurements', 'vertebral_measurements')
+
+    # 完了時の進捗テーブル名
+    DONE = 'done'
+
+    def __init__(self, db_path=None):
+        self.manager = get_connection_manager(db_path)
+        self.db_path = self.manager.db_path
+
+    def get_checkpoint(self):
+        """前回の進捗（{'table', 'last_id', 'reference_version', ...}）を取得"""
+        row = self.manager.get_connection().execute(
+            "SELECT watermark FROM job_watermarks WHERE job_name = ?", (self.JOB_NAME,)
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def run(self, calculator=None, chunk_size=None, restart=False):
+        """指標を再計算
+
+        前回の実行が途中で終わっていて基準値のバージョンが同じなら続きから再開する。
+
+        Args:
+            calculator: BoneDensityCalculator（省略時は共有レジストリの基準値を使用）
+            chunk_size: 1トランザクションで処理する行数
+            restart: True なら進捗を無視して最初から再計算
+
+        Returns:
+            {'measurements': 処理した測定数, 'vertebral_measurements': 処理した椎体データ数,
+             'updated': 値が変わった行数, 'resumed': 再開したか, 'seconds': 所要時間,
+             'rows_per_second': 処理速度}（失敗時は None）
+        """
+        started = time.perf_counter()
+        try:
+            calculator = calculator or BoneDensityCalculator(get_reference_registry(self.db_path))
+            chunk_size = chunk_size or self.CHUNK_SIZE
+            version = calculator.refresh_reference_values().version
+
+            checkpoint = self.get_checkpoint()
+            resumed = (not restart and checkpoint is not None
+                       and checkpoint['table'] != self.DONE
+                       and checkpoint['reference_version'] == version)
+            if resumed:
+                table, last_id = checkpoint['table'], checkpoint['last_id']
+            else:
+                table, last_id = self.TABLES[0], 0
+
+            result = {'measurements': 0, 'vertebral_measurements': 0, 'updated': 0, 'resumed': resumed}
+            for current in self.TABLES[self.TABLES.index(table):]:
+                while True:
+                    scanned, updated, last_id = self._process_chunk(
+                        current, last_id, chunk_size, calculator, version
+                    )
+                    result[current] += scanned
+                    result['updated'] += updated
+                    if scanned < chunk_size:
+                        break
+                last_id = 0
+
+            seconds = time.perf_counter() - started
+            scanned = result['measurements'] + result['vertebral_measurements']
+            result['seconds'] = round(seconds, 3)
+            result['rows_per_second'] = round(scanned / seconds) if seconds > 0 else scanned
+
+            with self.manager.transaction() as conn:
+                self._save_checkpoint(conn, self.DONE, None, version, seconds,
+                                      f"rows={scanned}, updated={result['updated']}")
+            return result
+
+        except Exception as e:
+            print(f"測定指標再計算エラー: {e}")
+            return None
+
+    def _process_chunk(self, table, last_id, chunk_size, calculator, version):
+        """主キーが last_id より大きい chunk_size 行を再計算して書き戻す
+
+        Returns:
+            (読み込んだ行数, 更新した行数, 最後に処理した主キー)
+        """
+        with self.manager.transaction() as conn:
+            if table == 'measurements':
+                rows, updates = self._measurement_updates(conn, last_id, chunk_size, calculator)
+                conn.executemany('''
+                    UPDATE measurements
+                    SET femur_yam = ?, lumbar_yam = ?, femur_tscore = ?, lumbar_tscore = ?,
+                        femur_diagnosis = ?, lumbar_diagnosis = ?, overall_diagnosis = ?
+                    WHERE measurement_id = ?
+                ''', updates)
+            else:
+                rows, updates = self._vertebral_updates(conn, last_id, chunk_size, calculator)
+                conn.executemany('''
+                    UPDATE vertebral_measurements
+                    SET yam_percentage = ?, tscore = ?, diagnosis = ?, updated_date = CURRENT_TIMESTAMP
+                    WHERE vertebral_id = ?
+                ''', updates)
+
+            if rows:
+                last_id = rows[-1][0]
+            self._save_checkpoint(conn, table, last_id, version, None, None)
+
+        return len(rows), len(updates), last_id
+
+    def _measurement_updates(self, conn, last_id, chunk_size, calculator):
+        """測定データのチャンクを読み込み、値が変わる行の UPDATE パラメータを作成"""
+        rows = conn.execute('''
+            SELECT m.measurement_id, m.femur_bmd, m.lumbar_bmd, p.gender,
+                   m.femur_yam, m.lumbar_yam, m.femur_tscore, m.lumbar_tscore,
+                   m.femur_diagnosis, m.lumbar_diagnosis, m.overall_diagnosis
+            FROM measurements m
+            LEFT JOIN patients p ON m.patient_id = p.patient_id
+            WHERE m.measurement_id > ?
+            ORDER BY m.measurement_id
+            LIMIT ?
+        ''', (last_id, chunk_size)).fetchall()
+        if not rows:
+            return rows, []
+
+        df = pd.DataFrame(rows, columns=[
+            'measurement_id', 'femur_bmd', 'lumbar_bmd', 'gender',
+            'femur_yam', 'lumbar_yam', 'femur_tscore', 'lumbar_tscore',
+            'femur_diagnosis', 'lumbar_diagnosis', 'overall_diagnosis'
+        ])
+        metrics = calculator.calculate_all_metrics_batch(df['femur_bmd'], df['lumbar_bmd'], df['gender'])
+        metrics = metrics[['femur_yam', 'lumbar_yam', 'femur_tscore', 'lumbar_tscore',
+                           'femur_diagnosis', 'lumbar_diagnosis', 'overall_diagnosis']]
+        return rows, self._changed_rows(rows, 4, metrics, df['measurement_id'])
+
+    def _vertebral_updates(self, conn, last_id, chunk_size, calculator):
+        """椎体別データのチャンクを読み込み、値が変わる行の UPDATE パラメータを作成"""
+        rows = conn.execute('''
+            SELECT v.vertebral_id, v.bmd_value, p.gender, v.yam_percentage, v.tscore, v.diagnosis
+            FROM vertebral_measurements v
+            LEFT JOIN measurements m ON v.measurement_id = m.measurement_id
+            LEFT JOIN patients p ON m.patient_id = p.patient_id
+            WHERE v.vertebral_id > ?
+            ORDER BY v.vertebral_id
+            LIMIT ?
+        ''', (last_id, chunk_size)).fetchall()
+        if not rows:
+            return rows, []
+
+        df = pd.DataFrame(rows, columns=['vertebral_id', 'bmd_value', 'gender',
+                                         'yam_percentage', 'tscore', 'diagnosis'])
+        # 椎体は腰椎の基準値で計算（VertebralCalculator と同じ）
+        metrics = calculator.calculate_metrics_batch(df['bmd_value'], 'lumbar', df['gender'])
+        return rows, self._changed_rows(rows, 3, metrics, df['vertebral_id'])
+
+    @staticmethod
+    def _changed_rows(rows, stored_from, metrics, ids):
+        """再計算した値が保存値と異なる行だけ (値..., 主キー) のタプルにする
+
+        Args:
+            rows: 読み込んだ行（stored_from 列目以降が metrics と同じ順の保存値）
+            metrics: 再計算した値のDataFrame（欠損は NULL として書き戻す）
+        """
+        values = metrics.astype(object).where(metrics.notna(), None)
+        updates = []
+        for row, new_values, row_id in zip(rows, values.itertuples(index=False, name=None), ids.tolist()):
+            if tuple(row[stored_from:]) != new_values:
+                updates.append(new_values + (row_id,))
+        return updates
+
+    def _save_checkpoint(self, conn, table, last_id, version, seconds, notes):
+        """進捗を job_watermarks に保存（呼び出し元のトランザクション内で実行）"""
+        watermark = json.dumps({'table': table, 'last_id': last_id, 'reference_version': version})
+        conn.execute('''
+            INSERT INTO job_watermarks (job_name, watermark, last_run_date, last_run_seconds, notes)
+            VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?)
+            ON CONFLICT(job_name) DO UPDATE SET
+                watermark = excluded.watermark,
+                last_run_date = excluded.last_run_date,
+                last_run_seconds = COALESCE(excluded.last_run_seconds, last_run_seconds),
+                notes = COALESCE(excluded.notes, notes)
+        ''', (self.JOB_NAME, watermark, None if seconds is None else round(seconds, 3), notes))
+
+
+# テスト実行
+if __name__ == "__main__":
+    from database.db_operations import BoneDensityDB
+
+    BoneDensityDB()  # マイグレーション適用
+    recompute = MetricsRecompute()
+    print(f"測定指標再計算: {recompute.run(restart='--restart' in sys.argv[1:])}")
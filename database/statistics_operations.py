@@ -0,0 +1,300 @@
+# database/statistics_operations.py
+# 統計サマリー（statistics_summary）の増分集計
+
+import json
+import os
+import sys
+import time
+import pandas as pd
+from datetime import date
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+
+
+class StatisticsRollup:
+    """日別・月別の統計サマリーを statistics_summary に増分集計する
+
+    前回実行時刻（UTC）をウォーターマークとして job_watermarks に保存し、
+    それ以降に登録・更新された患者・継続受診予定と、トリガーが
+    statistics_dirty_days に記録した測定の変更（登録・修正・削除）が
+    属する期間だけを再集計して UPSERT する。
+    """
+
+    JOB_NAME = 'statistics_summary'
+
+    # created_date には現地時刻とUTCが混在するため、ウォーターマークから
+    # この時間だけ遡って変更を拾う（再集計は冪等）
+    WATERMARK_OVERLAP = '-1 day'
+
+    # サマリー種別 -> (日付式から期間キーを作るSQL, 期間の長さ)
+    SUMMARY_TYPES = {
+        'daily': ("date({})", '+1 day'),
+        'monthly': ("strftime('%Y-%m-01', {})", '+1 month'),
+    }
+
+    def __init__(self, db_path=None):
+        self.manager = get_connection_manager(db_path)
+        self.db_path = self.manager.db_path
+
+    def get_watermark(self):
+        """前回集計時のウォーターマーク（UTC）を取得"""
+        row = self.manager.get_connection().execute(
+            "SELECT watermark FROM job_watermarks WHERE job_name = ?", (self.JOB_NAME,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def refresh(self, full=False):
+        """統計サマリーを更新
+
+        Args:
+            full: True なら全期間を再集計（削除された患者・予定を反映する場合など）
+
+        Returns:
+            {'days': 再集計した日数, 'months': 再集計した月数, 'full': 全件集計か,
+             'watermark': 新しいウォーターマーク}（失敗時は None）
+        """
+        started = time.perf_counter()
+        try:
+            with self.manager.transaction() as conn:
+                new_watermark = conn.execute("SELECT datetime('now')").fetchone()[0]
+                since = None if full else self.get_watermark()
+
+                self._collect_dirty_days(conn, since)
+                days = conn.execute("SELECT COUNT(*) FROM temp.rollup_dirty_days").fetchone()[0]
+                months = conn.execute(
+                    "SELECT COUNT(DISTINCT strftime('%Y-%m-01', day)) FROM temp.rollup_dirty_days"
+                ).fetchone()[0]
+
+                for summary_type in self.SUMMARY_TYPES:
+                    self._upsert_summaries(conn, summary_type)
+
+                conn.execute('''
+                    INSERT INTO job_watermarks (job_name, watermark, last_run_date, last_run_seconds, notes)
+                    VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?)
+                    ON CONFLICT(job_name) DO UPDATE SET
+                        watermark = excluded.watermark,
+                        last_run_date = excluded.last_run_date,
+                        last_run_seconds = excluded.last_run_seconds,
+                        notes = excluded.notes
+                ''', (self.JOB_NAME, new_watermark, round(time.perf_counter() - started, 3),
+                      f"days={days}, months={months}, full={since is None}"))
+                conn.execute("DROP TABLE temp.rollup_dirty_days")
+
+            return {'days': days, 'months': months, 'full': since is None, 'watermark': new_watermark}
+
+        except Exception as e:
+            print(f"統計サマリー更新エラー: {e}")
+            return None
+
+    def _collect_dirty_days(self, conn, since):
+        """再集計が必要な日を一時テーブル rollup_dirty_days に集める"""
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_dirty_days (day TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.rollup_dirty_days")
+
+        # 測定の登録・修正・削除でトリガーが記録した日（全期間の場合も読み捨てる）
+        conn.execute('''
+            INSERT OR IGNORE INTO temp.rollup_dirty_days (day)
+            SELECT day FROM statistics_dirty_days
+        ''')
+        conn.execute("DELETE FROM statistics_dirty_days")
+
+        if since is None:
+            # 全期間: 既存の日別・月別サマリーを作り直す
+            conn.execute("DELETE FROM statistics_summary WHERE summary_type IN ('daily', 'monthly')")
+            # 測定・患者登録・予定のあるすべての日
+            conn.execute('''
+                INSERT OR IGNORE INTO temp.rollup_dirty_days (day)
+                SELECT date(measurement_date) FROM measurements WHERE measurement_date IS NOT NULL
+                UNION SELECT date(created_date) FROM patients WHERE created_date IS NOT NULL
+                UNION SELECT date(scheduled_date) FROM follow_up_schedule WHERE scheduled_date IS NOT NULL
+            ''')
+            return
+
+        params = {'since': since, 'overlap': self.WATERMARK_OVERLAP}
+
+        # 登録・状態変更された予定の予定日
+        conn.execute('''
+            INSERT OR IGNORE INTO temp.rollup_dirty_days (day)
+            SELECT date(scheduled_date) FROM follow_up_schedule
+            WHERE updated_date > datetime(:since, :overlap)
+               OR created_date > datetime(:since, :overlap)
+        ''', params)
+
+        # 前回集計以降に予定日を過ぎ、未受診（missed_appointments）に数えられるようになった予定の予定日
+        conn.execute('''
+            INSERT OR IGNORE INTO temp.rollup_dirty_days (day)
+            SELECT DISTINCT date(scheduled_date) FROM follow_up_schedule
+            WHERE status = '予定'
+              AND scheduled_date >= date(:since, :overlap)
+              AND scheduled_date <= :today
+        ''', {**params, 'today': date.today().isoformat()})
+
+        # 新規患者の登録日と、累計患者数が変わるそれ以降の集計済みの日
+        conn.execute('''
+            INSERT OR IGNORE INTO temp.rollup_dirty_days (day)
+            WITH first_new AS (
+                SELECT MIN(date(created_date)) AS day FROM patients
+                WHERE created_date > datetime(:since, :overlap)
+            )
+            SELECT day FROM first_new WHERE day IS NOT NULL
+            UNION
+            SELECT s.summary_date FROM statistics_summary s, first_new f
+            WHERE s.summary_type = 'daily' AND s.summary_date >= f.day
+        ''', params)
+
+        conn.execute("DELETE FROM temp.rollup_dirty_days WHERE day IS NULL")
+
+    def _upsert_summaries(self, conn, summary_type):
+        """再集計対象の期間のサマリーを計算して UPSERT"""
+        bucket_sql, period = self.SUMMARY_TYPES[summary_type]
+        query = f'''
+            WITH buckets AS (
+                SELECT DISTINCT {bucket_sql.format('day')} AS bucket_start,
+                       date({bucket_sql.format('day')}, '{period}') AS bucket_end
+                FROM temp.rollup_dirty_days
+            ),
+            bucket_measurements AS (
+                SELECT b.bucket_start, m.measurement_id, m.patient_id
+                FROM buckets b
+                JOIN measurements m
+                  ON m.measurement_date >= b.bucket_start AND m.measurement_date < b.bucket_end
+            ),
+            -- 対象期間に測定のある患者だけ前回値を求める
+            patient_history AS (
+                SELECT measurement_id, overall_diagnosis,
+                       NULLIF(lumbar_bmd, 0) AS lumbar_bmd,
+                       NULLIF(femur_bmd, 0) AS femur_bmd,
+                       LAG(NULLIF(lumbar_bmd, 0)) OVER w AS prev_lumbar_bmd,
+                       LAG(NULLIF(femur_bmd, 0)) OVER w AS prev_femur_bmd
+                FROM measurements
+                WHERE patient_id IN (SELECT patient_id FROM bucket_measurements)
+                WINDOW w AS (PARTITION BY patient_id ORDER BY measurement_date, measurement_id)
+            ),
+            measurement_stats AS (
+                SELECT bm.bucket_start,
+                       COUNT(*) AS measurement_count,
+                       COUNT(DISTINCT bm.patient_id) AS active_patients,
+                       AVG(h.lumbar_bmd) AS average_bmd_lumbar,
+                       AVG(h.femur_bmd) AS average_bmd_femur,
+                       -- 腰椎を優先し、腰椎が比較できない場合は大腿骨で前回値と比較
+                       SUM(COALESCE(h.lumbar_bmd - h.prev_lumbar_bmd, h.femur_bmd - h.prev_femur_bmd) > 0) AS improvement_cases,
+                       SUM(COALESCE(h.lumbar_bmd - h.prev_lumbar_bmd, h.femur_bmd - h.prev_femur_bmd) < 0) AS deterioration_cases,
+                       SUM(h.overall_diagnosis = '正常') AS diagnosis_normal,
+                       SUM(h.overall_diagnosis = '骨量減少') AS diagnosis_osteopenia,
+                       SUM(h.overall_diagnosis = '骨粗鬆症') AS diagnosis_osteoporosis
+                FROM bucket_measurements bm
+                JOIN patient_history h ON h.measurement_id = bm.measurement_id
+                GROUP BY bm.bucket_start
+            ),
+            schedule_stats AS (
+                SELECT b.bucket_start,
+                       COUNT(*) AS scheduled,
+                       SUM(f.status = '済') AS completed,
+                       SUM(f.status = '予定' AND f.scheduled_date < :today) AS missed
+                FROM buckets b
+                JOIN follow_up_schedule f
+                  ON f.scheduled_date >= b.bucket_start AND f.scheduled_date < b.bucket_end
+                GROUP BY b.bucket_start
+            )
+            INSERT INTO statistics_summary (
+                summary_date, summary_type, total_patients, new_patients, active_patients,
+                missed_appointments, completion_rate, average_bmd_lumbar, average_bmd_femur,
+                improvement_cases, deterioration_cases, statistics_data, created_date
+            )
+            SELECT b.bucket_start, :summary_type,
+                   (SELECT COUNT(*) FROM patients p WHERE p.created_date < b.bucket_end),
+                   (SELECT COUNT(*) FROM patients p
+                    WHERE p.created_date >= b.bucket_start AND p.created_date < b.bucket_end),
+                   COALESCE(ms.active_patients, 0),
+                   COALESCE(ss.missed, 0),
+                   CASE WHEN ss.scheduled > 0 THEN ROUND(ss.completed * 100.0 / ss.scheduled, 1) END,
+                   ROUND(ms.average_bmd_lumbar, 3),
+                   ROUND(ms.average_bmd_femur, 3),
+                   COALESCE(ms.improvement_cases, 0),
+                   COALESCE(ms.deterioration_cases, 0),
+                   json_object(
+                       'measurements', COALESCE(ms.measurement_count, 0),
+                       'scheduled', COALESCE(ss.scheduled, 0),
+                       'completed', COALESCE(ss.completed, 0),
+                       'diagnosis_counts', json_object(
+                           '正常', COALESCE(ms.diagnosis_normal, 0),
+                           '骨量減少', COALESCE(ms.diagnosis_osteopenia, 0),
+                           '骨粗鬆症', COALESCE(ms.diagnosis_osteoporosis, 0)
+                       )
+                   ),
+                   CURRENT_TIMESTAMP
+            FROM buckets b
+            LEFT JOIN measurement_stats ms ON ms.bucket_start = b.bucket_start
+            LEFT JOIN schedule_stats ss ON ss.bucket_start = b.bucket_start
+            WHERE true
+            ON CONFLICT(summary_date, summary_type) DO UPDATE SET
+                total_patients = excluded.total_patients,
+                new_patients = excluded.new_patients,
+                active_patients = excluded.active_patients,
+                missed_appointments = excluded.missed_appointments,
+                completion_rate = excluded.completion_rate,
+                average_bmd_lumbar = excluded.average_bmd_lumbar,
+                average_bmd_femur = excluded.average_bmd_femur,
+                improvement_cases = excluded.improvement_cases,
+                deterioration_cases = excluded.deterioration_cases,
+                statistics_data = excluded.statistics_data,
+                created_date = excluded.created_date
+        '''
+        conn.execute(query, {'today': date.today(), 'summary_type': summary_type})
+
+        # 測定の修正・削除で測定・患者登録・予定がすべて無くなった期間は削除（全期間の集計と同じ）
+        conn.execute(f'''
+            DELETE FROM statistics_summary
+            WHERE summary_type = :summary_type
+              AND summary_date IN (SELECT {bucket_sql.format('day')} FROM temp.rollup_dirty_days)
+              AND NOT EXISTS (
+                  SELECT 1 FROM measurements m
+                  WHERE m.measurement_date >= statistics_summary.summary_date
+                    AND m.measurement_date < date(statistics_summary.summary_date, '{period}'))
+              AND NOT EXISTS (
+                  SELECT 1 FROM patients p
+                  WHERE p.created_date >= statistics_summary.summary_date
+                    AND p.created_date < date(statistics_summary.summary_date, '{period}'))
+              AND NOT EXISTS (
+                  SELECT 1 FROM follow_up_schedule f
+                  WHERE f.scheduled_date >= statistics_summary.summary_date
+                    AND f.scheduled_date < date(statistics_summary.summary_date, '{period}'))
+        ''', {'summary_type': summary_type})
+
+    def get_summaries(self, summary_type='monthly', start_date=None, end_date=None):
+        """集計済みの統計サマリーを期間順に取得"""
+        columns = ['summary_date', 'total_patients', 'new_patients', 'active_patients',
+                   'missed_appointments', 'completion_rate', 'average_bmd_lumbar',
+                   'average_bmd_femur', 'improvement_cases', 'deterioration_cases', 'statistics_data']
+        try:
+            query = f'''
+            SELECT {', '.join(columns)}
+            FROM statistics_summary
+            WHERE summary_type = ?
+              AND summary_date >= COALESCE(?, '0000-00-00')
+              AND summary_date <= COALESCE(?, '9999-12-31')
+            ORDER BY summary_date
+            '''
+            rows = self.manager.get_connection().execute(query, (summary_type, start_date, end_date)).fetchall()
+
+            df = pd.DataFrame(rows, columns=columns)
+            df['statistics_data'] = [json.loads(data) if data else {} for data in df['statistics_data']]
+            return df
+
+        except Exception as e:
+            print(f"統計サマリー取得エラー: {e}")
+            return pd.DataFrame(columns=columns)
+
+
+# テスト実行
+if __name__ == "__main__":
+    from database.db_operations import BoneDensityDB
+
+    BoneDensityDB()  # マイグレーション適用
+    rollup = StatisticsRollup()
+    full = '--full' in sys.argv[1:]
+    print(f"統計サマリー更新: {rollup.refresh(full=full)}")
+    print(rollup.get_summaries('monthly').tail(12).to_string())
@@ -0,0 +1,218 @@
+# database/trend_operations.py
+# 患者・部位別の骨密度推移（回帰直線・最小有意変化）のキャッシュ
+
+import json
+import os
+import sys
+import threading
+import time
+import pandas as pd
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+from utils.trend_analysis import TREND_SITES, compute_patient_trends
+
+# refresh_if_stale で確認済みのデータ世代番号（データベースファイルごと・プロセス共通）
+_checked_generations = {}
+_checked_generations_lock = threading.Lock()
+
+
+class BmdTrends:
+    """患者ごとの全測定から求めた骨密度推移を bmd_trends に保存する
+
+    推移は utils.trend_analysis でコホート単位に一括計算し、計算時の
+    最新測定IDと測定回数を bmd_trend_patients に記録する。refresh は
+    patient_measurement_summary と比べて値が変わった患者だけを再計算する。
+    過去の測定値だけを修正した場合は refresh(full=True) で作り直す。
+    """
+
+    # 1トランザクションで再計算する患者数
+    CHUNK_SIZE = 2000
+
+    COLUMNS = ['patient_id', 'site', 'measurement_count', 'first_date', 'last_date',
+               'span_years', 'slope_per_year', 'percent_per_year', 'total_change_percent',
+               'residual_sd', 'lsc_percent', 'trend']
+
+    def __init__(self, db_path=None):
+        self.manager = get_connection_manager(db_path)
+        self.db_path = self.manager.db_path
+
+    def refresh(self, full=False, patient_ids=None, chunk_size=None):
+        """推移を更新
+
+        Args:
+            full: True なら全患者を再計算
+            patient_ids: 対象患者のIDリスト（省略時は全患者から変更のあった患者）
+            chunk_size: 1トランザクションで再計算する患者数
+
+        Returns:
+            {'patients': 再計算した患者数, 'trends': 保存した推移の数, 'seconds': 所要時間}
+            （失敗時は None）
+        """
+        started = time.perf_counter()
+        try:
+            chunk_size = chunk_size or self.CHUNK_SIZE
+            conn = self.manager.get_connection()
+
+            if patient_ids is None and self._has_orphans(conn):
+                # 測定がすべて削除された患者の推移を削除
+                with self.manager.transaction() as conn:
+                    conn.execute('''
+                        DELETE FROM bmd_trends
+                        WHERE patient_id NOT IN (SELECT patient_id FROM patient_measurement_summary)
+                    ''')
+                    conn.execute('''
+                        DELETE FROM bmd_trend_patients
+                        WHERE patient_id NOT IN (SELECT patient_id FROM patient_measurement_summary)
+                    ''')
+
+            targets = self._stale_patients(conn, full, patient_ids)
+            trends = 0
+            for start in range(0, len(targets), chunk_size):
+                trends += self._refresh_chunk(targets[start:start + chunk_size])
+
+            return {'patients': len(targets), 'trends': trends,
+                    'seconds': round(time.perf_counter() - started, 3)}
+
+        except Exception as e:
+            print(f"骨密度推移更新エラー: {e}")
+            return None
+
+    def refresh_if_stale(self):
+        """前回の確認以降にデータが変わっていれば、変更のあった患者の推移を更新
+
+        確認済みの世代番号はプロセス共通で保持するため、ページ表示のたびに
+        インスタンスを作っても、変更がなければ読み取りだけで終わる
+        （再計算が必要な患者がいなければ書き込みもしない）。
+        """
+        generation = self.manager.generation()
+        with _checked_generations_lock:
+            if _checked_generations.get(self.db_path) == generation:
+                return None
+        result = self.refresh()
+        if result is not None:
+            with _checked_generations_lock:
+                _checked_generations[self.db_path] = self.manager.generation()
+        return result
+
+    def _has_orphans(self, conn):
+        """測定がすべて削除された患者の推移が残っているか"""
+        return conn.execute('''
+            SELECT EXISTS (
+                SELECT 1 FROM bmd_trend_patients
+                WHERE patient_id NOT IN (SELECT patient_id FROM patient_measurement_summary)
+            ) OR EXISTS (
+                SELECT 1 FROM bmd_trends
+                WHERE patient_id NOT IN (SELECT patient_id FROM patient_measurement_summary)
+            )
+        ''').fetchone()[0]
+
+    def _stale_patients(self, conn, full, patient_ids):
+        """最新測定ID・測定回数が前回計算時と異なる患者のIDリスト"""
+        patients = None if patient_ids is None else json.dumps([int(pid) for pid in patient_ids])
+        rows = conn.execute('''
+            SELECT s.patient_id
+            FROM patient_measurement_summary s
+            LEFT JOIN bmd_trend_patients t ON t.patient_id = s.patient_id
+            WHERE (:patients IS NULL OR s.patient_id IN (SELECT value FROM json_each(:patients)))
+              AND (:full OR t.patient_id IS NULL
+                   OR t.last_measurement_id IS NOT s.last_measurement_id
+                   OR t.measurement_count != s.measurement_count)
+            ORDER BY s.patient_id
+        ''', {'patients': patients, 'full': 1 if full else 0}).fetchall()
+        return [row[0] for row in rows]
+
+    def _refresh_chunk(self, patient_ids):
+        """患者の全測定を読み込んで推移を一括計算し、置き換える（読み込みから保存まで1トランザクション）"""
+        patients = json.dumps(patient_ids)
+        with self.manager.transaction() as conn:
+            measurements = pd.DataFrame(conn.execute('''
+                SELECT m.patient_id, m.measurement_date, m.femur_bmd, m.lumbar_bmd
+                FROM measurements m
+                WHERE m.patient_id IN (SELECT value FROM json_each(?))
+            ''', (patients,)).fetchall(), columns=['patient_id', 'measurement_date', 'femur_bmd', 'lumbar_bmd'])
+            vertebral = pd.DataFrame(conn.execute('''
+                SELECT m.patient_id, m.measurement_date, v.vertebra_level, v.bmd_value
+                FROM vertebral_measurements v
+                JOIN measurements m ON m.measurement_id = v.measurement_id
+                WHERE m.patient_id IN (SELECT value FROM json_each(?))
+            ''', (patients,)).fetchall(), columns=['patient_id', 'measurement_date', 'vertebra_level', 'bmd_value'])
+
+            trends = compute_patient_trends(measurements, vertebral)
+            values = trends[self.COLUMNS].astype(object)
+            values = values.where(trends[self.COLUMNS].notna(), None)
+
+            conn.execute("DELETE FROM bmd_trends WHERE patient_id IN (SELECT value FROM json_each(?))",
+                         (patients,))
+            conn.executemany(f'''
+                INSERT INTO bmd_trends ({', '.join(self.COLUMNS)})
+                VALUES ({', '.join('?' * len(self.COLUMNS))})
+            ''', values.itertuples(index=False, name=None))
+            conn.execute('''
+                INSERT OR REPLACE INTO bmd_trend_patients (patient_id, last_measurement_id, measurement_count)
+                SELECT patient_id, last_measurement_id, measurement_count
+                FROM patient_measurement_summary
+                WHERE patient_id IN (SELECT value FROM json_each(?))
+            ''', (patients,))
+        return len(trends)
+
+    def get_patient_trends(self, patient_id):
+        """患者の部位別の推移（腰椎・大腿骨・L1〜L4 の順）
+
+        新しい測定があれば、その患者の分だけを再計算してから返す。
+        """
+        try:
+            self.refresh(patient_ids=[patient_id])
+            site_order = ' '.join(f"WHEN '{site}' THEN {i}" for i, site in enumerate(TREND_SITES))
+            rows = self.manager.get_connection().execute(f'''
+                SELECT {', '.join(self.COLUMNS)}
+                FROM bmd_trends
+                WHERE patient_id = ?
+                ORDER BY CASE site {site_order} END
+            ''', (patient_id,)).fetchall()
+            return pd.DataFrame(rows, columns=self.COLUMNS)
+
+        except Exception as e:
+            print(f"患者推移取得エラー: {e}")
+            return pd.DataFrame(columns=self.COLUMNS)
+
+    def get_trend_worklist(self, site='lumbar', trend='悪化', limit=None):
+        """推移の傾向が trend の患者一覧（悪化は年間変化率の低い順、それ以外は高い順）
+
+        Args:
+            site: 部位（'lumbar' / 'femur' / 'L1'〜'L4'）
+            trend: '改善' / '安定' / '悪化'
+            limit: 取得件数（None なら全件）
+        """
+        columns = ['name_kanji', 'name_kana', 'gender', 'last_measurement_date'] + self.COLUMNS
+        try:
+            self.refresh_if_stale()
+            rows = self.manager.get_connection().execute(f'''
+                SELECT pt.name_kanji, pt.name_kana, pt.gender, s.last_measurement_date,
+                       {', '.join('t.' + column for column in self.COLUMNS)}
+                FROM bmd_trends t
+                JOIN patients pt ON pt.patient_id = t.patient_id
+                LEFT JOIN patient_measurement_summary s ON s.patient_id = t.patient_id
+                WHERE t.site = ? AND t.trend = ?
+                ORDER BY t.percent_per_year {'ASC' if trend == '悪化' else 'DESC'}
+                LIMIT ?
+            ''', (site, trend, -1 if limit is None else int(limit))).fetchall()
+            return pd.DataFrame(rows, columns=columns)
+
+        except Exception as e:
+            print(f"推移ワークリスト取得エラー: {e}")
+            return pd.DataFrame(columns=columns)
+
+
+# テスト実行
+if __name__ == "__main__":
+    from database.db_operations import BoneDensityDB
+
+    BoneDensityDB()  # マイグレーション適用
+    trends = BmdTrends()
+    print(f"骨密度推移更新: {trends.refresh(full='--full' in sys.argv[1:])}")
+    print(f"差分更新（変更なし）: {trends.refresh()}")
+    print(trends.get_trend_worklist(limit=10)[['name_kanji', 'measurement_count', 'span_years',
+                                                'percent_per_year', 'total_change_percent', 'lsc_percent']])
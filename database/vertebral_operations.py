@@ -2,159 +2,341 @@
 # 椎体別データ操作ヘルパー関数
 
 import sqlite3
+import json
 import os
+import sys
+import numpy as np
+import pandas as pd
 from typing import List, Dict, Optional, Tuple
 
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+from database.read_cache import get_read_cache
+from utils.vertebral_analysis import (
+    VERTEBRA_LEVELS, analyze_vertebral_matrix, analyze_vertebral_records, build_vertebral_matrix
+)
+
+# (測定ID, 椎体) の一意インデックスへの UPSERT
+_VERTEBRAL_UPSERT_SQL = """
+    INSERT INTO vertebral_measurements
+    (measurement_id, vertebra_level, bmd_value, tscore, yam_percentage, diagnosis, notes)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(measurement_id, vertebra_level) DO UPDATE SET
+        bmd_value = excluded.bmd_value,
+        tscore = excluded.tscore,
+        yam_percentage = excluded.yam_percentage,
+        diagnosis = excluded.diagnosis,
+        notes = excluded.notes,
+        updated_date = CURRENT_TIMESTAMP
+"""
+
+# 他院データ統合の椎体別BMD項目（列名 → 椎体）
+VERTEBRAL_IMPORT_COLUMNS = {f'l{i}_bmd': level for i, level in enumerate(VERTEBRA_LEVELS, start=1)}
+
+
+def upsert_vertebral_rows(conn, rows: List[Tuple]) -> None:
+    """複数測定分の椎体別データを1文の executemany で保存（コミットは呼び出し元で行う）
+
+    Args:
+        rows: (measurement_id, vertebra_level, bmd_value, tscore, yam_percentage,
+               diagnosis, notes) のタプル。既存の (測定ID, 椎体) は値を更新する。
+    """
+    conn.executemany(_VERTEBRAL_UPSERT_SQL, rows)
+
+
+def write_vertebral_rows(conn, measurement_id: int, vertebral_data: List[Dict]) -> None:
+    """1測定分の椎体別データを書き込む（コミットは呼び出し元のトランザクションで行う）
+
+    渡されなかった椎体の既存データは削除する。
+    """
+    upsert_vertebral_rows(conn, [
+        (
+            measurement_id,
+            data['vertebra_level'],
+            data['bmd_value'],
+            data.get('tscore'),
+            data.get('yam_percentage'),
+            data.get('diagnosis'),
+            data.get('notes', '')
+        )
+        for data in vertebral_data
+    ])
+    conn.execute("""
+        DELETE FROM vertebral_measurements
+        WHERE measurement_id = ?
+          AND vertebra_level NOT IN (SELECT value FROM json_each(?))
+    """, (measurement_id, json.dumps([data['vertebra_level'] for data in vertebral_data])))
+
+
+def vertebral_rows_from_columns(measurement_ids, bmd_columns: pd.DataFrame, genders, calculator) -> List[Tuple]:
+    """測定ごとの l1_bmd〜l4_bmd 列を upsert_vertebral_rows 用のタプルに変換
+
+    YAM・T-score・診断は腰椎の基準値で一括計算する（VertebralCalculator と同じ）。
+    列が無い・欠損・0以下の椎体は行を作らない。
+
+    Args:
+        measurement_ids: 各行の測定ID
+        bmd_columns: l1_bmd〜l4_bmd 列を持つDataFrame（行は measurement_ids と同じ順）
+        genders: 各行の性別
+        calculator: BoneDensityCalculator
+    """
+    bmd = bmd_columns.reindex(columns=list(VERTEBRAL_IMPORT_COLUMNS)).apply(
+        pd.to_numeric, errors='coerce'
+    ).to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        rows, columns = np.nonzero(bmd > 0)
+    if len(rows) == 0:
+        return []
+
+    values = bmd[rows, columns]
+    metrics = calculator.calculate_metrics_batch(values, 'lumbar', np.asarray(genders, dtype=object)[rows])
+    metrics = metrics.astype(object).where(metrics.notna(), None)
+    return list(zip(
+        np.asarray(measurement_ids, dtype=np.int64)[rows].tolist(),
+        np.array(VERTEBRA_LEVELS, dtype=object)[columns].tolist(),
+        values.tolist(),
+        metrics['tscore'].tolist(),
+        metrics['yam'].tolist(),
+        metrics['diagnosis'].tolist(),
+        [''] * len(rows)
+    ))
+
 class VertebralMeasurementDB:
-    def __init__(self):
-        self.db_path = os.path.join('data', 'bone_density.db')
+    def __init__(self, db_path: Optional[str] = None):
+        self.manager = get_connection_manager(db_path)
+        self.db_path = self.manager.db_path
+        # BoneDensityDB と共有する患者単位の読み取りキャッシュ
+        self.read_cache = get_read_cache(self.db_path)
     
     def add_vertebral_measurements(self, measurement_id: int, vertebral_data: List[Dict]) -> bool:
         """椎体別測定データを追加"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 既存データの削除（更新の場合）
-            cursor.execute("""
-                DELETE FROM vertebral_measurements 
-                WHERE measurement_id = ?
-            """, (measurement_id,))
-            
-            # 新しいデータの挿入
-            for data in vertebral_data:
-                cursor.execute("""
-                    INSERT INTO vertebral_measurements 
-                    (measurement_id, vertebra_level, bmd_value, tscore, yam_percentage, diagnosis, notes)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    measurement_id,
-                    data['vertebra_level'],
-                    data['bmd_value'],
-                    data.get('tscore'),
-                    data.get('yam_percentage'),
-                    data.get('diagnosis'),
-                    data.get('notes', '')
-                ))
-            
-            conn.commit()
-            conn.close()
+            with self.manager.transaction() as conn:
+                write_vertebral_rows(conn, measurement_id, vertebral_data)
             return True
             
         except Exception as e:
             print(f"椎体別データ追加エラー: {e}")
             return False
     
-    def get_vertebral_measurements(self, measurement_id: int) -> List[Dict]:
-        """測定IDから椎体別データを取得"""
+    # 一括保存で1トランザクションにまとめる行数
+    BULK_CHUNK_SIZE = 5000
+    
+    def add_vertebral_measurements_bulk(self, vertebral_df: pd.DataFrame, chunk_size: Optional[int] = None) -> Optional[int]:
+        """複数測定分の椎体別データを一括保存
+        
+        Args:
+            vertebral_df: measurement_id, vertebra_level, bmd_value 列
+                          （tscore, yam_percentage, diagnosis, notes は任意）
+            chunk_size: 1トランザクションで保存する行数
+        
+        Returns:
+            保存した行数（失敗時は None）。既存の (測定ID, 椎体) は値を更新する。
+        """
+        columns = ['measurement_id', 'vertebra_level', 'bmd_value', 'tscore',
+                   'yam_percentage', 'diagnosis', 'notes']
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        saved = 0
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            if vertebral_df is None or vertebral_df.empty:
+                return 0
             
-            cursor.execute("""
-                SELECT vertebral_id, vertebra_level, bmd_value, tscore, 
-                       yam_percentage, diagnosis, notes, created_date
-                FROM vertebral_measurements 
-                WHERE measurement_id = ?
-                ORDER BY 
-                    CASE vertebra_level 
-                        WHEN 'L1' THEN 1 
-                        WHEN 'L2' THEN 2 
-                        WHEN 'L3' THEN 3 
-                        WHEN 'L4' THEN 4 
-                    END
-            """, (measurement_id,))
+            df = vertebral_df.reindex(columns=columns)
+            df['measurement_id'] = df['measurement_id'].astype(int)
+            df['notes'] = df['notes'].fillna('')
+            # NaN は NULL として保存する
+            rows = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
             
-            results = []
-            for row in cursor.fetchall():
-                results.append({
-                    'vertebral_id': row[0],
-                    'vertebra_level': row[1],
-                    'bmd_value': row[2],
-                    'tscore': row[3],
-                    'yam_percentage': row[4],
-                    'diagnosis': row[5],
-                    'notes': row[6],
-                    'created_date': row[7]
-                })
+            for start in range(0, len(rows), chunk_size):
+                with self.manager.transaction() as conn:
+                    upsert_vertebral_rows(conn, rows[start:start + chunk_size])
+                saved += len(rows[start:start + chunk_size])
+            return saved
             
-            conn.close()
-            return results
+        except Exception as e:
+            print(f"椎体別データ一括保存エラー: {e}（保存済み: {saved}件）")
+            return None
+    
+    def get_vertebral_measurements(self, measurement_id: int) -> List[Dict]:
+        """測定IDから椎体別データを取得（患者のデータが変わるまで読み取りキャッシュから返す）"""
+        try:
+            measurement_id = int(measurement_id)
+            return self.read_cache.get_or_load(
+                'vertebral_measurements', (measurement_id,),
+                lambda: self._load_vertebral_measurements(measurement_id)
+            )
             
         except Exception as e:
             print(f"椎体別データ取得エラー: {e}")
             return []
     
+    def _load_vertebral_measurements(self, measurement_id: int) -> Tuple[List[Dict], Optional[int]]:
+        """椎体別データを読み込み（戻り値は (データ, 測定の患者ID)）"""
+        conn = self.manager.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT vm.vertebral_id, vm.vertebra_level, vm.bmd_value, vm.tscore, 
+                   vm.yam_percentage, vm.diagnosis, vm.notes, vm.created_date, m.patient_id
+            FROM measurements m
+            LEFT JOIN vertebral_measurements vm ON vm.measurement_id = m.measurement_id
+            WHERE m.measurement_id = ?
+            ORDER BY 
+                CASE vm.vertebra_level 
+                    WHEN 'L1' THEN 1 
+                    WHEN 'L2' THEN 2 
+                    WHEN 'L3' THEN 3 
+                    WHEN 'L4' THEN 4 
+                END
+        """, (measurement_id,))
+        
+        # 椎体別データが無い測定も患者IDは取得する（空の結果もキャッシュするため）
+        results = []
+        patient_id = None
+        for row in cursor.fetchall():
+            patient_id = row[8]
+            if row[0] is None:
+                continue
+            results.append({
+                'vertebral_id': row[0],
+                'vertebra_level': row[1],
+                'bmd_value': row[2],
+                'tscore': row[3],
+                'yam_percentage': row[4],
+                'diagnosis': row[5],
+                'notes': row[6],
+                'created_date': row[7]
+            })
+        
+        return results, patient_id
+    
     def get_patient_vertebral_history(self, patient_id: int) -> Dict:
-        """患者の椎体別履歴を取得"""
+        """患者の椎体別履歴を取得（患者のデータが変わるまで読み取りキャッシュから返す）"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT m.measurement_date, vm.vertebra_level, vm.bmd_value, 
-                       vm.tscore, vm.yam_percentage, vm.diagnosis
-                FROM measurements m
-                JOIN vertebral_measurements vm ON m.measurement_id = vm.measurement_id
-                WHERE m.patient_id = ?
-                ORDER BY m.measurement_date DESC, 
-                    CASE vm.vertebra_level 
-                        WHEN 'L1' THEN 1 
-                        WHEN 'L2' THEN 2 
-                        WHEN 'L3' THEN 3 
-                        WHEN 'L4' THEN 4 
-                    END
-            """, (patient_id,))
-            
-            history = {}
-            for row in cursor.fetchall():
-                date, level, bmd, tscore, yam, diagnosis = row
-                if date not in history:
-                    history[date] = {}
-                history[date][level] = {
-                    'bmd_value': bmd,
-                    'tscore': tscore,
-                    'yam_percentage': yam,
-                    'diagnosis': diagnosis
-                }
-            
-            conn.close()
-            return history
+            return self.read_cache.get_or_load(
+                'vertebral_history', (patient_id,),
+                lambda: self._load_patient_vertebral_history(patient_id), patient_id=patient_id
+            )
             
         except Exception as e:
             print(f"椎体別履歴取得エラー: {e}")
             return {}
     
+    def _load_patient_vertebral_history(self, patient_id: int) -> Dict:
+        """患者の椎体別履歴を読み込み"""
+        conn = self.manager.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT m.measurement_date, vm.vertebra_level, vm.bmd_value, 
+                   vm.tscore, vm.yam_percentage, vm.diagnosis
+            FROM measurements m
+            JOIN vertebral_measurements vm ON m.measurement_id = vm.measurement_id
+            WHERE m.patient_id = ?
+            ORDER BY m.measurement_date DESC, 
+                CASE vm.vertebra_level 
+                    WHEN 'L1' THEN 1 
+                    WHEN 'L2' THEN 2 
+                    WHEN 'L3' THEN 3 
+                    WHEN 'L4' THEN 4 
+                END
+        """, (patient_id,))
+        
+        history = {}
+        for row in cursor.fetchall():
+            date, level, bmd, tscore, yam, diagnosis = row
+            if date not in history:
+                history[date] = {}
+            history[date][level] = {
+                'bmd_value': bmd,
+                'tscore': tscore,
+                'yam_percentage': yam,
+                'diagnosis': diagnosis
+            }
+        
+        return history
+    
     def analyze_vertebral_differences(self, measurement_id: int) -> Dict:
-        """椎体間の差異分析"""
+        """椎体間の差異分析（計算は utils.vertebral_analysis）"""
         try:
-            vertebral_data = self.get_vertebral_measurements(measurement_id)
-            
-            if len(vertebral_data) < 2:
-                return {}
-            
-            bmd_values = [data['bmd_value'] for data in vertebral_data]
-            yam_values = [data['yam_percentage'] for data in vertebral_data if data['yam_percentage']]
-            
-            analysis = {
-                'bmd_max': max(bmd_values),
-                'bmd_min': min(bmd_values),
-                'bmd_range': max(bmd_values) - min(bmd_values),
-                'bmd_average': sum(bmd_values) / len(bmd_values),
-                'lowest_vertebra': next((data['vertebra_level'] for data in vertebral_data 
-                                       if data['bmd_value'] == min(bmd_values)), None)
-            }
-            
-            if yam_values:
-                analysis.update({
-                    'yam_max': max(yam_values),
-                    'yam_min': min(yam_values),
-                    'yam_range': max(yam_values) - min(yam_values),
-                    'yam_average': sum(yam_values) / len(yam_values)
-                })
-            
-            return analysis
+            return analyze_vertebral_records(self.get_vertebral_measurements(measurement_id))
             
         except Exception as e:
             print(f"椎体別分析エラー: {e}")
             return {}
+    
+    def get_vertebral_review(self, patient_id: Optional[int] = None,
+                             start_date=None, end_date=None) -> pd.DataFrame:
+        """患者の全測定、または全患者（コホート）の椎体間差異を一括分析
+        
+        椎体別データを1クエリで読み込んで測定ごとの N×4 配列にまとめ、
+        範囲・最低値椎体・椎体間差フラグ・リスク区分を一括で計算する。
+        
+        Args:
+            patient_id: 対象患者（None なら全患者）
+            start_date / end_date: 測定日の範囲（省略時は全期間）
+        
+        Returns:
+            1行1測定のDataFrame（measurement_id, patient_id, measurement_date,
+            L1〜L4 の BMD と analyze_vertebral_matrix の各列）。測定日の新しい順。
+        """
+        base_columns = ['measurement_id', 'patient_id', 'measurement_date'] + list(VERTEBRA_LEVELS)
+        try:
+            if patient_id is None:
+                return self._load_vertebral_review(None, start_date, end_date, base_columns)
+            # 患者単位の分析は患者のデータが変わるまで読み取りキャッシュから返す
+            return self.read_cache.get_or_load(
+                'vertebral_review', (patient_id, start_date, end_date),
+                lambda: self._load_vertebral_review(patient_id, start_date, end_date, base_columns),
+                patient_id=patient_id
+            )
+            
+        except Exception as e:
+            print(f"椎体別一括分析エラー: {e}")
+            return pd.DataFrame(columns=base_columns)
+    
+    def _load_vertebral_review(self, patient_id, start_date, end_date, base_columns) -> pd.DataFrame:
+        """椎体別データを読み込んで椎体間差異を一括分析"""
+        # 指定された条件だけを WHERE に含める（患者指定時は idx_measurements_patient_date を使う）
+        conditions = []
+        params = []
+        if patient_id is not None:
+            conditions.append('m.patient_id = ?')
+            params.append(patient_id)
+        if start_date is not None:
+            conditions.append('m.measurement_date >= ?')
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append('m.measurement_date <= ?')
+            params.append(end_date)
+        
+        rows = self.manager.get_connection().execute(f"""
+            SELECT vm.measurement_id, m.patient_id, m.measurement_date,
+                   vm.vertebra_level, vm.bmd_value, vm.yam_percentage, vm.tscore
+            FROM vertebral_measurements vm
+            JOIN measurements m ON m.measurement_id = vm.measurement_id
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        """, params).fetchall()
+        
+        records = pd.DataFrame(rows, columns=[
+            'measurement_id', 'patient_id', 'measurement_date',
+            'vertebra_level', 'bmd_value', 'yam_percentage', 'tscore'
+        ])
+        if records.empty:
+            return pd.DataFrame(columns=base_columns)
+        
+        measurement_ids, matrices = build_vertebral_matrix(records)
+        analysis = analyze_vertebral_matrix(
+            matrices['bmd_value'], matrices['yam_percentage'], matrices['tscore']
+        )
+        
+        measurements = (records.drop_duplicates('measurement_id')
+                        .set_index('measurement_id')
+                        .loc[measurement_ids, ['patient_id', 'measurement_date']]
+                        .reset_index())
+        bmd = pd.DataFrame(matrices['bmd_value'], columns=list(VERTEBRA_LEVELS))
+        review = pd.concat([measurements, bmd, analysis], axis=1)
+        return review.sort_values(['measurement_date', 'measurement_id'], ascending=False,
+                                  ignore_index=True)
@@ -36,6 +36,10 @@ st.set_page_config(
 try:
     from database.db_setup import create_database
     from database.db_operations import BoneDensityDB
+    from database.connection import DEFAULT_DB_PATH
+    from database.statistics_operations import StatisticsRollup
+    from database.progression_operations import MeasurementProgression
+    from database.trend_operations import BmdTrends
     from utils.calculations import BoneDensityCalculator
 except ImportError as e:
     st.error(f"モジュールのインポートエラー: {e}")
@@ -44,7 +48,7 @@ except ImportError as e:
 # データベース初期化
 @st.cache_resource
 def initialize_database():
-    if not os.path.exists('data/bone_density.db'):
+    if not os.path.exists(DEFAULT_DB_PATH):
         create_database()
     return BoneDensityDB(), BoneDensityCalculator()
 
@@ -90,12 +94,13 @@ def main():
 def show_startup_alerts():
     """システム起動時の未受診者アラート表示"""
     try:
-        overdue_data = db.get_overdue_patients()
+        # 件数のみをキャッシュ付きで取得（再実行のたびに集計しない）
+        overdue_summary = db.get_overdue_summary()
         
-        urgent_count = len(overdue_data['urgent'])
-        warning_count = len(overdue_data['warning'])
-        attention_count = len(overdue_data['attention'])
-        total_overdue = len(overdue_data['all'])
+        urgent_count = overdue_summary['urgent']
+        warning_count = overdue_summary['warning']
+        attention_count = overdue_summary['attention']
+        total_overdue = overdue_summary['total']
         
         if total_overdue > 0:
             # サイドバーにアラート表示
@@ -155,14 +160,11 @@ def monthly_schedule_view():
         
         # 統計情報表示
         if not monthly_df.empty:
-            # 🔧 保険適用可能な患者数を計算（統合版）
-            insurance_eligible_count = 0
-            
-            for _, schedule in monthly_df.iterrows():
-                scheduled_date = pd.to_datetime(schedule['scheduled_date']).date()
-                eligible, _ = db.check_insurance_eligibility(schedule['patient_id'], scheduled_date)
-                if eligible:
-                    insurance_eligible_count += 1
+            # 🔧 保険適用可能な患者数を計算（月間分を一括チェック）
+            insurance_df = db.check_insurance_eligibility_bulk(
+                monthly_df['patient_id'], monthly_df['scheduled_date']
+            )
+            insurance_eligible_count = int(insurance_df['eligible'].sum())
             
             total_scheduled = len(monthly_df)
             completed = len(monthly_df[monthly_df['status'] == '済'])
@@ -193,7 +195,7 @@ def monthly_schedule_view():
             
             # 🔧 詳細情報表示（保険適用状況統合版）
             if st.checkbox("📋 詳細一覧を表示（保険適用状況付き）"):
-                display_schedule_with_insurance(monthly_df)
+                display_schedule_with_insurance(monthly_df, insurance_df)
         
         else:
             st.info(f"{selected_year}年{selected_month}月の予定はありません。")
@@ -218,6 +220,10 @@ def calendar_view():
         # 月別データ取得
         monthly_df = db.get_monthly_schedule(cal_year, cal_month)
         
+        # 日別の件数・患者名を集計（日 -> 集計行）
+        day_summary_df = db.get_calendar_month_summary(cal_year, cal_month)
+        day_index = {row['day']: row for row in day_summary_df.to_dict('records')}
+        
         # カレンダー生成
         cal = calendar.monthcalendar(cal_year, cal_month)
         
@@ -252,105 +258,27 @@ def calendar_view():
                     if day == 0:
                         st.markdown("<div style='height: 80px;'></div>", unsafe_allow_html=True)
                     else:
-                        # その日の予定を取得
-                        day_date = date(cal_year, cal_month, day)
-                        day_schedules = monthly_df[
-                            pd.to_datetime(monthly_df['scheduled_date']).dt.date == day_date
-                        ]
+                        # 日別集計からセルを生成
+                        day_summary = day_index.get(day)
                         
-                        if not day_schedules.empty:
-                            completed = len(day_schedules[day_schedules['status'] == '済'])
-                            pending = len(day_schedules[day_schedules['status'] == '予定'])
-                            overdue = len(day_schedules[
-                                (day_schedules['status'] == '予定') & 
-                                (day_date < date.today())
-                            ])
-                            
-                            # カスタムHTMLでセル表示を改善
-                            if overdue > 0:
-                                # 未受診（赤）
-                                patient_names = day_schedules[day_schedules['status'] == '予定']['name_kanji'].tolist()
-                                names_text = ", ".join(patient_names[:2])  # 最大2名表示
-                                if len(patient_names) > 2:
-                                    names_text += f"他{len(patient_names)-2}名"
-                                
-                                st.markdown(f"""
-                                <div style='
-                                    background-color: #ffebee; 
-                                    border: 2px solid #f44336; 
-                                    border-radius: 8px; 
-                                    padding: 8px; 
-                                    height: 80px; 
-                                    font-size: 12px;
-                                    overflow: hidden;
-                                '>
-                                    <div style='font-weight: bold; color: #f44336;'>🔴 {day}</div>
-                                    <div style='color: #666; margin-top: 2px;'>未受診: {overdue}</div>
-                                    <div style='color: #333; font-size: 10px; margin-top: 2px;'>{names_text}</div>
-                                </div>
-                                """, unsafe_allow_html=True)
-                                
-                            elif pending > 0:
-                                # 予定（黄）
-                                patient_names = day_schedules[day_schedules['status'] == '予定']['name_kanji'].tolist()
-                                names_text = ", ".join(patient_names[:2])  # 最大2名表示
-                                if len(patient_names) > 2:
-                                    names_text += f"他{len(patient_names)-2}名"
-                                
-                                st.markdown(f"""
-                                <div style='
-                                    background-color: #fff8e1; 
-                                    border: 2px solid #ff9800; 
-                                    border-radius: 8px; 
-                                    padding: 8px; 
-                                    height: 80px; 
-                                    font-size: 12px;
-                                    overflow: hidden;
-                                '>
-                                    <div style='font-weight: bold; color: #ff9800;'>🟡 {day}</div>
-                                    <div style='color: #666; margin-top: 2px;'>予定: {pending}</div>
-                                    <div style='color: #333; font-size: 10px; margin-top: 2px;'>{names_text}</div>
-                                </div>
-                                """, unsafe_allow_html=True)
-                                
-                            elif completed > 0:
-                                # 実施済み（緑）
-                                patient_names = day_schedules[day_schedules['status'] == '済']['name_kanji'].tolist()
-                                names_text = ", ".join(patient_names[:2])  # 最大2名表示
-                                if len(patient_names) > 2:
-                                    names_text += f"他{len(patient_names)-2}名"
-                                
-                                st.markdown(f"""
-                                <div style='
-                                    background-color: #e8f5e8; 
-                                    border: 2px solid #4caf50; 
-                                    border-radius: 8px; 
-                                    padding: 8px; 
-                                    height: 80px; 
-                                    font-size: 12px;
-                                    overflow: hidden;
-                                '>
-                                    <div style='font-weight: bold; color: #4caf50;'>🟢 {day}</div>
-                                    <div style='color: #666; margin-top: 2px;'>実施: {completed}</div>
-                                    <div style='color: #333; font-size: 10px; margin-top: 2px;'>{names_text}</div>
-                                </div>
-                                """, unsafe_allow_html=True)
+                        if day_summary is None:
+                            cell_html = create_calendar_cell(day, "none", [], 0)
+                        elif day_summary['overdue'] > 0:
+                            # 未受診（赤）
+                            cell_html = create_calendar_cell(day, "overdue", day_summary['pending_names'],
+                                                             day_summary['overdue'], day_summary['pending'])
+                        elif day_summary['pending'] > 0:
+                            # 予定（黄）
+                            cell_html = create_calendar_cell(day, "pending", day_summary['pending_names'],
+                                                             day_summary['pending'], day_summary['pending'])
+                        elif day_summary['completed'] > 0:
+                            # 実施済み（緑）
+                            cell_html = create_calendar_cell(day, "completed", day_summary['completed_names'],
+                                                             day_summary['completed'], day_summary['completed'])
                         else:
-                            # 予定なし（グレー）
-                            st.markdown(f"""
-                            <div style='
-                                background-color: #fafafa; 
-                                border: 1px solid #e0e0e0; 
-                                border-radius: 8px; 
-                                padding: 8px; 
-                                height: 80px; 
-                                font-size: 12px;
-                                text-align: center;
-                                color: #999;
-                            '>
-                                <div style='font-weight: bold; margin-top: 20px;'>⚪ {day}</div>
-                            </div>
-                            """, unsafe_allow_html=True)
+                            cell_html = create_calendar_cell(day, "none", [], 0)
+                        
+                        st.markdown(cell_html, unsafe_allow_html=True)
         
         # 詳細情報表示
         if not monthly_df.empty:
@@ -382,8 +310,12 @@ def calendar_view():
     except Exception as e:
         st.error(f"カレンダー表示エラー: {e}")
 
-def create_calendar_cell(day, status, patient_names, count):
-    """カレンダーセル用のHTMLを生成"""
+def create_calendar_cell(day, status, patient_names, count, total_names=None):
+    """カレンダーセル用のHTMLを生成
+
+    patient_names は表示する先頭の患者名、total_names はその状態の全患者数
+    （省略時は patient_names の件数）。
+    """
     if status == "overdue":
         bg_color = "#ffebee"
         border_color = "#f44336"
@@ -412,10 +344,16 @@ def create_calendar_cell(day, status, patient_names, count):
     # 患者名を最大2名まで表示
     names_text = ""
     if patient_names:
+        if total_names is None:
+            total_names = len(patient_names)
         names_list = patient_names[:2]
         names_text = ", ".join(names_list)
-        if len(patient_names) > 2:
-            names_text += f" 他{len(patient_names)-2}名"
+        if total_names > len(names_list):
+            names_text += f" 他{total_names-len(names_list)}名"
+    
+    # 空行があるとMarkdownがHTMLブロックを途中で終了するため、空の要素は出力しない
+    label_html = f"<div style='color: #666; margin-top: 2px; font-size: 10px;'>{label}</div>" if label else ""
+    names_html = f"<div style='color: #333; font-size: 9px; margin-top: 2px; line-height: 1.2;'>{names_text}</div>" if names_text else ""
     
     return f"""
     <div style='
@@ -428,9 +366,7 @@ def create_calendar_cell(day, status, patient_names, count):
         overflow: hidden;
         position: relative;
     '>
-        <div style='font-weight: bold; color: {text_color};'>{emoji} {day}</div>
-        {f"<div style='color: #666; margin-top: 2px; font-size: 10px;'>{label}</div>" if label else ""}
-        {f"<div style='color: #333; font-size: 9px; margin-top: 2px; line-height: 1.2;'>{names_text}</div>" if names_text else ""}
+        <div style='font-weight: bold; color: {text_color};'>{emoji} {day}</div>{label_html}{names_html}
     </div>
     """
 
@@ -439,34 +375,11 @@ def overdue_management():
     st.subheader("⚠️ 未受診者管理")
     
     try:
-        overdue_data = db.get_overdue_patients()
-        
-        urgent_df = overdue_data['urgent']
-        warning_df = overdue_data['warning']
-        attention_df = overdue_data['attention']
-        all_df = overdue_data['all']
-        
-        # 連絡済み・未連絡で分類
-        contacted_count = 0
-        uncontacted_count = 0
-        
-        # データベースから連絡済み情報を取得
-        contacted_patients = []
-        try:
-            contacted_results = db.execute_query("""
-                SELECT schedule_id, contact_date 
-                FROM follow_up_schedule 
-                WHERE contact_needed = 1 AND status = '予定'
-            """)
-            contacted_dict = {row[0]: row[1] for row in contacted_results} if contacted_results else {}
-        except:
-            contacted_dict = {}
-        
-        for _, patient in all_df.iterrows():
-            if patient['schedule_id'] in contacted_dict:
-                contacted_count += 1
-            else:
-                uncontacted_count += 1
+        # 件数（合計・連絡済み）は集計クエリで取得
+        counts = db.get_overdue_worklist_counts()
+        total_count = counts['total']
+        contacted_count = counts['contacted']
+        uncontacted_count = counts['uncontacted']
         
         # 統計表示
         col1, col2, col3, col4 = st.columns(4)
@@ -476,36 +389,46 @@ def overdue_management():
         with col2:
             st.metric("📞 連絡済み", contacted_count)
         with col3:
-            st.metric("📊 合計", len(all_df))
+            st.metric("📊 合計", total_count)
         with col4:
-            completion_rate = round((contacted_count / len(all_df) * 100), 1) if len(all_df) > 0 else 0
+            completion_rate = round((contacted_count / total_count * 100), 1) if total_count > 0 else 0
             st.metric("連絡率", f"{completion_rate}%")
         
         st.markdown("---")
         
         # 患者一覧（緊急度順で表示）
-        if not all_df.empty:
+        if total_count > 0:
             st.markdown("### 📋 未受診患者一覧")
             st.markdown("**凡例**: 🔴緊急（14日以上） 🟠警告（7-13日） 🟡注意（3-6日）")
             
+            # 1ページ分のみ取得
+            page_size = 50
+            page_count = (total_count + page_size - 1) // page_size
+            page = 1
+            if page_count > 1:
+                page = st.selectbox(
+                    f"ページ（全{page_count}ページ・{page_size}名ずつ）",
+                    range(1, page_count + 1),
+                    key="overdue_page"
+                )
+            worklist_df = db.get_overdue_worklist(limit=page_size, offset=(page - 1) * page_size)
+            
+            # 緊急度による色分け
+            urgency_labels = {
+                'urgent': ("🔴", "緊急"),
+                'warning': ("🟠", "警告"),
+                'attention': ("🟡", "注意")
+            }
+            
             # 緊急患者から順に表示
-            for _, patient in all_df.iterrows():
-                age = calculate_age(patient['birth_date'])
+            for _, patient in worklist_df.iterrows():
+                age = "不明" if pd.isna(patient['age']) else int(patient['age'])
                 days = int(patient['days_overdue'])
                 schedule_id = patient['schedule_id']
-                is_contacted = schedule_id in contacted_dict
-                contact_date = contacted_dict.get(schedule_id, '')
-                
-                # 緊急度による色分け
-                if days >= 14:
-                    urgency_color = "🔴"
-                    urgency_level = "緊急"
-                elif days >= 7:
-                    urgency_color = "🟠"
-                    urgency_level = "警告"
-                else:
-                    urgency_color = "🟡"
-                    urgency_level = "注意"
+                is_contacted = bool(patient['contacted'])
+                contact_date = patient['contact_date'] if pd.notna(patient['contact_date']) else ''
+                tier = patient['urgency_tier']
+                urgency_color, urgency_level = urgency_labels.get(tier, urgency_labels['attention'])
                 
                 col1, col2, col3 = st.columns([3, 1, 1])
                 
@@ -530,9 +453,9 @@ def overdue_management():
                         """, unsafe_allow_html=True)
                     else:
                         # 未連絡患者（通常表示）
-                        if days >= 14:
+                        if tier == 'urgent':
                             st.error(f"{urgency_color} **{patient['name_kanji']}** ({age}歳{patient['gender']}) - 予定日: {patient['scheduled_date']} - **{days}日経過** [{urgency_level}]")
-                        elif days >= 7:
+                        elif tier == 'warning':
                             st.warning(f"{urgency_color} **{patient['name_kanji']}** ({age}歳{patient['gender']}) - 予定日: {patient['scheduled_date']} - **{days}日経過** [{urgency_level}]")
                         else:
                             st.info(f"{urgency_color} **{patient['name_kanji']}** ({age}歳{patient['gender']}) - 予定日: {patient['scheduled_date']} - **{days}日経過** [{urgency_level}]")
@@ -563,23 +486,9 @@ def mark_as_contacted(schedule_id, patient_name):
     """連絡済みにマーク"""
     try:
         # 連絡済みフラグと連絡日を更新
-        success = db.execute_query("""
-            UPDATE follow_up_schedule 
-            SET contact_needed = 1, 
-                contact_date = ?, 
-                notes = COALESCE(notes, '') || CASE 
-                    WHEN notes IS NULL OR notes = '' THEN ?
-                    ELSE char(10) || ?
-                END
-            WHERE schedule_id = ?
-        """, [
-            date.today().strftime('%Y-%m-%d'), 
-            f"連絡済み - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            f"連絡済み - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            schedule_id
-        ])
-        
-        if success is not None:
+        success = db.mark_schedule_contacted(schedule_id)
+        
+        if success:
             st.success(f"✅ {patient_name}さんを連絡済みとしてマークしました。")
             time.sleep(0.5)  # 短い待機
             st.rerun()
@@ -594,49 +503,60 @@ def continuation_statistics():
     st.subheader("📈 継続受診率統計")
     
     try:
-        # 年別統計
         current_year = datetime.now().year
-        years = range(current_year - 2, current_year + 1)
         
-        stats_data = []
-        for year in years:
-            stats = db.get_continuation_rate_stats(year)
-            if stats:
-                stats_data.append(stats)
+        # 集計単位・期間の選択
+        granularity_options = {"年別": "year", "月別": "month", "週別": "week"}
+        col_a, col_b, col_c = st.columns(3)
         
-        if stats_data:
-            stats_df = pd.DataFrame(stats_data)
-            
-            # メトリクス表示
+        with col_a:
+            granularity_label = st.selectbox("集計単位", list(granularity_options), key="continuation_granularity")
+        with col_b:
+            start_year = st.selectbox("開始年", range(current_year - 10, current_year + 1), index=8, key="continuation_start_year")
+        with col_c:
+            rolling_window = st.selectbox("移動継続率（期間数）", [None, 3, 6, 12],
+                                          format_func=lambda n: "なし" if n is None else f"直近{n}期間",
+                                          key="continuation_rolling")
+        
+        granularity = granularity_options[granularity_label]
+        
+        # 期間全体を1クエリで集計
+        stats_df = db.get_continuation_series(date(start_year, 1, 1), date(current_year, 12, 31),
+                                              granularity, rolling_window)
+        
+        if not stats_df.empty and stats_df['total_scheduled'].sum() > 0:
+            # メトリクス表示（今年分を合算）
             col1, col2, col3 = st.columns(3)
             
-            current_stats = stats_df[stats_df['year'] == current_year].iloc[0] if len(stats_df[stats_df['year'] == current_year]) > 0 else None
+            current_stats = stats_df[stats_df['period_start'].dt.year == current_year]
+            total_scheduled = int(current_stats['total_scheduled'].sum())
+            completed = int(current_stats['completed'].sum())
+            current_rate = round(completed / total_scheduled * 100, 1) if total_scheduled > 0 else 0.0
             
-            if current_stats is not None:
-                with col1:
-                    st.metric("今年の継続率", f"{current_stats['continuation_rate']}%")
-                with col2:
-                    st.metric("総予定数", current_stats['total_scheduled'])
-                with col3:
-                    st.metric("実施済み", current_stats['completed'])
+            with col1:
+                st.metric("今年の継続率", f"{current_rate}%")
+            with col2:
+                st.metric("総予定数", total_scheduled)
+            with col3:
+                st.metric("実施済み", completed)
+            
+            # 期間別ラベル
+            label_formats = {"year": "%Y年", "month": "%Y年%m月", "week": "%Y/%m/%d週"}
+            chart_data = stats_df.copy()
+            chart_data['period_label'] = chart_data['period_start'].dt.strftime(label_formats[granularity])
             
-            # 年別グラフ（横向きラベル対応）
-            if len(stats_df) > 1:
-                st.subheader("📊 年別継続率推移")
+            # 推移グラフ（横向きラベル対応）
+            if len(chart_data) > 1:
+                st.subheader(f"📊 {granularity_label}継続率推移")
                 
                 # plotlyを使用してカスタムグラフを作成
-                import plotly.express as px
                 import plotly.graph_objects as go
                 
-                # データ準備
-                chart_data = stats_df.copy()
-                chart_data['year_label'] = chart_data['year'].astype(str) + '年'
-                
                 # Plotlyグラフ作成
                 fig = go.Figure()
                 
                 fig.add_trace(go.Scatter(
-                    x=chart_data['year_label'],
+                    x=chart_data['period_label'],
                     y=chart_data['continuation_rate'],
                     mode='lines+markers',
                     name='継続率',
@@ -644,10 +564,19 @@ def continuation_statistics():
                     marker=dict(size=8, color='#1f77b4')
                 ))
                 
+                if 'rolling_rate' in chart_data.columns:
+                    fig.add_trace(go.Scatter(
+                        x=chart_data['period_label'],
+                        y=chart_data['rolling_rate'],
+                        mode='lines',
+                        name=f'移動継続率（直近{rolling_window}期間）',
+                        line=dict(color='#ff7f0e', width=2, dash='dash')
+                    ))
+                
                 # レイアウト設定
                 fig.update_layout(
-                    title='年別継続受診率推移',
-                    xaxis_title='年',
+                    title=f'{granularity_label}継続受診率推移',
+                    xaxis_title='期間',
                     yaxis_title='継続率 (%)',
                     xaxis=dict(
                         tickangle=0,  # 横向き表示（0度）
@@ -658,16 +587,18 @@ def continuation_statistics():
                         tickfont=dict(size=12)
                     ),
                     height=400,
-                    showlegend=False
+                    showlegend='rolling_rate' in chart_data.columns
                 )
                 
                 # Streamlitで表示
                 st.plotly_chart(fig, use_container_width=True)
             
             # 詳細テーブル
-            st.subheader("📋 年別詳細")
-            display_df = stats_df.copy()
-            display_df.columns = ['年', '総予定数', '実施済み', '未受診', '継続率(%)']
+            st.subheader(f"📋 {granularity_label}詳細")
+            display_df = chart_data[['period_label', 'total_scheduled', 'completed', 'overdue', 'continuation_rate']].copy()
+            display_df.columns = ['期間', '総予定数', '実施済み', '未受診', '継続率(%)']
+            if 'rolling_rate' in chart_data.columns:
+                display_df['移動継続率(%)'] = chart_data['rolling_rate']
             st.dataframe(display_df, use_container_width=True)
         else:
             st.info("統計データがまだありません。")
@@ -675,45 +606,37 @@ def continuation_statistics():
     except Exception as e:
         st.error(f"統計表示エラー: {e}")
 
-def display_schedule_with_insurance(monthly_df):
+def display_schedule_with_insurance(monthly_df, insurance_df=None):
     """予定一覧を保険適用情報付きで表示（完全統合版）"""
     try:
         st.subheader("📋 月間予定詳細（保険適用状況付き）")
         
-        # データフレーム表示用の準備
-        display_data = []
+        if insurance_df is None:
+            insurance_df = db.check_insurance_eligibility_bulk(
+                monthly_df['patient_id'], monthly_df['scheduled_date']
+            )
         
-        for _, schedule in monthly_df.iterrows():
-            scheduled_date = pd.to_datetime(schedule['scheduled_date']).date()
-            eligible, message = db.check_insurance_eligibility(schedule['patient_id'], scheduled_date)
-            age = calculate_age(schedule['birth_date'])
-            
-            # 保険適用状況の詳細表示
-            if eligible:
-                insurance_status = "✅ 適用可"
-                insurance_detail = "保険適用OK"
-            else:
-                insurance_status = f"⏳ 適用外"
-                insurance_detail = message
-            
-            display_data.append({
-                '予定日': schedule['scheduled_date'],
-                '患者名': schedule['name_kanji'],
-                '年齢': f"{age}歳",
-                '性別': schedule['gender'],
-                '状況': schedule['status'],
-                '保険適用': insurance_status,
-                '詳細': insurance_detail
-            })
+        # 一括チェック結果は予定一覧と同じ順序で返る
+        eligible = insurance_df['eligible'].to_numpy()
+        
+        # データフレーム表示用の準備
+        display_df = pd.DataFrame({
+            '予定日': monthly_df['scheduled_date'].to_numpy(),
+            '患者名': monthly_df['name_kanji'].to_numpy(),
+            '年齢': [f"{calculate_age(birth_date)}歳" for birth_date in monthly_df['birth_date']],
+            '性別': monthly_df['gender'].to_numpy(),
+            '状況': monthly_df['status'].to_numpy(),
+            '保険適用': ["✅ 適用可" if flag else "⏳ 適用外" for flag in eligible],
+            '詳細': insurance_df['message'].where(~insurance_df['eligible'], '保険適用OK').to_numpy()
+        })
         
         # データフレーム表示
-        if display_data:
-            display_df = pd.DataFrame(display_data)
+        if not display_df.empty:
             st.dataframe(display_df, use_container_width=True)
             
             # 保険適用統計
-            eligible_count = len([d for d in display_data if "✅" in d['保険適用']])
-            total_count = len(display_data)
+            eligible_count = int(eligible.sum())
+            total_count = len(display_df)
             st.info(f"📊 保険適用状況: {eligible_count}/{total_count}名が適用可能 ({round(eligible_count/total_count*100, 1)}%)")
         
     except Exception as e:
@@ -736,12 +659,9 @@ def mark_as_completed(schedule_id, patient_name):
     """予定を完了にマーク"""
     try:
         # 予定を完了に更新
-        success = db.execute_query(
-            "UPDATE follow_up_schedule SET status = '済', completed_date = ? WHERE schedule_id = ?",
-            [date.today().strftime('%Y-%m-%d'), schedule_id]
-        )
+        success = db.mark_schedule_completed(schedule_id)
         
-        if success is not None:
+        if success:
             st.success(f"✅ {patient_name}さんの予定を完了にしました。")
             time.sleep(0.5)  # 短い待機
             st.rerun()
@@ -776,10 +696,11 @@ def database_debug_page():
     
     if st.button("データベースリセット"):
         try:
-            # データベースファイル削除
-            db_path = os.path.join('data', 'bone_density.db')
-            if os.path.exists(db_path):
-                os.remove(db_path)
+            # 永続接続をクローズしてからデータベースファイル削除（WAL/SHMも含む）
+            db.manager.close_all()
+            for path in [db.db_path, db.db_path + '-wal', db.db_path + '-shm']:
+                if os.path.exists(path):
+                    os.remove(path)
             
             # 再作成
             create_database()
@@ -804,10 +725,9 @@ def patient_search_page():
     # 検索実行
     if search_button or search_term:
         try:
-            patients_df = db.search_patients(search_term)
+            patients_df = paged_patient_search(search_term, key="patient_search_page")
             
             if not patients_df.empty:
-                st.success(f"検索結果: {len(patients_df)}名")
                 
                 # 患者一覧表示（保険適用状況付き）
                 for idx, patient in patients_df.iterrows():
@@ -848,11 +768,11 @@ def show_insurance_status_compact(patient_id):
             st.success("✅ 適用可能")
         else:
             # より詳細な情報を表示
-            measurements_df = db.get_patient_measurements(patient_id)
-            if not measurements_df.empty:
-                latest_date = measurements_df.iloc[0]['measurement_date']
+            summary = db.get_patient_summary(patient_id)
+            if summary is not None:
+                latest_date = summary['last_measurement_date']
                 days_since = (today - datetime.strptime(latest_date, '%Y-%m-%d').date()).days
-                shortage_days = 120 - days_since
+                shortage_days = (datetime.strptime(summary['next_insurance_date'], '%Y-%m-%d').date() - today).days
                 st.warning(f"⏳ あと{shortage_days}日で適用可能")
                 st.caption(f"前回測定: {latest_date} ({days_since}日経過)")
             else:
@@ -901,54 +821,80 @@ def patient_registration_page():
             else:
                 st.error("❌ 必須項目（*）を全て入力してください。")
 
+def paged_patient_search(search_term, key, page_size=20):
+    """患者検索結果を1ページ分取得し、ページ送りボタンを表示（キーセットページング）"""
+    # 検索語が変わったら先頭ページに戻す
+    if st.session_state.get(f"{key}_term") != search_term:
+        st.session_state[f"{key}_term"] = search_term
+        st.session_state[f"{key}_cursors"] = [None]
+    cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+    
+    # 1件多く取得して次ページの有無を判定
+    page_df = db.search_patients(search_term, cursor=cursors[-1], page_size=page_size + 1)
+    has_next = len(page_df) > page_size
+    page_df = page_df.head(page_size).reset_index(drop=True)
+    
+    if page_df.empty and len(cursors) == 1:
+        return page_df
+    
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    
+    with col_prev:
+        if st.button("◀ 前へ", key=f"{key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    
+    with col_page:
+        st.caption(f"{len(cursors)}ページ目（{len(page_df)}名表示）")
+    
+    with col_next:
+        if st.button("次へ ▶", key=f"{key}_next", disabled=not has_next):
+            last_row = page_df.iloc[-1]
+            cursors.append((last_row['created_date'], int(last_row['patient_id'])))
+            st.rerun()
+    
+    return page_df
+
+def paged_patient_selector(search_term, key, page_size=20):
+    """ページ送り付き患者選択ボックス（選択された患者の行を返す。該当なしは None）"""
+    page_df = paged_patient_search(search_term, key, page_size)
+    
+    if page_df.empty:
+        return None
+    
+    labels = (page_df['name_kanji'].astype(str) + " (" + page_df['patient_code'].astype(str)
+              + ") - ID:" + page_df['patient_id'].astype(str)).tolist()
+    
+    selected_idx = st.selectbox(
+        "患者を選択してください",
+        range(len(labels)),
+        format_func=lambda i: labels[i],
+        key=f"{key}_select"
+    )
+    return page_df.iloc[selected_idx]
+
 def measurement_input_page():
     """測定データ入力画面（保険適用チェック統合版）"""
     st.header("📊 測定データ入力")
     
     try:
-        # 患者選択
-        patients_df = db.search_patients()
-        
-        if patients_df.empty:
-            st.warning("⚠️ 患者が登録されていません。先に患者登録を行ってください。")
-            return
-        
         # 患者選択方法を選択
         st.subheader("👤 患者選択")
         
         # 検索機能付き患者選択
-        col_search1, col_search2 = st.columns([3, 1])
+        patient_search = st.text_input("患者検索（名前・患者番号）", placeholder="田中太郎 または P001", key="patient_search_measurement")
         
-        with col_search1:
-            patient_search = st.text_input("患者検索（名前・患者番号）", placeholder="田中太郎 または P001", key="patient_search_measurement")
+        # 患者選択ボックス（検索結果をページ単位で表示）
+        selected_patient = paged_patient_selector(patient_search, key="patient_select")
         
-        with col_search2:
-            search_patients_btn = st.button("検索", key="search_patients_measurement")
-        
-        # 検索結果に基づいて患者リストを更新
-        if patient_search or search_patients_btn:
-            filtered_patients_df = db.search_patients(patient_search)
-        else:
-            filtered_patients_df = patients_df
-        
-        if filtered_patients_df.empty:
-            st.warning("⚠️ 検索条件に一致する患者が見つかりません。")
+        if selected_patient is None:
+            if patient_search:
+                st.warning("⚠️ 検索条件に一致する患者が見つかりません。")
+            else:
+                st.warning("⚠️ 患者が登録されていません。先に患者登録を行ってください。")
             return
         
-        # 患者選択ボックス（検索結果に基づく）
-        patient_options = [f"{row['name_kanji']} ({row['patient_code']}) - ID:{row['patient_id']}" 
-                          for idx, row in filtered_patients_df.iterrows()]
-        
-        selected_patient_display = st.selectbox(
-            f"患者を選択してください（{len(filtered_patients_df)}名表示）", 
-            patient_options, 
-            key="patient_select"
-        )
-        
-        if selected_patient_display:
-            # 選択された患者のIDを取得
-            selected_idx = patient_options.index(selected_patient_display)
-            selected_patient = filtered_patients_df.iloc[selected_idx]
+        if selected_patient is not None:
             selected_patient_id = int(selected_patient['patient_id'])
             
             # 🔧 保険適用チェック表示（統合版）
@@ -1062,12 +1008,13 @@ def show_insurance_status_detail(patient_id, patient_name):
         today = date.today()
         eligible, message = db.check_insurance_eligibility(patient_id, today)
         
-        # 最新測定日を取得
-        measurements_df = db.get_patient_measurements(patient_id)
+        # 最新測定日を取得（患者別測定サマリー）
+        summary = db.get_patient_summary(patient_id)
         
-        if not measurements_df.empty:
-            latest_date = measurements_df.iloc[0]['measurement_date']
+        if summary is not None:
+            latest_date = summary['last_measurement_date']
             days_since = (today - datetime.strptime(latest_date, '%Y-%m-%d').date()).days
+            next_eligible_date = datetime.strptime(summary['next_insurance_date'], '%Y-%m-%d').date()
             
             # 保険適用状況を色分けして表示
             st.markdown("### 🏥 保険適用状況")
@@ -1084,14 +1031,13 @@ def show_insurance_status_detail(patient_id, patient_name):
                 if eligible:
                     st.success("✅ 保険適用OK")
                 else:
-                    shortage_days = 120 - days_since
+                    shortage_days = (next_eligible_date - today).days
                     st.warning(f"⏳ あと{shortage_days}日")
             
             # 詳細メッセージ
             if eligible:
                 st.success(f"🎉 {patient_name}さんは保険適用で測定可能です（前回から{days_since}日経過）")
             else:
-                next_eligible_date = datetime.strptime(latest_date, '%Y-%m-%d').date() + timedelta(days=120)
                 st.info(f"📅 次回保険適用日: {next_eligible_date.strftime('%Y年%m月%d日')} ({message})")
         else:
             st.success("🆕 初回測定のため保険適用です")
@@ -1114,10 +1060,9 @@ def insurance_check_for_date(patient_id, measurement_date, patient_name):
             st.caption(f"詳細: {message}")
             
             # 次回適用日の案内
-            measurements_df = db.get_patient_measurements(patient_id)
-            if not measurements_df.empty:
-                latest_date = measurements_df.iloc[0]['measurement_date']
-                next_eligible_date = datetime.strptime(latest_date, '%Y-%m-%d').date() + timedelta(days=120)
+            summary = db.get_patient_summary(patient_id)
+            if summary is not None:
+                next_eligible_date = datetime.strptime(summary['next_insurance_date'], '%Y-%m-%d').date()
                 st.info(f"💡 次回保険適用日: {next_eligible_date.strftime('%Y年%m月%d日')}")
             
     except Exception as e:
@@ -1126,24 +1071,23 @@ def insurance_check_for_date(patient_id, measurement_date, patient_name):
 def show_previous_measurement(patient_id):
     """前回の測定データを表示"""
     try:
-        measurements_df = db.get_patient_measurements(patient_id)
+        summary = db.get_patient_summary(patient_id)
         
-        if not measurements_df.empty:
+        if summary is not None:
             st.subheader("📈 前回の測定結果")
-            latest = measurements_df.iloc[0]
             
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                st.metric("測定日", latest['measurement_date'])
+                st.metric("測定日", summary['last_measurement_date'])
                 
             with col2:
-                if latest['femur_tscore'] is not None:
-                    st.metric("大腿骨 T-score", f"{latest['femur_tscore']}")
+                if summary['last_femur_tscore'] is not None:
+                    st.metric("大腿骨 T-score", f"{summary['last_femur_tscore']}")
                 
             with col3:
-                if latest['lumbar_tscore'] is not None:
-                    st.metric("腰椎 T-score", f"{latest['lumbar_tscore']}")
+                if summary['last_lumbar_tscore'] is not None:
+                    st.metric("腰椎 T-score", f"{summary['last_lumbar_tscore']}")
         else:
             st.info("📝 初回測定です（前回データなし）")
     except Exception as e:
@@ -1166,6 +1110,17 @@ def show_patient_history(patient_id):
             display_df.index.name = '回数'
             
             st.dataframe(display_df, use_container_width=True)
+            
+            # 全測定の回帰直線による推移（2回以上測定した部位のみ）
+            trends_df = BmdTrends().get_patient_trends(patient_id)
+            trends_df = trends_df[trends_df['trend'].notna()]
+            if not trends_df.empty:
+                st.subheader("📈 骨密度の推移（回帰）")
+                display_df = trends_df[['site', 'measurement_count', 'span_years', 'percent_per_year',
+                                        'total_change_percent', 'lsc_percent', 'trend']].copy()
+                display_df['site'] = display_df['site'].replace({'lumbar': '腰椎', 'femur': '大腿骨'})
+                display_df.columns = ['部位', '測定回数', '期間(年)', '年間変化率(%)', '変化率(%)', '最小有意変化(%)', '傾向']
+                st.dataframe(display_df.set_index('部位'), use_container_width=True)
         else:
             st.info("まだ測定データがありません。")
     except Exception as e:
@@ -1174,26 +1129,84 @@ def show_patient_history(patient_id):
 def progress_review_page():
     st.header("📈 経過確認")
     
-    # 簡単な統計表示
+    # 簡単な統計表示（集計クエリ1回・次の書き込みまでキャッシュ）
     try:
-        patients_df = db.search_patients()
-        if not patients_df.empty:
-            col1, col2 = st.columns(2)
+        stats = db.get_dashboard_stats()
+        if stats is None:
+            st.error("統計データの取得に失敗しました")
+            return
+        
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("登録患者数", stats['total_patients'])
+        
+        with col2:
+            st.metric("総測定回数", stats['total_measurements'])
+        
+        with col3:
+            st.metric(f"直近{stats['recent_days']}日の測定", stats['recent_measurements'])
+        
+        with col4:
+            st.metric(f"直近{stats['recent_days']}日の新規患者", stats['recent_new_patients'])
+        
+        # 最新測定の診断別内訳
+        if stats['diagnosis_counts']:
+            st.subheader("🩺 診断別患者数（最新測定）")
+            diagnosis_cols = st.columns(len(stats['diagnosis_counts']))
+            for col, (diagnosis, count) in zip(diagnosis_cols, stats['diagnosis_counts'].items()):
+                with col:
+                    st.metric(diagnosis, count)
+        
+        # 月別推移（statistics_summary の集計済み行を表示）
+        st.subheader("📅 月別推移")
+        rollup = StatisticsRollup()
+        
+        # 集計は夜間の maintenance.py refresh-summaries で行い、表示時は集計済みの行を読むだけ
+        if st.button("🔄 集計を最新にする", key="refresh_statistics_summary"):
+            rollup.refresh()
+        
+        monthly_df = rollup.get_summaries('monthly', end_date=date.today().strftime('%Y-%m-%d'))
+        if not monthly_df.empty:
+            monthly_df = monthly_df.tail(24).set_index('summary_date')
             
-            with col1:
-                st.metric("登録患者数", len(patients_df))
+            st.line_chart(monthly_df[['average_bmd_lumbar', 'average_bmd_femur']].rename(columns={
+                'average_bmd_lumbar': '腰椎平均BMD',
+                'average_bmd_femur': '大腿骨平均BMD'
+            }))
             
-            with col2:
-                # 全測定回数を計算
-                total_measurements = 0
-                for _, patient in patients_df.iterrows():
-                    patient_id = int(patient['patient_id'])
-                    measurements = db.get_patient_measurements(patient_id)
-                    total_measurements += len(measurements)
-                st.metric("総測定回数", total_measurements)
+            display_df = monthly_df[['total_patients', 'new_patients', 'active_patients', 'missed_appointments',
+                                     'completion_rate', 'improvement_cases', 'deterioration_cases']].copy()
+            display_df.columns = ['累計患者数', '新規患者', '測定患者数', '未受診', '受診完了率(%)', '改善', '悪化']
+            st.dataframe(display_df, use_container_width=True)
+        else:
+            st.info("月別の集計データがまだありません。")
+        
+        # 前回測定から悪化した患者（measurement_progression の悪化行のみ）
+        st.subheader("📉 前回から悪化した患者")
+        latest_only = st.checkbox("最新測定で悪化している患者のみ", value=True, key="deterioration_latest_only")
+        deterioration_df = MeasurementProgression().get_deterioration_list(latest_only=latest_only, limit=200)
+        if not deterioration_df.empty:
+            display_df = deterioration_df[['name_kanji', 'measurement_date', 'previous_measurement_date',
+                                           'femur_yam_change', 'femur_trend', 'lumbar_yam_change', 'lumbar_trend',
+                                           'worsened_vertebrae']].copy()
+            display_df.columns = ['患者名', '測定日', '前回測定日', '大腿骨YAM変化', '大腿骨', '腰椎YAM変化', '腰椎', '悪化した椎体']
+            st.dataframe(display_df, use_container_width=True)
+        else:
+            st.success("前回測定から悪化した患者はいません。")
+        
+        # 全測定の回帰直線で最小有意変化（LSC）を超えて低下している患者
+        st.subheader("📉 骨密度が有意に低下している患者（回帰）")
+        trend_site = st.selectbox("部位", ['lumbar', 'femur'], key="trend_worklist_site",
+                                  format_func=lambda site: {'lumbar': '腰椎', 'femur': '大腿骨'}[site])
+        trend_df = BmdTrends().get_trend_worklist(site=trend_site, trend='悪化', limit=200)
+        if not trend_df.empty:
+            display_df = trend_df[['name_kanji', 'last_measurement_date', 'measurement_count', 'span_years',
+                                   'percent_per_year', 'total_change_percent', 'lsc_percent']].copy()
+            display_df.columns = ['患者名', '最新測定日', '測定回数', '期間(年)', '年間変化率(%)', '変化率(%)', '最小有意変化(%)']
+            st.dataframe(display_df, use_container_width=True)
         else:
-            st.metric("登録患者数", 0)
-            st.metric("総測定回数", 0)
+            st.success("有意に低下している患者はいません。")
     except Exception as e:
         st.error(f"統計データの取得に失敗しました: {e}")
 
@@ -1203,47 +1216,21 @@ def vertebral_measurement_input_page():
     
     try:
         # 患者選択（既存のロジックを再利用）
-        patients_df = db.search_patients()
-        
-        if patients_df.empty:
-            st.warning("⚠️ 患者が登録されていません。先に患者登録を行ってください。")
-            return
-        
-        # 患者選択
         st.subheader("👤 患者選択")
         
-        col_search1, col_search2 = st.columns([3, 1])
+        patient_search = st.text_input("患者検索（名前・患者番号）", placeholder="田中太郎 または P001", key="vertebral_patient_search")
         
-        with col_search1:
-            patient_search = st.text_input("患者検索（名前・患者番号）", placeholder="田中太郎 または P001", key="vertebral_patient_search")
-        
-        with col_search2:
-            search_patients_btn = st.button("検索", key="vertebral_search_patients")
-        
-        # 検索結果に基づいて患者リストを更新
-        if patient_search or search_patients_btn:
-            filtered_patients_df = db.search_patients(patient_search)
-        else:
-            filtered_patients_df = patients_df
+        # 患者選択ボックス（検索結果をページ単位で表示）
+        selected_patient = paged_patient_selector(patient_search, key="vertebral_patient_select")
         
-        if filtered_patients_df.empty:
-            st.warning("⚠️ 検索条件に一致する患者が見つかりません。")
+        if selected_patient is None:
+            if patient_search:
+                st.warning("⚠️ 検索条件に一致する患者が見つかりません。")
+            else:
+                st.warning("⚠️ 患者が登録されていません。先に患者登録を行ってください。")
             return
         
-        # 患者選択ボックス
-        patient_options = [f"{row['name_kanji']} ({row['patient_code']}) - ID:{row['patient_id']}" 
-                          for idx, row in filtered_patients_df.iterrows()]
-        
-        selected_patient_display = st.selectbox(
-            f"患者を選択してください（{len(filtered_patients_df)}名表示）", 
-            patient_options, 
-            key="vertebral_patient_select"
-        )
-        
-        if selected_patient_display:
-            # 選択された患者のIDを取得
-            selected_idx = patient_options.index(selected_patient_display)
-            selected_patient = filtered_patients_df.iloc[selected_idx]
+        if selected_patient is not None:
             selected_patient_id = int(selected_patient['patient_id'])
             
             # 保険適用チェック表示
@@ -1509,6 +1496,24 @@ def show_previous_vertebral_measurements(patient_id):
                         st.info(f"💡 前回最低値: {analysis['lowest_vertebra']}椎体")
                     with col2:
                         st.info(f"📊 BMD範囲: {analysis['bmd_range']:.3f} g/cm²")
+                
+                # 全測定の椎体間差異（一括分析）
+                review = vertebral_db.get_vertebral_review(patient_id)
+                if len(review) > 1:
+                    with st.expander(f"📋 椎体別の経過（{len(review)}回）"):
+                        risk_labels = {'high': '🔴 骨粗鬆症レベルあり', 'moderate': '🟡 骨量減少あり',
+                                       'attention': '🟠 椎体間差大', 'low': '🟢 問題なし'}
+                        st.dataframe(pd.DataFrame({
+                            '測定日': review['measurement_date'],
+                            'L1': review['L1'].round(3),
+                            'L2': review['L2'].round(3),
+                            'L3': review['L3'].round(3),
+                            'L4': review['L4'].round(3),
+                            'BMD範囲': review['bmd_range'].round(3),
+                            '最低値椎体': review['lowest_vertebra'],
+                            '最低YAM(%)': review['yam_min'],
+                            '評価': review['risk_tier'].map(risk_labels)
+                        }), use_container_width=True)
             else:
                 # 従来の腰椎BMDを表示
                 st.subheader("📈 前回の測定結果（腰椎平均値）")
@@ -1562,25 +1567,17 @@ def save_vertebral_measurement_data(patient_id, measurement_date, vertebral_bmds
             'notes': notes
         }
         
-        # メイン測定データを保存
-        measurement_id = db.add_measurement(measurement_data)
+        # メイン測定データ・椎体別データ・継続受診予定を1トランザクションで保存
+        vertebral_data_for_db = vertebral_results['vertebral_data'] if vertebral_results else None
+        measurement_id = db.save_measurement(measurement_data, vertebral_data_for_db)
         
-        if measurement_id and vertebral_results:
-            # 椎体別データを保存
-            vertebral_db = VertebralMeasurementDB()
-            vertebral_data_for_db = vertebral_results['vertebral_data']
-            
-            success = vertebral_db.add_vertebral_measurements(measurement_id, vertebral_data_for_db)
-            
-            if success:
-                st.success("✅ 椎体別測定データが正常に保存されました！")
-                st.info("🔄 前回データを更新するため、ページを再読み込みします...")
-                time.sleep(1)
-                st.rerun()
-            else:
-                st.error("❌ 椎体別データの保存に失敗しました。")
+        if measurement_id:
+            st.success("✅ 椎体別測定データが正常に保存されました！")
+            st.info("🔄 前回データを更新するため、ページを再読み込みします...")
+            time.sleep(1)
+            st.rerun()
         else:
-            st.error("❌ メイン測定データの保存に失敗しました。")
+            st.error("❌ 測定データの保存に失敗しました。")
             
     except Exception as e:
         st.error(f"保存エラー: {e}")
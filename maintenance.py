@@ -0,0 +1,174 @@
+# maintenance.py
+# 夜間メンテナンス・事前集計ジョブのコマンドライン実行
+#
+# 使い方:
+#   python maintenance.py nightly              # 経過日数更新・集計更新・最適化・バックアップ
+#   python maintenance.py roll-overdue         # 予定の経過日数・緊急度を更新
+#   python maintenance.py refresh-summaries    # 患者別測定サマリー・統計サマリー・測定経過・骨密度推移・患者検索キーを更新
+#   python maintenance.py optimize             # ANALYZE / PRAGMA optimize
+#   python maintenance.py backup --keep 14     # data/backups/ にバックアップ
+#   python maintenance.py recompute-metrics    # YAM・T-score・診断を再計算（中断後は続きから）
+
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.connection import PROJECT_ROOT
+from database.db_operations import BoneDensityDB
+from database.statistics_operations import StatisticsRollup
+from database.recompute_operations import MetricsRecompute
+from database.progression_operations import MeasurementProgression
+from database.trend_operations import BmdTrends
+
+BACKUP_DIR = os.path.join(PROJECT_ROOT, 'data', 'backups')
+
+
+def roll_overdue(db, args):
+    """予定の経過日数・緊急度を今日時点に更新"""
+    updated = db.roll_days_overdue()
+    if updated is None:
+        return False
+    print(f"経過日数更新: {updated}件")
+    return True
+
+
+def refresh_summaries(db, args):
+    """患者別測定サマリー・統計サマリー・測定経過・骨密度推移・患者検索キーを更新"""
+    patients = db.rebuild_measurement_summary()
+    if patients is None:
+        return False
+    print(f"患者別測定サマリー: {patients}名")
+
+    # アプリ外で登録・変更された患者の検索キーを反映
+    search_keys = db.sync_patient_search_index()
+    if search_keys is None:
+        return False
+    print(f"患者検索キー: {search_keys}名を更新")
+
+    result = StatisticsRollup(db.db_path).refresh(full=args.full)
+    if result is None:
+        return False
+    print(f"統計サマリー: {result['days']}日 / {result['months']}か月を集計"
+          f"（{'全期間' if result['full'] else '増分'}）")
+
+    progression = MeasurementProgression(db.db_path).refresh(full=args.full)
+    if progression is None:
+        return False
+    print(f"測定経過: {progression['patients']}名 / {progression['measurements']}件を更新")
+
+    trends = BmdTrends(db.db_path).refresh(full=args.full)
+    if trends is None:
+        return False
+    print(f"骨密度推移: {trends['patients']}名 / {trends['trends']}部位を再計算")
+    return True
+
+
+def optimize(db, args):
+    """統計情報を更新し、WALをデータベース本体に書き戻す"""
+    conn = db.get_connection()
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    if conn.in_transaction:
+        conn.commit()
+    db.manager.checkpoint('TRUNCATE')
+    print("ANALYZE / PRAGMA optimize 完了")
+    return True
+
+
+def backup(db, args):
+    """オンラインバックアップ（SQLite backup API）を取り、古いものを削除"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    name = os.path.splitext(os.path.basename(db.db_path))[0]
+    backup_path = os.path.join(BACKUP_DIR, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+
+    target = sqlite3.connect(backup_path)
+    try:
+        db.get_connection().backup(target)
+    finally:
+        target.close()
+    print(f"バックアップ作成: {backup_path}")
+
+    # 新しい順に keep 件を残す
+    backups = sorted(glob.glob(os.path.join(BACKUP_DIR, f"{name}_*.db")), reverse=True)
+    for old_path in backups[args.keep:]:
+        os.remove(old_path)
+        print(f"古いバックアップを削除: {old_path}")
+    return True
+
+
+def recompute_metrics(db, args):
+    """全測定・椎体別データのYAM・T-score・診断を現在の基準値で再計算"""
+    recompute = MetricsRecompute(db.db_path)
+    if not args.restart:
+        checkpoint = recompute.get_checkpoint()
+        if checkpoint and checkpoint['table'] != MetricsRecompute.DONE:
+            print(f"前回の続きから再開: {checkpoint['table']} ID>{checkpoint['last_id']}")
+
+    result = recompute.run(chunk_size=args.chunk_size, restart=args.restart)
+    if result is None:
+        return False
+    print(f"測定指標再計算: 測定{result['measurements']}件 / 椎体{result['vertebral_measurements']}件"
+          f"（更新{result['updated']}件、{result['rows_per_second']}行/秒）")
+    return True
+
+
+# nightly で順に実行するジョブ（指標の再計算は基準値変更時に個別に実行する）
+NIGHTLY_JOBS = [roll_overdue, refresh_summaries, optimize, backup]
+
+
+def nightly(db, args):
+    """夜間ジョブを順に実行（失敗したジョブがあっても残りは続行）"""
+    success = True
+    for job in NIGHTLY_JOBS:
+        success = run_job(job, db, args) and success
+    return success
+
+
+def run_job(job, db, args):
+    """ジョブを実行して所要時間を表示"""
+    started = time.perf_counter()
+    print(f"▶ {job.__name__}: {job.__doc__}")
+    try:
+        success = job(db, args)
+    except Exception as e:
+        print(f"❌ {job.__name__} エラー: {e}")
+        success = False
+    print(f"{'✅' if success else '❌'} {job.__name__} ({time.perf_counter() - started:.2f}秒)")
+    return success
+
+
+COMMANDS = {
+    'nightly': nightly,
+    'roll-overdue': roll_overdue,
+    'refresh-summaries': refresh_summaries,
+    'optimize': optimize,
+    'backup': backup,
+    'recompute-metrics': recompute_metrics,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="骨密度継続管理システム メンテナンスジョブ")
+    parser.add_argument('command', choices=COMMANDS, help="実行するジョブ")
+    parser.add_argument('--db', help="データベースファイル（省略時は data/bone_density.db）")
+    parser.add_argument('--full', action='store_true', help="refresh-summaries: 統計サマリー・測定経過・骨密度推移を全件で再集計")
+    parser.add_argument('--keep', type=int, default=14, help="backup: 残すバックアップの数（既定: 14）")
+    parser.add_argument('--restart', action='store_true', help="recompute-metrics: 前回の進捗を無視して最初から再計算")
+    parser.add_argument('--chunk-size', type=int, help="recompute-metrics: 1トランザクションの行数（既定: 5000）")
+    args = parser.parse_args(argv)
+
+    db = BoneDensityDB(args.db)
+    command = COMMANDS[args.command]
+    success = command(db, args) if command is nightly else run_job(command, db, args)
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# tests/test_calculations.py
+# 一括計算（calculate_metrics_batch / calculate_all_metrics_batch）と1件ずつの計算の一致確認
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.calculations import BoneDensityCalculator
+from utils.reference_values import DEFAULT_REFERENCE_VALUES, ReferenceValues, _freeze
+
+# 部位ごとに基準が異なる（大腿骨は20-29歳、それ以外は20-44歳）ことを確認できるよう部位を追加
+REFERENCE_VALUES = {
+    **DEFAULT_REFERENCE_VALUES,
+    'total_hip': {
+        'female': {'young': {'mean': 0.950, 'sd': 0.120}, 'adult': {'mean': 0.920, 'sd': 0.118}},
+        'male': {'young': {'mean': 1.050, 'sd': 0.140}, 'adult': {'mean': 1.010, 'sd': 0.137}},
+    },
+}
+
+
+class FixedRegistry:
+    """データベースを使わず固定の基準値を返すレジストリ"""
+
+    def __init__(self, values):
+        self.snapshot = ReferenceValues(_freeze(values), 1, 'test')
+
+    def current(self):
+        return self.snapshot
+
+
+@pytest.fixture
+def calc():
+    return BoneDensityCalculator(registry=FixedRegistry(REFERENCE_VALUES))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def _value(value):
+    """一括計算の値を1件ずつの計算と比較できる形に変換（NaN は None）"""
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def _expected_metrics(calc, bmd, site, gender):
+    """1件ずつの計算で求めた yam / tscore / diagnosis（計算対象外の行は None と測定不可）"""
+    gender_en = 'female' if gender in ('女性', 'female') else 'male'
+    if bmd is None or np.isnan(bmd) or bmd <= 0:
+        return {'yam': None, 'tscore': None, 'diagnosis': '測定不可'}
+    yam = calc.calculate_yam(bmd, site, gender_en)
+    return {
+        'yam': yam,
+        'tscore': calc.calculate_tscore(bmd, site, gender_en),
+        'diagnosis': calc.get_diagnosis(yam),
+    }
+
+
+def _assert_metrics_match(calc, batch, bmd, sites, genders):
+    for i in range(len(bmd)):
+        expected = _expected_metrics(calc, float(bmd[i]), sites[i], genders[i])
+        actual = {column: _value(batch[column].iat[i]) for column in expected}
+        assert actual == expected, f"行{i}: bmd={bmd[i]} site={sites[i]} gender={genders[i]}"
+
+
+def _random_bmd(rng, rows):
+    """欠損・0・負の値を含む骨密度の配列（.x5 付近の丸めも含むよう小数3桁）"""
+    bmd = np.round(rng.uniform(0.3, 1.5, rows), 3)
+    bmd[rng.random(rows) < 0.05] = np.nan
+    bmd[rng.random(rows) < 0.05] = 0
+    bmd[rng.random(rows) < 0.02] = -0.5
+    return bmd
+
+
+@pytest.mark.parametrize('site', ['femur_neck', 'lumbar', 'total_hip'])
+def test_metrics_batch_with_common_site(calc, rng, site):
+    rows = 5000
+    bmd = _random_bmd(rng, rows)
+    genders = rng.choice(['女性', '男性'], rows)
+
+    batch = calc.calculate_metrics_batch(bmd, site, genders)
+
+    assert list(batch.columns) == ['yam', 'tscore', 'diagnosis']
+    _assert_metrics_match(calc, batch, bmd, [site] * rows, genders)
+
+
+def test_metrics_batch_with_per_row_site_and_gender(calc, rng):
+    rows = 5000
+    bmd = _random_bmd(rng, rows)
+    sites = rng.choice(['femur_neck', 'lumbar', 'total_hip', 'radius'], rows)
+    genders = rng.choice(['女性', '男性', 'female', 'male'], rows)
+
+    batch = calc.calculate_metrics_batch(bmd, sites, genders)
+
+    _assert_metrics_match(calc, batch, bmd, sites, genders)
+
+
+def test_metrics_batch_with_common_gender(calc, rng):
+    rows = 1000
+    bmd = _random_bmd(rng, rows)
+
+    batch = calc.calculate_metrics_batch(bmd, 'lumbar', '女性')
+
+    _assert_metrics_match(calc, batch, bmd, ['lumbar'] * rows, ['女性'] * rows)
+
+
+def test_metrics_batch_unknown_site_is_not_measurable(calc):
+    batch = calc.calculate_metrics_batch(np.array([0.8, 1.0]), 'radius', ['女性', '男性'])
+
+    assert batch['yam'].isna().all()
+    assert batch['tscore'].isna().all()
+    assert list(batch['diagnosis']) == ['測定不可', '測定不可']
+    assert calc.calculate_yam(0.8, 'radius', 'female') is None
+
+
+def test_metrics_batch_keeps_series_index(calc):
+    bmd = pd.Series([0.9, None, 0.6, 1.1], index=[40, 10, 30, 20])
+    genders = pd.Series(['女性', '男性', '女性', '男性'], index=[40, 10, 30, 20])
+
+    batch = calc.calculate_metrics_batch(bmd, 'lumbar', genders)
+
+    assert list(batch.index) == [40, 10, 30, 20]
+    _assert_metrics_match(calc, batch, bmd.to_numpy(dtype=float), ['lumbar'] * 4, genders.to_numpy())
+
+
+def test_metrics_batch_aligns_series_by_index(calc):
+    bmd = pd.Series([0.9, 0.75, 0.6, 1.1], index=[40, 10, 30, 20])
+    sites = pd.Series(['femur_neck', 'lumbar', 'total_hip', 'radius'], index=[40, 10, 30, 20])
+    genders = pd.Series(['女性', '男性', '女性', '男性'], index=[40, 10, 30, 20])
+
+    expected = calc.calculate_metrics_batch(bmd, sites, genders)
+    # 性別・部位の並び順が骨密度と違っても、インデックスで対応させる
+    shuffled = calc.calculate_metrics_batch(bmd, sites.sort_index(), genders.sort_index())
+    pd.testing.assert_frame_equal(shuffled, expected)
+    _assert_metrics_match(calc, shuffled, bmd.to_numpy(), sites.to_numpy(), genders.to_numpy())
+
+    # 骨密度側を並べ替えると、結果も同じインデックスの行が並べ替わる
+    reordered = calc.calculate_metrics_batch(bmd.sort_index(), sites, genders)
+    pd.testing.assert_frame_equal(reordered.loc[expected.index], expected)
+
+
+def test_metrics_batch_accepts_string_bmd(calc):
+    batch = calc.calculate_metrics_batch(pd.Series(['0.85', '', 'abc']), 'femur_neck', '男性')
+
+    assert batch['yam'].iat[0] == calc.calculate_yam(0.85, 'femur_neck', 'male')
+    assert batch['yam'].iloc[1:].isna().all()
+    assert list(batch['diagnosis'].iloc[1:]) == ['測定不可', '測定不可']
+
+
+def test_all_metrics_batch_matches_calculate_all_metrics(calc, rng):
+    rows = 5000
+    femur = _random_bmd(rng, rows)
+    lumbar = _random_bmd(rng, rows)
+    genders = rng.choice(['女性', '男性'], rows)
+
+    batch = calc.calculate_all_metrics_batch(femur, lumbar, genders)
+
+    assert list(batch.columns) == ['femur_yam', 'femur_tscore', 'femur_diagnosis', 'lumbar_yam',
+                                   'lumbar_tscore', 'lumbar_diagnosis', 'overall_diagnosis']
+    for i in range(rows):
+        femur_bmd = None if np.isnan(femur[i]) else float(femur[i])
+        lumbar_bmd = None if np.isnan(lumbar[i]) else float(lumbar[i])
+        expected = calc.calculate_all_metrics(femur_bmd, lumbar_bmd, genders[i])
+        actual = {column: _value(batch[column].iat[i]) for column in batch.columns}
+        # calculate_all_metrics では計算対象外の部位のキーが無い
+        assert {k: v for k, v in actual.items() if v is not None} == expected, f"行{i}"
+
+
+def test_all_metrics_batch_keeps_series_index(calc):
+    index = ['a', 'b', 'c']
+    femur = pd.Series([0.6, None, 0.9], index=index)
+    lumbar = pd.Series([None, 0.7, 1.2], index=index)
+
+    batch = calc.calculate_all_metrics_batch(femur, lumbar, pd.Series(['女性'] * 3, index=index))
+
+    assert list(batch.index) == index
+    assert batch.loc['a', 'overall_diagnosis'] == calc.calculate_all_metrics(0.6, None, '女性')['overall_diagnosis']
+    assert pd.isna(batch.loc['a', 'lumbar_diagnosis'])
+    assert pd.isna(batch.loc['b', 'femur_yam'])
+    assert batch.loc['c', 'femur_tscore'] == calc.calculate_tscore(0.9, 'femur_neck', 'female')
+
+
+def test_all_metrics_batch_aligns_series_by_index(calc):
+    femur = pd.Series([0.6, 0.9, 0.7], index=[3, 1, 2])
+    lumbar = pd.Series([1.2, 0.8, None], index=[1, 2, 3])
+    genders = pd.Series(['男性', '女性', '女性'], index=[2, 3, 1])
+
+    batch = calc.calculate_all_metrics_batch(femur, lumbar, genders)
+
+    assert list(batch.index) == [3, 1, 2]
+    for patient in batch.index:
+        lumbar_bmd = None if pd.isna(lumbar[patient]) else lumbar[patient]
+        expected = calc.calculate_all_metrics(femur[patient], lumbar_bmd, genders[patient])
+        actual = {column: _value(batch.loc[patient, column]) for column in batch.columns}
+        assert {k: v for k, v in actual.items() if v is not None} == expected, f"行{patient}"
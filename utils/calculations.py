@@ -1,104 +1,40 @@
 # utils/calculations.py の修正版
 
-import sqlite3
 import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.reference_values import get_reference_registry
 
 class BoneDensityCalculator:
-    def __init__(self):
-        """骨密度計算クラスの初期化"""
-        self.reference_values = self._load_reference_values()
+    def __init__(self, registry=None):
+        """骨密度計算クラスの初期化
+
+        基準値はプロセス共通のレジストリから取得するため、インスタンスの
+        作成ごとにデータベースを読み込むことはない。
+        """
+        self.registry = registry or get_reference_registry()
+        self.snapshot = self.registry.current()
     
-    def _load_reference_values(self):
-        """データベースから年齢範囲対応の基準値を読み込み"""
-        try:
-            db_path = os.path.join('data', 'bone_density.db')
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # 新しいテーブル構造から読み込み
-            cursor.execute("""
-                SELECT site, female_mean_young, female_sd_young, female_mean_adult, female_sd_adult,
-                       male_mean_young, male_sd_young, male_mean_adult, male_sd_adult
-                FROM reference_values
-            """)
-            
-            reference_data = {}
-            for row in cursor.fetchall():
-                site, f_mean_y, f_sd_y, f_mean_a, f_sd_a, m_mean_y, m_sd_y, m_mean_a, m_sd_a = row
-                reference_data[site] = {
-                    'female': {
-                        'young': {'mean': f_mean_y, 'sd': f_sd_y},    # 20-29歳
-                        'adult': {'mean': f_mean_a, 'sd': f_sd_a}     # 20-44歳
-                    },
-                    'male': {
-                        'young': {'mean': m_mean_y, 'sd': m_sd_y},    # 20-29歳
-                        'adult': {'mean': m_mean_a, 'sd': m_sd_a}     # 20-44歳
-                    }
-                }
-            
-            conn.close()
-            return reference_data
-            
-        except Exception as e:
-            print(f"基準値読み込みエラー: {e}")
-            # エラー時は古い形式の基準値を読み込み
-            return self._load_old_reference_values()
+    @property
+    def reference_values(self):
+        """計算に使用中の基準値（読み取り専用）"""
+        return self.snapshot.values
     
-    def _load_old_reference_values(self):
-        """旧形式の基準値読み込み（フォールバック）"""
-        try:
-            db_path = os.path.join('data', 'bone_density.db')
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # 旧テーブル構造から読み込み
-            cursor.execute("SELECT site, female_mean, female_sd, male_mean, male_sd FROM reference_values_backup")
-            
-            reference_data = {}
-            for row in cursor.fetchall():
-                site, f_mean, f_sd, m_mean, m_sd = row
-                reference_data[site] = {
-                    'female': {
-                        'young': {'mean': f_mean, 'sd': f_sd},
-                        'adult': {'mean': f_mean, 'sd': f_sd}
-                    },
-                    'male': {
-                        'young': {'mean': m_mean, 'sd': m_sd},
-                        'adult': {'mean': m_mean, 'sd': m_sd}
-                    }
-                }
-            
-            conn.close()
-            return reference_data
-            
-        except Exception as e:
-            print(f"フォールバック基準値読み込みエラー: {e}")
-            return self._get_default_reference_values()
-    
-    def _get_default_reference_values(self):
-        """デフォルト基準値（最終フォールバック）"""
-        return {
-            'femur_neck': {
-                'female': {
-                    'young': {'mean': 0.864, 'sd': 0.12},    # 20-29歳基準
-                    'adult': {'mean': 0.864, 'sd': 0.12}     # 大腿骨は若い基準のみ
-                },
-                'male': {
-                    'young': {'mean': 1.028, 'sd': 0.146},
-                    'adult': {'mean': 1.028, 'sd': 0.146}
-                }
-            },
-            'lumbar': {
-                'female': {
-                    'young': {'mean': 1.120, 'sd': 0.134},   # 20-29歳基準（推定）
-                    'adult': {'mean': 1.056, 'sd': 0.134}    # 20-44歳基準
-                },
-                'male': {
-                    'young': {'mean': 1.200, 'sd': 0.155},
-                    'adult': {'mean': 1.140, 'sd': 0.155}
-                }
-            }
-        }
+    @property
+    def reference_version(self):
+        """計算に使用中の基準値のバージョン番号"""
+        return self.snapshot.version
+    
+    def refresh_reference_values(self):
+        """基準値が更新されていれば最新のスナップショットに切り替える"""
+        self.snapshot = self.registry.current()
+        return self.snapshot
     
     def calculate_yam(self, bmd_value, site, gender):
         """医学的に正しいYAM計算（年齢範囲対応）"""
@@ -185,6 +121,9 @@ class BoneDensityCalculator:
         """全指標の計算（修正版）"""
         results = {}
         
+        # 1回の計算の中では同じ基準値を使用
+        self.refresh_reference_values()
+        
         # 性別を英語に変換
         gender_en = 'female' if gender == '女性' else 'male'
         
@@ -204,3 +143,155 @@ class BoneDensityCalculator:
         results['overall_diagnosis'] = self._get_overall_diagnosis(results)
         
         return results
+    
+    # ===== 一括計算（NumPy） =====
+    
+    # 一括計算の診断ラベル（コードの大小が重症度の順、get_diagnosis と同じ判定）
+    DIAGNOSIS_LABELS = ["正常", "骨量減少", "骨粗鬆症", "測定不可"]
+    
+    def _reference_arrays(self, site, female):
+        """行ごとの基準平均・標準偏差の配列（基準値のない部位は NaN）"""
+        def reference(site_name, gender_en):
+            # 大腿骨: 20-29歳基準、腰椎・その他: 20-44歳基準（calculate_yam と同じ）
+            age_range = 'young' if site_name == 'femur_neck' else 'adult'
+            return self.reference_values[site_name][gender_en][age_range]
+        
+        # 全行共通の部位は性別で選ぶだけ
+        if np.ndim(site) == 0:
+            if site not in self.reference_values:
+                return np.full(female.shape, np.nan), np.full(female.shape, np.nan)
+            female_ref, male_ref = reference(site, 'female'), reference(site, 'male')
+            return (np.where(female, female_ref['mean'], male_ref['mean']),
+                    np.where(female, female_ref['sd'], male_ref['sd']))
+        
+        mean = np.full(female.shape, np.nan)
+        sd = np.full(female.shape, np.nan)
+        for site_name in self.reference_values:
+            on_site = site == site_name
+            for gender_en, is_gender in (('female', female), ('male', ~female)):
+                mask = on_site & is_gender
+                mean[mask] = reference(site_name, gender_en)['mean']
+                sd[mask] = reference(site_name, gender_en)['sd']
+        return mean, sd
+    
+    @staticmethod
+    def _round1(values):
+        """Python の round(x, 1) と同じ値に丸める
+        
+        np.round は10倍してから丸めるため .x5 付近で結果が変わることがある。
+        該当するごく一部の値だけ round で丸め直す。
+        """
+        rounded = np.round(values, 1)
+        scaled = values * 10
+        near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        if near_tie.any():
+            rounded[near_tie] = [round(value, 1) for value in values[near_tie].tolist()]
+        return rounded
+    
+    def _diagnosis_codes(self, yam):
+        """YAM値の配列から診断コード（DIAGNOSIS_LABELS の位置、NaN は測定不可）を作成"""
+        return np.select([np.isnan(yam), yam < 70, yam < 80], [3, 2, 1], default=0).astype(np.int8)
+    
+    def _diagnosis_column(self, codes):
+        """診断コードをカテゴリ型の列に変換（-1 は欠損）"""
+        return pd.Categorical.from_codes(codes, categories=self.DIAGNOSIS_LABELS)
+    
+    @staticmethod
+    def _align(values, index):
+        """Series をインデックスで index の順に揃える（Series 以外・同じ順ならそのまま）"""
+        if isinstance(values, pd.Series) and not values.index.equals(index):
+            return values.reindex(index)
+        return values
+    
+    def _batch_codes(self, bmd, site, gender):
+        """一括計算の本体（YAM・T-score・診断コードの配列）"""
+        if isinstance(bmd, pd.Series):
+            site, gender = self._align(site, bmd.index), self._align(gender, bmd.index)
+        bmd = pd.to_numeric(pd.Series(np.asarray(bmd)), errors='coerce').to_numpy(dtype=float)
+        gender = np.asarray(gender)
+        female = np.broadcast_to(np.isin(gender, ['女性', 'female']), bmd.shape)
+        if np.ndim(site) != 0:
+            site = np.asarray(site)
+        
+        mean, sd = self._reference_arrays(site, female)
+        valid = bmd > 0
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            yam = np.where(valid, self._round1(bmd / mean * 100), np.nan)
+            tscore = np.where(valid, self._round1((bmd - mean) / sd), np.nan)
+        
+        return yam, tscore, self._diagnosis_codes(yam)
+    
+    def calculate_metrics_batch(self, bmd, site, gender):
+        """YAM・T-score・診断を配列でまとめて計算
+        
+        Args:
+            bmd: 骨密度の配列・Series（欠損・0以下の値は計算対象外）
+            site: 部位（'femur_neck' / 'lumbar' など）の配列・Series、または全行共通の文字列
+            gender: 性別（'女性' / '男性'、または 'female' / 'male'）の配列・Series、または文字列
+            （bmd が Series なら、Series の site / gender はインデックスで対応させる）
+        
+        Returns:
+            yam, tscore, diagnosis（カテゴリ型）列のDataFrame
+            （bmd が Series ならそのインデックス）。
+            計算対象外の行は yam / tscore が NaN、diagnosis が '測定不可'。
+            各値は calculate_yam / calculate_tscore / get_diagnosis と一致する。
+        """
+        # 1回の計算の中では同じ基準値を使用
+        self.refresh_reference_values()
+        
+        yam, tscore, codes = self._batch_codes(bmd, site, gender)
+        return pd.DataFrame({
+            'yam': yam,
+            'tscore': tscore,
+            'diagnosis': self._diagnosis_column(codes)
+        }, index=bmd.index if isinstance(bmd, pd.Series) else None)
+    
+    def calculate_all_metrics_batch(self, femur_bmd, lumbar_bmd, gender):
+        """calculate_all_metrics の一括版（大腿骨・腰椎・総合診断）
+        
+        Returns:
+            femur_yam, femur_tscore, femur_diagnosis, lumbar_yam, lumbar_tscore,
+            lumbar_diagnosis, overall_diagnosis 列のDataFrame（診断はカテゴリ型）。
+            計算対象外の部位は YAM / T-score / 診断が欠損。
+            Series の引数はインデックスで femur_bmd に対応させる。
+        """
+        self.refresh_reference_values()
+        
+        if isinstance(femur_bmd, pd.Series):
+            lumbar_bmd = self._align(lumbar_bmd, femur_bmd.index)
+        
+        femur_yam, femur_tscore, femur_codes = self._batch_codes(femur_bmd, 'femur_neck', gender)
+        lumbar_yam, lumbar_tscore, lumbar_codes = self._batch_codes(lumbar_bmd, 'lumbar', gender)
+        
+        # 部位の診断は BMD が有効な行のみ（calculate_all_metrics ではキー自体が無い）
+        femur_codes = np.where(np.isnan(femur_yam), -1, femur_codes)
+        lumbar_codes = np.where(np.isnan(lumbar_yam), -1, lumbar_codes)
+        
+        # 最も重篤な診断を採用（_get_overall_diagnosis と同じ）、どちらも無ければ測定不可
+        overall_codes = np.maximum(femur_codes, lumbar_codes)
+        overall_codes[overall_codes < 0] = 3
+        
+        return pd.DataFrame({
+            'femur_yam': femur_yam,
+            'femur_tscore': femur_tscore,
+            'femur_diagnosis': self._diagnosis_column(femur_codes),
+            'lumbar_yam': lumbar_yam,
+            'lumbar_tscore': lumbar_tscore,
+            'lumbar_diagnosis': self._diagnosis_column(lumbar_codes),
+            'overall_diagnosis': self._diagnosis_column(overall_codes)
+        }, index=femur_bmd.index if isinstance(femur_bmd, pd.Series) else None)
+
+
+# テスト実行（一括計算の処理時間。結果の一致は tests/test_calculations.py で確認）
+if __name__ == "__main__":
+    import time
+    
+    calc = BoneDensityCalculator()
+    rows = 1_000_000
+    rng = np.random.default_rng(1)
+    femur, lumbar = rng.uniform(0.3, 1.3, rows), rng.uniform(0.3, 1.5, rows)
+    gender = rng.choice(['女性', '男性'], rows)
+    started = time.perf_counter()
+    calc.calculate_all_metrics_batch(femur, lumbar, gender)
+    print(f"一括計算: {rows}行 {time.perf_counter() - started:.3f}秒")
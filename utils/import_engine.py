@@ -7,13 +7,20 @@
 import sqlite3
 import os
 from datetime import datetime
+import sys
 from typing import Dict, List, Optional
 
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+
 class ImportEngine:
     """インポート実行エンジン"""
     
     def __init__(self):
-        self.db_path = os.path.join('data', 'bone_density.db')
+        self.manager = get_connection_manager()
+        self.db_path = self.manager.db_path
     
     def execute_import(self, data, mapping):
         """データインポート実行"""
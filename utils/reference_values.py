@@ -0,0 +1,168 @@
+# utils/reference_values.py
+# YAM・T-score計算用基準値のプロセス共通レジストリ
+
+import os
+import sys
+import threading
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import get_connection_manager
+
+# デフォルト基準値（最終フォールバック）
+DEFAULT_REFERENCE_VALUES = {
+    'femur_neck': {
+        'female': {
+            'young': {'mean': 0.864, 'sd': 0.12},    # 20-29歳基準
+            'adult': {'mean': 0.864, 'sd': 0.12}     # 大腿骨は若い基準のみ
+        },
+        'male': {
+            'young': {'mean': 1.028, 'sd': 0.146},
+            'adult': {'mean': 1.028, 'sd': 0.146}
+        }
+    },
+    'lumbar': {
+        'female': {
+            'young': {'mean': 1.120, 'sd': 0.134},   # 20-29歳基準（推定）
+            'adult': {'mean': 1.056, 'sd': 0.134}    # 20-44歳基準
+        },
+        'male': {
+            'young': {'mean': 1.200, 'sd': 0.155},
+            'adult': {'mean': 1.140, 'sd': 0.155}
+        }
+    }
+}
+
+
+class ReferenceValues(NamedTuple):
+    """読み込み済み基準値のスナップショット（変更不可）
+
+    values: {部位: {性別: {'young' / 'adult': {'mean', 'sd'}}}} の読み取り専用マッピング
+    version: reference_values_version のバージョン番号（未作成なら 0）
+    source: 読み込み元（'reference_values' / 'reference_values_backup' / 'default'）
+    """
+    values: Mapping
+    version: int
+    source: str
+
+
+def _freeze(value):
+    """入れ子の辞書を読み取り専用マッピングに変換"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    return value
+
+
+class ReferenceValueRegistry:
+    """データベースごとに1つ、プロセス全体で共有する基準値レジストリ
+
+    基準値は初回に1度だけ読み込み、以降はデータ世代番号が変わったときに
+    reference_values_version を確認して、バージョンが進んでいれば読み直す。
+    """
+
+    def __init__(self, db_path=None):
+        self.manager = get_connection_manager(db_path)
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_generation = None
+
+    def current(self):
+        """最新の基準値スナップショットを取得"""
+        generation = self.manager.generation()
+        snapshot = self._snapshot
+        if snapshot is not None and generation == self._checked_generation:
+            return snapshot
+
+        with self._lock:
+            version = self._read_version()
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._load(version)
+            self._checked_generation = generation
+            return self._snapshot
+
+    def _read_version(self):
+        """基準値のバージョン番号を取得"""
+        try:
+            row = self.manager.get_connection().execute(
+                "SELECT version FROM reference_values_version WHERE id = 1"
+            ).fetchone()
+            return row[0] if row else 0
+        except Exception as e:
+            print(f"基準値バージョン取得エラー: {e}")
+            return 0
+
+    def _load(self, version):
+        """データベースから年齢範囲対応の基準値を読み込み"""
+        try:
+            rows = self.manager.get_connection().execute("""
+                SELECT site, female_mean_young, female_sd_young, female_mean_adult, female_sd_adult,
+                       male_mean_young, male_sd_young, male_mean_adult, male_sd_adult
+                FROM reference_values
+            """).fetchall()
+
+            reference_data = {}
+            for row in rows:
+                site, f_mean_y, f_sd_y, f_mean_a, f_sd_a, m_mean_y, m_sd_y, m_mean_a, m_sd_a = row
+                reference_data[site] = {
+                    'female': {
+                        'young': {'mean': f_mean_y, 'sd': f_sd_y},    # 20-29歳
+                        'adult': {'mean': f_mean_a, 'sd': f_sd_a}     # 20-44歳
+                    },
+                    'male': {
+                        'young': {'mean': m_mean_y, 'sd': m_sd_y},    # 20-29歳
+                        'adult': {'mean': m_mean_a, 'sd': m_sd_a}     # 20-44歳
+                    }
+                }
+
+            return ReferenceValues(_freeze(reference_data), version, 'reference_values')
+
+        except Exception as e:
+            print(f"基準値読み込みエラー: {e}")
+            # エラー時は古い形式の基準値を読み込み
+            return self._load_old(version)
+
+    def _load_old(self, version):
+        """旧形式の基準値読み込み（フォールバック）"""
+        try:
+            rows = self.manager.get_connection().execute(
+                "SELECT site, female_mean, female_sd, male_mean, male_sd FROM reference_values_backup"
+            ).fetchall()
+
+            reference_data = {}
+            for row in rows:
+                site, f_mean, f_sd, m_mean, m_sd = row
+                reference_data[site] = {
+                    'female': {
+                        'young': {'mean': f_mean, 'sd': f_sd},
+                        'adult': {'mean': f_mean, 'sd': f_sd}
+                    },
+                    'male': {
+                        'young': {'mean': m_mean, 'sd': m_sd},
+                        'adult': {'mean': m_mean, 'sd': m_sd}
+                    }
+                }
+
+            return ReferenceValues(_freeze(reference_data), version, 'reference_values_backup')
+
+        except Exception as e:
+            print(f"フォールバック基準値読み込みエラー: {e}")
+            return ReferenceValues(_freeze(DEFAULT_REFERENCE_VALUES), version, 'default')
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_reference_registry(db_path=None):
+    """データベースファイルごとに共有される基準値レジストリを取得"""
+    manager = get_connection_manager(db_path)
+    with _registries_lock:
+        registry = _registries.get(manager.db_path)
+        if registry is None:
+            registry = ReferenceValueRegistry(manager.db_path)
+            _registries[manager.db_path] = registry
+        return registry
+
@@ -0,0 +1,23 @@
+# utils/search_keys.py
+# 患者検索用の正規化キー生成
+
+import unicodedata
+
+# カタカナ（ァ〜ヶ）をひらがなへ変換する対応表
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+
+
+def normalize_search_key(text) -> str:
+    """検索用の正規化キーを生成
+
+    - 全角英数字・記号を半角に、半角カナを全角に統一（NFKC）
+    - カタカナをひらがなに統一
+    - 英字を小文字に統一し、空白（全角スペース含む）を除去
+
+    例: 'ヨシイ　ハナコ' / 'よしい はなこ' / 'ﾖｼｲﾊﾅｺ' → 'よしいはなこ'
+    """
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(text))
+    text = text.translate(_KATAKANA_TO_HIRAGANA)
+    return ''.join(text.lower().split())
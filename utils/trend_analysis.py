@@ -0,0 +1,217 @@
+# utils/trend_analysis.py
+# 患者別の骨密度推移（最小二乗法の回帰直線）をコホート全体で一括計算
+
+import numpy as np
+import pandas as pd
+
+# 回帰する部位（配列上の部位番号 = この順番）
+TREND_SITES = ('lumbar', 'femur', 'L1', 'L2', 'L3', 'L4')
+
+# 部位別の測定精度（再現性のCV%）。最小有意変化 LSC = 2.77 × CV
+PRECISION_CV_PERCENT = {
+    'lumbar': 1.0,
+    'femur': 1.8,
+    'L1': 2.0, 'L2': 2.0, 'L3': 2.0, 'L4': 2.0,
+}
+LSC_FACTOR = 2.77
+
+# 傾向の区分（コード順）
+TREND_LABELS = ['改善', '安定', '悪化']
+
+DAYS_PER_YEAR = 365.25
+
+
+def lsc_percent(site):
+    """部位の最小有意変化（%）"""
+    return round(LSC_FACTOR * PRECISION_CV_PERCENT[site], 2)
+
+
+def _years(dates):
+    """日付（文字列可）を 1970-01-01 からの経過年数の配列に変換（不正な日付は NaN）"""
+    days = pd.to_datetime(pd.Series(dates), errors='coerce').to_numpy(dtype='datetime64[D]')
+    years = days.astype('int64').astype(float) / DAYS_PER_YEAR
+    years[np.isnat(days)] = np.nan
+    return years
+
+
+def fit_grouped_trends(group, years, bmd, n_groups):
+    """グループごとの回帰直線 bmd = a + b × 年 を一括で求める
+
+    グループ平均で中心化した偏差の積和を np.bincount で集計するため、
+    グループ数によらず配列演算の回数は一定。BMD が 0 以下・欠損の点は除外する。
+
+    Args:
+        group: 各点のグループ番号（0〜n_groups-1）
+        years: 各点の測定時点（年）
+        bmd: 各点のBMD
+
+    Returns:
+        グループ番号順の辞書（各値は長さ n_groups の配列）:
+        count, first_year, last_year, slope（g/cm²/年）, fitted_first, fitted_last,
+        residual_sd（3点以上のみ）
+    """
+    group = np.asarray(group, dtype=np.int64)
+    years = np.asarray(years, dtype=float)
+    bmd = np.asarray(bmd, dtype=float)
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(years) & np.isfinite(bmd) & (bmd > 0)
+    group, years, bmd = group[valid], years[valid], bmd[valid]
+
+    count = np.bincount(group, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_t = np.bincount(group, years, n_groups) / count
+        mean_y = np.bincount(group, bmd, n_groups) / count
+
+        dt = years - mean_t[group]
+        dy = bmd - mean_y[group]
+        sxx = np.bincount(group, dt * dt, n_groups)
+        sxy = np.bincount(group, dt * dy, n_groups)
+
+        # 同じ日の測定しかない（時間幅0）グループは傾きを求めない
+        fitted = (count >= 2) & (sxx > 0)
+        slope = np.where(fitted, sxy / np.where(fitted, sxx, 1), np.nan)
+
+        residual = dy - np.nan_to_num(slope)[group] * dt
+        sse = np.bincount(group, residual * residual, n_groups)
+        residual_sd = np.where(fitted & (count > 2), np.sqrt(sse / np.maximum(count - 2, 1)), np.nan)
+
+    first_year = np.full(n_groups, np.inf)
+    last_year = np.full(n_groups, -np.inf)
+    np.minimum.at(first_year, group, years)
+    np.maximum.at(last_year, group, years)
+    first_year[count == 0] = np.nan
+    last_year[count == 0] = np.nan
+
+    return {
+        'count': count,
+        'first_year': first_year,
+        'last_year': last_year,
+        'slope': slope,
+        'fitted_first': mean_y + slope * (first_year - mean_t),
+        'fitted_last': mean_y + slope * (last_year - mean_t),
+        'residual_sd': residual_sd,
+    }
+
+
+def compute_patient_trends(measurements: pd.DataFrame, vertebral: pd.DataFrame) -> pd.DataFrame:
+    """患者 × 部位（腰椎・大腿骨・L1〜L4）ごとの骨密度推移を一括計算
+
+    Args:
+        measurements: patient_id, measurement_date, femur_bmd, lumbar_bmd の各列
+        vertebral: patient_id, measurement_date, vertebra_level, bmd_value の各列
+
+    Returns:
+        1行1（患者, 部位）のDataFrame。patient_id, site, measurement_count,
+        first_date, last_date, span_years, slope_per_year, percent_per_year,
+        total_change_percent, residual_sd, lsc_percent, trend（改善 / 安定 / 悪化、
+        2時点未満は NaN）。BMD が1点も無い部位は含まない。
+    """
+    site_codes = {site: i for i, site in enumerate(TREND_SITES)}
+
+    # 縦持ち（患者, 部位番号, 測定日, BMD）に揃える
+    patient = np.concatenate([
+        measurements['patient_id'].to_numpy(dtype=np.int64),
+        measurements['patient_id'].to_numpy(dtype=np.int64),
+        vertebral['patient_id'].to_numpy(dtype=np.int64),
+    ])
+    site = np.concatenate([
+        np.full(len(measurements), site_codes['lumbar']),
+        np.full(len(measurements), site_codes['femur']),
+        vertebral['vertebra_level'].map(site_codes).fillna(-1).to_numpy(dtype=np.int64),
+    ])
+    dates = pd.concat([measurements['measurement_date'], measurements['measurement_date'],
+                       vertebral['measurement_date']], ignore_index=True)
+    bmd = np.concatenate([
+        pd.to_numeric(measurements['lumbar_bmd'], errors='coerce').to_numpy(dtype=float),
+        pd.to_numeric(measurements['femur_bmd'], errors='coerce').to_numpy(dtype=float),
+        pd.to_numeric(vertebral['bmd_value'], errors='coerce').to_numpy(dtype=float),
+    ])
+    with np.errstate(invalid='ignore'):
+        known = (site >= 0) & np.isfinite(bmd) & (bmd > 0)
+    patient, site, bmd = patient[known], site[known], bmd[known]
+    years = _years(dates[known])
+
+    keys, group = np.unique(patient * len(TREND_SITES) + site, return_inverse=True)
+    fit = fit_grouped_trends(group, years, bmd, len(keys))
+
+    sites = np.array(TREND_SITES, dtype=object)[keys % len(TREND_SITES)]
+    lsc = np.array([lsc_percent(name) for name in TREND_SITES])[keys % len(TREND_SITES)]
+    span = fit['last_year'] - fit['first_year']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percent_per_year = fit['slope'] / fit['fitted_first'] * 100
+        total_change = (fit['fitted_last'] - fit['fitted_first']) / fit['fitted_first'] * 100
+
+        # 回帰直線上の初回→最新の変化がLSCを超えたときだけ改善・悪化とする
+        trend = np.select(
+            [np.isnan(total_change), total_change > lsc, total_change < -lsc],
+            [-1, 0, 2], default=1
+        )
+
+    first_days = np.round(fit['first_year'] * DAYS_PER_YEAR)
+    last_days = np.round(fit['last_year'] * DAYS_PER_YEAR)
+    return pd.DataFrame({
+        'patient_id': keys // len(TREND_SITES),
+        'site': sites,
+        'measurement_count': fit['count'],
+        'first_date': pd.to_datetime(first_days, unit='D').strftime('%Y-%m-%d'),
+        'last_date': pd.to_datetime(last_days, unit='D').strftime('%Y-%m-%d'),
+        'span_years': np.round(span, 2),
+        'slope_per_year': np.round(fit['slope'], 4),
+        'percent_per_year': np.round(percent_per_year, 2),
+        'total_change_percent': np.round(total_change, 2),
+        'residual_sd': np.round(fit['residual_sd'], 4),
+        'lsc_percent': lsc,
+        'trend': pd.Categorical.from_codes(trend, categories=TREND_LABELS),
+    })
+
+
+def _check_against_polyfit(trends, measurements, vertebral):
+    """一括計算の結果を患者・部位ごとの np.polyfit と比較し、傾きが一致しない件数を返す"""
+    long = pd.concat([
+        measurements.assign(site='lumbar', bmd=measurements['lumbar_bmd']),
+        measurements.assign(site='femur', bmd=measurements['femur_bmd']),
+        vertebral.rename(columns={'vertebra_level': 'site', 'bmd_value': 'bmd'}),
+    ], ignore_index=True)[['patient_id', 'site', 'measurement_date', 'bmd']]
+    long = long[long['bmd'] > 0]
+
+    mismatches = 0
+    expected = {}
+    for (patient_id, site), rows in long.groupby(['patient_id', 'site']):
+        years = _years(rows['measurement_date'])
+        if len(rows) >= 2 and np.ptp(years) > 0:
+            expected[(patient_id, site)] = np.polyfit(years, rows['bmd'].to_numpy(dtype=float), 1)[0]
+    for row in trends.itertuples():
+        slope = expected.get((row.patient_id, row.site), np.nan)
+        if not (np.isnan(slope) and np.isnan(row.slope_per_year)) and not abs(slope - row.slope_per_year) < 1e-4:
+            mismatches += 1
+    return mismatches
+
+
+# テスト実行
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    patients = 20000
+    visits = rng.integers(1, 8, patients)
+    patient_ids = np.repeat(np.arange(1, patients + 1), visits)
+    visit_days = rng.integers(0, 3000, len(patient_ids))
+    measurements = pd.DataFrame({
+        'patient_id': patient_ids,
+        'measurement_date': (np.datetime64('2015-01-01') + visit_days).astype(str),
+        'femur_bmd': rng.normal(0.7, 0.1, len(patient_ids)),
+        'lumbar_bmd': rng.normal(0.9, 0.12, len(patient_ids)),
+    })
+    vertebral = measurements.sample(frac=0.3, random_state=0).merge(
+        pd.DataFrame({'vertebra_level': ['L1', 'L2', 'L3', 'L4']}), how='cross'
+    ).assign(bmd_value=lambda df: rng.normal(0.9, 0.15, len(df)))
+
+    started = time.perf_counter()
+    trends = compute_patient_trends(measurements, vertebral)
+    print(f"{len(measurements)}測定 / 椎体{len(vertebral)}件 → {len(trends)}推移 "
+          f"({time.perf_counter() - started:.3f}秒)")
+    print(trends['trend'].value_counts(dropna=False))
+
+    sample = measurements['patient_id'] <= 500
+    sample_vertebral = vertebral['patient_id'] <= 500
+    print(f"np.polyfit との不一致: {_check_against_polyfit(trends[trends['patient_id'] <= 500], measurements[sample], vertebral[sample_vertebral])}件")
@@ -0,0 +1,193 @@
+# utils/vertebral_analysis.py
+# 椎体間差異分析（L1〜L4 を N×4 配列にまとめて一括計算）
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+# 列の並び（配列の列番号 = この順番）
+VERTEBRA_LEVELS = ('L1', 'L2', 'L3', 'L4')
+
+# 椎体間の差が大きいとみなすしきい値
+YAM_SPREAD_THRESHOLD = 15.0    # YAM差（%）
+BMD_SPREAD_THRESHOLD = 0.1     # BMD差（g/cm²）
+
+# 椎体別リスクのYAMしきい値（get_diagnosis と同じ）
+HIGH_RISK_YAM = 70
+MODERATE_RISK_YAM = 80
+
+# 測定単位のリスク区分（重い順）
+RISK_TIERS = ['high', 'moderate', 'attention', 'low']
+
+
+def build_vertebral_matrix(records: pd.DataFrame, key: str = 'measurement_id',
+                           values=('bmd_value', 'yam_percentage', 'tscore')):
+    """縦持ちの椎体別データを測定ごとの N×4 配列に変換
+
+    Args:
+        records: key 列・vertebra_level 列・values の各列を持つDataFrame
+        key: 1行（1測定）にまとめる列
+
+    Returns:
+        (キーの配列, {値の列名: N×4 配列}) 。存在しない椎体は NaN。
+    """
+    keys, rows = np.unique(records[key].to_numpy(), return_inverse=True)
+    columns = records['vertebra_level'].map({level: i for i, level in enumerate(VERTEBRA_LEVELS)})
+    known = columns.notna().to_numpy()
+    rows, columns = rows[known], columns.to_numpy()[known].astype(int)
+
+    matrices = {}
+    for name in values:
+        matrix = np.full((len(keys), len(VERTEBRA_LEVELS)), np.nan)
+        matrix[rows, columns] = pd.to_numeric(records[name], errors='coerce').to_numpy(dtype=float)[known]
+        matrices[name] = matrix
+    return keys, matrices
+
+
+def _level_of(index, has_value):
+    """列番号の配列を椎体名に変換（値が無い行は None）"""
+    levels = np.array(VERTEBRA_LEVELS, dtype=object)[index]
+    levels[~has_value] = None
+    return levels
+
+
+def _stats(prefix, matrix, lowest_name=None, highest_name=None):
+    """1指標の最大・最小・範囲・平均と最低値（最高値）の椎体"""
+    has_value = ~np.isnan(matrix)
+    any_value = has_value.any(axis=1)
+    filled_low = np.where(has_value, matrix, np.inf)
+    filled_high = np.where(has_value, matrix, -np.inf)
+    count = has_value.sum(axis=1)
+
+    maximum = np.where(any_value, filled_high.max(axis=1), np.nan)
+    minimum = np.where(any_value, filled_low.min(axis=1), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(any_value, np.where(has_value, matrix, 0).sum(axis=1) / count, np.nan)
+
+    stats = {
+        f'{prefix}_max': maximum,
+        f'{prefix}_min': minimum,
+        f'{prefix}_range': maximum - minimum,
+        f'{prefix}_average': average,
+    }
+    # 同じ値の椎体が複数ある場合は上位（L1側）を採用
+    if lowest_name:
+        stats[lowest_name] = _level_of(filled_low.argmin(axis=1), any_value)
+    if highest_name:
+        stats[highest_name] = _level_of(filled_high.argmax(axis=1), any_value)
+    return stats
+
+
+def analyze_vertebral_matrix(bmd: np.ndarray, yam: Optional[np.ndarray] = None,
+                             tscore: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """N×4 配列（L1〜L4、欠損は NaN）の椎体間差異とリスク区分を一括計算
+
+    YAM は 0 以下を欠損として扱う。
+
+    Returns:
+        1行1測定のDataFrame。vertebra_count, bmd_*（max/min/range/average）,
+        lowest_vertebra, highest_vertebra, yam_*, lowest_yam_vertebra, tscore_*,
+        lowest_tscore_vertebra, high_risk_count, moderate_risk_count,
+        yam_spread_flag, bmd_spread_flag, risk_tier（high / moderate / attention / low）
+    """
+    bmd = np.asarray(bmd, dtype=float)
+    n = bmd.shape[0]
+    yam = np.full(bmd.shape, np.nan) if yam is None else np.asarray(yam, dtype=float)
+    tscore = np.full(bmd.shape, np.nan) if tscore is None else np.asarray(tscore, dtype=float)
+    yam = np.where(yam > 0, yam, np.nan)
+
+    result = {'vertebra_count': (~np.isnan(bmd)).sum(axis=1)}
+    result.update(_stats('bmd', bmd, 'lowest_vertebra', 'highest_vertebra'))
+    result.update(_stats('yam', yam, 'lowest_yam_vertebra'))
+    result.update(_stats('tscore', tscore, 'lowest_tscore_vertebra'))
+
+    # 椎体別リスク（NaN との比較は False）
+    with np.errstate(invalid='ignore'):
+        high_risk = yam < HIGH_RISK_YAM
+        moderate_risk = (yam >= HIGH_RISK_YAM) & (yam < MODERATE_RISK_YAM)
+        yam_spread = result['yam_range'] > YAM_SPREAD_THRESHOLD
+        bmd_spread = result['bmd_range'] > BMD_SPREAD_THRESHOLD
+    result['high_risk_count'] = high_risk.sum(axis=1)
+    result['moderate_risk_count'] = moderate_risk.sum(axis=1)
+    result['yam_spread_flag'] = yam_spread
+    result['bmd_spread_flag'] = bmd_spread
+
+    tier = np.select(
+        [result['high_risk_count'] > 0, result['moderate_risk_count'] > 0, yam_spread | bmd_spread],
+        [0, 1, 2], default=3
+    )
+    result['risk_tier'] = pd.Categorical.from_codes(tier, categories=RISK_TIERS)
+
+    return pd.DataFrame(result, index=pd.RangeIndex(n))
+
+
+def analysis_to_dict(analysis: pd.DataFrame, yam: np.ndarray, row: int = 0) -> Dict:
+    """一括分析の1行を、1測定分の分析結果（従来の辞書形式）に変換
+
+    椎体が2つ未満の測定は空の辞書を返す。
+
+    Args:
+        analysis: analyze_vertebral_matrix の結果
+        yam: analyze_vertebral_matrix に渡した YAM の N×4 配列（椎体別リスクの一覧に使用）
+    """
+    record = analysis.iloc[row]
+    if record['vertebra_count'] < 2:
+        return {}
+
+    result = {
+        'bmd_max': record['bmd_max'],
+        'bmd_min': record['bmd_min'],
+        'bmd_range': record['bmd_range'],
+        'bmd_average': record['bmd_average'],
+        'lowest_vertebra': record['lowest_vertebra'],
+        'highest_vertebra': record['highest_vertebra'],
+    }
+    for prefix, lowest_name in (('yam', 'lowest_yam_vertebra'), ('tscore', 'lowest_tscore_vertebra')):
+        if not pd.isna(record[f'{prefix}_min']):
+            result.update({
+                f'{prefix}_max': record[f'{prefix}_max'],
+                f'{prefix}_min': record[f'{prefix}_min'],
+                f'{prefix}_range': record[f'{prefix}_range'],
+                f'{prefix}_average': record[f'{prefix}_average'],
+                lowest_name: record[lowest_name],
+            })
+
+    # リスク評価
+    risk_assessment = {
+        'high_risk_vertebrae': [],
+        'moderate_risk_vertebrae': [],
+        'attention_points': []
+    }
+    for level, value in zip(VERTEBRA_LEVELS, np.asarray(yam, dtype=float)[row]):
+        if not value > 0:
+            continue
+        if value < HIGH_RISK_YAM:
+            risk_assessment['high_risk_vertebrae'].append(
+                {'vertebra': level, 'yam': value, 'reason': '骨粗鬆症レベル'})
+        elif value < MODERATE_RISK_YAM:
+            risk_assessment['moderate_risk_vertebrae'].append(
+                {'vertebra': level, 'yam': value, 'reason': '骨量減少'})
+
+    if record['yam_spread_flag']:
+        risk_assessment['attention_points'].append(f"椎体間のYAM差が大きい ({record['yam_range']:.1f}%)")
+    if record['bmd_spread_flag']:
+        risk_assessment['attention_points'].append(f"椎体間のBMD差が大きい ({record['bmd_range']:.3f} g/cm²)")
+    if result.get('lowest_yam_vertebra'):
+        risk_assessment['attention_points'].append(
+            f"{result['lowest_yam_vertebra']}椎体が最も脆弱 (YAM: {result['yam_min']:.1f}%)"
+        )
+
+    result['risk_tier'] = record['risk_tier']
+    result['risk_assessment'] = risk_assessment
+    return result
+
+
+def analyze_vertebral_records(vertebral_data) -> Dict:
+    """1測定分の椎体別データ（辞書のリスト）を分析"""
+    records = pd.DataFrame(list(vertebral_data), columns=['vertebra_level', 'bmd_value', 'yam_percentage', 'tscore'])
+    if records.empty:
+        return {}
+    records['measurement_id'] = 0
+    _, matrices = build_vertebral_matrix(records)
+    analysis = analyze_vertebral_matrix(matrices['bmd_value'], matrices['yam_percentage'], matrices['tscore'])
+    return analysis_to_dict(analysis, matrices['yam_percentage'])
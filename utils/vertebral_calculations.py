@@ -8,6 +8,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.calculations import BoneDensityCalculator
+from utils.vertebral_analysis import analyze_vertebral_records
 from typing import Dict, List, Optional
 
 class VertebralCalculator:
@@ -26,6 +27,9 @@ class VertebralCalculator:
             椎体別の計算結果辞書
         """
         try:
+            # 1回の計算の中では同じ基準値を使用
+            self.base_calculator.refresh_reference_values()
+            
             # 性別を英語に変換
             gender_en = 'female' if gender == '女性' else 'male'
             
@@ -83,112 +87,14 @@ class VertebralCalculator:
             return {}
     
     def _analyze_vertebral_differences(self, vertebral_data: List[Dict]) -> Dict:
-        """椎体間の差異分析"""
+        """椎体間の差異分析（リスク評価を含む、計算は utils.vertebral_analysis）"""
         try:
-            if len(vertebral_data) < 2:
-                return {}
-            
-            bmd_values = [v['bmd_value'] for v in vertebral_data]
-            yam_values = [v['yam_percentage'] for v in vertebral_data if v['yam_percentage']]
-            tscore_values = [v['tscore'] for v in vertebral_data if v['tscore']]
-            
-            analysis = {
-                # BMD分析
-                'bmd_max': max(bmd_values),
-                'bmd_min': min(bmd_values),
-                'bmd_range': max(bmd_values) - min(bmd_values),
-                'bmd_average': sum(bmd_values) / len(bmd_values),
-                
-                # 最低値・最高値の椎体
-                'lowest_vertebra': next((v['vertebra_level'] for v in vertebral_data 
-                                       if v['bmd_value'] == min(bmd_values)), None),
-                'highest_vertebra': next((v['vertebra_level'] for v in vertebral_data 
-                                        if v['bmd_value'] == max(bmd_values)), None),
-            }
-            
-            # YAM分析
-            if yam_values:
-                analysis.update({
-                    'yam_max': max(yam_values),
-                    'yam_min': min(yam_values),
-                    'yam_range': max(yam_values) - min(yam_values),
-                    'yam_average': sum(yam_values) / len(yam_values),
-                    'lowest_yam_vertebra': next((v['vertebra_level'] for v in vertebral_data 
-                                               if v['yam_percentage'] == min(yam_values)), None)
-                })
-            
-            # T-score分析
-            if tscore_values:
-                analysis.update({
-                    'tscore_max': max(tscore_values),
-                    'tscore_min': min(tscore_values),
-                    'tscore_range': max(tscore_values) - min(tscore_values),
-                    'tscore_average': sum(tscore_values) / len(tscore_values),
-                    'lowest_tscore_vertebra': next((v['vertebra_level'] for v in vertebral_data 
-                                                  if v['tscore'] == min(tscore_values)), None)
-                })
-            
-            # リスク評価
-            analysis['risk_assessment'] = self._assess_vertebral_risk(vertebral_data, analysis)
-            
-            return analysis
+            return analyze_vertebral_records(vertebral_data)
             
         except Exception as e:
             print(f"椎体間分析エラー: {e}")
             return {}
     
-    def _assess_vertebral_risk(self, vertebral_data: List[Dict], analysis: Dict) -> Dict:
-        """椎体別リスク評価"""
-        try:
-            risk_assessment = {
-                'high_risk_vertebrae': [],
-                'moderate_risk_vertebrae': [],
-                'attention_points': []
-            }
-            
-            # 各椎体のリスク評価
-            for vertebra in vertebral_data:
-                yam = vertebra.get('yam_percentage', 0)
-                vertebra_level = vertebra['vertebra_level']
-                
-                if yam < 70:
-                    risk_assessment['high_risk_vertebrae'].append({
-                        'vertebra': vertebra_level,
-                        'yam': yam,
-                        'reason': '骨粗鬆症レベル'
-                    })
-                elif yam < 80:
-                    risk_assessment['moderate_risk_vertebrae'].append({
-                        'vertebra': vertebra_level,
-                        'yam': yam,
-                        'reason': '骨量減少'
-                    })
-            
-            # 椎体間の差異チェック
-            if analysis.get('yam_range', 0) > 15:
-                risk_assessment['attention_points'].append(
-                    f"椎体間のYAM差が大きい ({analysis['yam_range']:.1f}%)"
-                )
-            
-            if analysis.get('bmd_range', 0) > 0.1:
-                risk_assessment['attention_points'].append(
-                    f"椎体間のBMD差が大きい ({analysis['bmd_range']:.3f} g/cm²)"
-                )
-            
-            # 最低値椎体の特定
-            if analysis.get('lowest_yam_vertebra'):
-                lowest_vertebra = analysis['lowest_yam_vertebra']
-                lowest_yam = analysis.get('yam_min', 0)
-                risk_assessment['attention_points'].append(
-                    f"{lowest_vertebra}椎体が最も脆弱 (YAM: {lowest_yam:.1f}%)"
-                )
-            
-            return risk_assessment
-            
-        except Exception as e:
-            print(f"リスク評価エラー: {e}")
-            return {}
-    
     def calculate_vertebral_progression(self, current_data: List[Dict], previous_data: List[Dict]) -> Dict:
         """椎体別経過比較"""
         try: